@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Bytes per second and CPU time per /vu/ws client for each wire format, with and without permessage-deflate.
+# Levels are simulated: a few channels with someone talking, the rest silent, like a typical room.
+#
+#   python3 bench/ws_formats.py --seconds 60
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mixerapi.wire import LevelEncoder, FORMATS
+
+INPUTS = ['Mic 1', 'Mic 2', 'Mic 3', 'Line', 'USB 1', 'USB 2']
+OUTPUTS = ['Room PA', 'Livestream', 'Headphones L', 'Headphones R', 'USB 1', 'USB 2']
+ACTIVE = {('input', 'Mic 1'), ('input', 'Line'), ('output', 'Room PA'), ('output', 'Livestream')}
+
+
+def frames(count: int, interval: float):
+    smooth = {}
+    for _ in range(count):
+        levels = {'input': {}, 'output': {}}
+        for direction, names in (('input', INPUTS), ('output', OUTPUTS)):
+            for name in names:
+                if (direction, name) not in ACTIVE:
+                    levels[direction][name] = {'peak': -60.0, 'rms': -60.0, 'smooth': -60.0}
+                    continue
+
+                rms = random.uniform(-35, -15)
+                key = (direction, name)
+                smooth[key] = smooth.get(key, rms) + (rms - smooth.get(key, rms)) * interval * 2
+                levels[direction][name] = {'peak': rms + random.uniform(3, 12), 'rms': rms, 'smooth': smooth[key]}
+        yield levels
+
+
+def deflater():
+    # permessage-deflate keeps its window between messages by default
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return lambda data: len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def measure(format: str, levels: list, shared: list, deflate: bool):
+    encoder = None if format == 'json' else LevelEncoder(INPUTS, OUTPUTS, format)
+    compress = deflater() if deflate else len
+
+    sent = 0
+    messages = 0
+    start = time.process_time()
+    for frame, text in zip(levels, shared):
+        # the hub encodes JSON once for everyone, for json the per client cost is only compression
+        payload = text if encoder is None else encoder.encode(frame)
+        if payload is None:
+            continue
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        sent += compress(payload)
+        messages += 1
+    cpu = time.process_time() - start
+    return sent, messages, cpu
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="/vu/ws bandwidth and CPU per client by format")
+    parser.add_argument("--seconds", "-s", type=int, default=60, help="Seconds of levels to simulate (defaults to 60)")
+    parser.add_argument("--interval", "-i", type=int, default=50, help="Milliseconds between level frames (defaults to 50)")
+    args = parser.parse_args()
+
+    count = args.seconds * 1000 // args.interval
+    levels = list(frames(count, args.interval / 1000))
+
+    shared = [json.dumps(frame, separators=(",", ":")) for frame in levels]
+
+    print(f"{'format':<10} {'deflate':<8} {'msgs/s':>8} {'bytes/s':>10} {'cpu us/s':>10}")
+    for format in FORMATS:
+        for deflate in (False, True):
+            sent, messages, cpu = measure(format, levels, shared, deflate)
+            print(f"{format:<10} {str(deflate):<8} {messages / args.seconds:>8.1f} {sent / args.seconds:>10.0f} "
+                  f"{cpu / args.seconds * 1e6:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import time
+from typing import Any, List
+
+import numpy as np
+
+# what the mixer reports for silence, see padinf()
+FLOOR = -60
+# seconds the EBU R128 momentary and short-term loudness are measured over
+MOMENTARY = 0.4
+SHORT_TERM = 3
+
+# defaults for the [analytics] section
+CLIP = -1
+SILENCE = -50
+SILENT_AFTER = 30
+PEAK_HOLD = 2
+
+
+class LevelAnalytics:
+    """Loudness, peak-hold, clipping and silence of every channel and bus, updated with every level frame.
+
+    Loudness is the mean power of the rms level over the momentary and short-term windows, without the
+    K-weighting a real R128 meter applies, which the mixer doesn't give us the samples for.
+    All meters are columns of the same arrays, so a frame costs a handful of NumPy operations however many there are.
+    """
+
+    def __init__(self, inputs: List[str], outputs: List[str], interval: float, clip=CLIP, silence=SILENCE,
+                 silent_after=SILENT_AFTER, peak_hold=PEAK_HOLD):
+        self.meters = [('input', name) for name in inputs] + [('output', name) for name in outputs]
+        self.clip = clip
+        self.silence = silence
+        self.silent_after = silent_after
+
+        meters = len(self.meters)
+        self.momentary_frames = max(1, round(MOMENTARY / interval))
+        self.short_frames = max(self.momentary_frames, round(SHORT_TERM / interval))
+
+        # rms as power, the last short_frames frames, with running sums over both windows
+        self.power = np.zeros((self.short_frames, meters))
+        self.momentary_sum = np.zeros(meters)
+        self.short_sum = np.zeros(meters)
+        self.pos = 0
+        self.frames = 0
+
+        self.peaks = np.full((max(1, round(peak_hold / interval)), meters), float(FLOOR))
+        self.peak_pos = 0
+
+        self.clips = np.zeros(meters, dtype=np.int64)
+        self.last_loud = np.full(meters, time.time())
+        self.time = time.time()
+
+    def add(self, levels: dict[str, Any]):
+        try:
+            frame = np.array([[levels[direction][name][meter] for meter in ('peak', 'rms')]
+                              for direction, name in self.meters], dtype=np.float64)
+        except KeyError:
+            # from before the mixer's channels changed
+            return
+
+        self.time = levels.get('time') or time.time()
+        peak, rms = frame[:, 0], frame[:, 1]
+
+        power = np.power(10, rms / 10)
+        self.short_sum += power - self.power[self.pos]
+        self.momentary_sum += power - self.power[(self.pos - self.momentary_frames) % self.short_frames]
+        self.power[self.pos] = power
+        self.pos = (self.pos + 1) % self.short_frames
+        self.frames += 1
+
+        if self.pos == 0:
+            # once per window, so rounding errors of the running sums don't add up
+            self.short_sum = self.power.sum(axis=0)
+            self.momentary_sum = self.power[-self.momentary_frames:].sum(axis=0)
+
+        self.peaks[self.peak_pos] = peak
+        self.peak_pos = (self.peak_pos + 1) % len(self.peaks)
+
+        # frames with a clipping peak, since this worker started
+        self.clips += peak >= self.clip
+        self.last_loud[rms > self.silence] = self.time
+
+    def alerts(self) -> bytes:
+        """Which channels and buses are clipping or silent, only meant to be compared to tell when that changes"""
+        clipping = self.peaks.max(axis=0) >= self.clip
+        silent = self.time - self.last_loud >= self.silent_after
+        return np.concatenate((clipping, silent)).tobytes()
+
+    def report(self) -> dict[str, Any]:
+        filled = max(1, self.frames)
+        momentary = 10 * np.log10(np.maximum(self.momentary_sum / min(filled, self.momentary_frames), 1e-12))
+        short_term = 10 * np.log10(np.maximum(self.short_sum / min(filled, self.short_frames), 1e-12))
+        peak_hold = self.peaks.max(axis=0)
+        silent_for = self.time - self.last_loud
+
+        columns = zip(np.maximum(momentary, FLOOR).tolist(), np.maximum(short_term, FLOOR).tolist(), peak_hold.tolist(),
+                      self.clips.tolist(), silent_for.tolist())
+
+        report: dict[str, Any] = {'time': self.time, 'input': {}, 'output': {}}
+        for (direction, name), (m, s, hold, clips, silent) in zip(self.meters, columns):
+            report[direction][name] = {
+                'momentary': round(m, 1),
+                'short_term': round(s, 1),
+                'peak_hold': round(hold, 1),
+                'clips': clips,
+                'clipping': hold >= self.clip,
+                'silent_for': round(silent, 1),
+                'silent': silent >= self.silent_after,
+            }
+        return report
+
+
+def from_config(config, inputs: List[str], outputs: List[str]) -> LevelAnalytics:
+    section = config.get('analytics', {})
+    return LevelAnalytics(
+        inputs, outputs, config['levels']['interval_web'] / 1000,
+        clip=section.get('clip', CLIP),
+        silence=section.get('silence', SILENCE),
+        silent_after=section.get('silent_after', SILENT_AFTER),
+        peak_hold=section.get('peak_hold', PEAK_HOLD),
+    )
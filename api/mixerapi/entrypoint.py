@@ -2,24 +2,31 @@
 
 import multiprocessing
 import os
+import sys
 
 import uvicorn
 import tomllib
 
 import logging
 
-from mixerapi.fosdemapi import define_webapp
 from mixerapi.config import get_config
-from mixerapi.helpers import StateEvent
 
-from . import levels, state
+from . import helpers, levels, shm, state
 
-def run_web(config, fastapi):
-    uvicorn.run(fastapi,
+def run_web(config):
+    # multiprocessing gave us a stdin that uvicorn can't hand on to its workers
+    sys.stdin = None
+
+    # every worker builds its own app and reads the pollers' shared memory, and the deltas the others publish, see shm.py
+    uvicorn.run('mixerapi.fosdemapi:define_webapp',
+            factory=True,
+            workers=config['host'].get('workers', 1),
             host=config['host']['listen'],
             port=config['host']['port'],
             proxy_headers=True,
             forwarded_allow_ips='*',
+            # level frames repeat a lot, compressing them pays off for remote dashboards
+            ws_per_message_deflate=config['host'].get('ws_deflate', True),
     )
 
 def main():
@@ -31,17 +38,12 @@ def main():
 
     log = logging.getLogger('CTRL')
 
-    manager = multiprocessing.Manager()
-
-    levels_web = StateEvent(manager.Event(), manager.dict())
-    state_web = StateEvent(manager.Event(), manager.dict())
-
-    fastapi = define_webapp(levels_web, state_web)
-
-    levels_processes = levels.start(config, levels_web)
-    state_processes = state.start(config, state_web)
+    levels_processes = levels.start(config)
+    state_processes = state.start(config)
 
-    web_process = multiprocessing.Process(target=run_web, args=(config, fastapi,))
+    # before the workers start, so no delta from the first requests is lost
+    deltas = shm.DeltaRing.create(helpers.shm_name(config, 'deltas'))
+    web_process = multiprocessing.Process(target=run_web, args=(config,))
 
     levels_processes[0].start()
     levels_processes[1].start()
@@ -61,6 +63,7 @@ def main():
     state_processes[0].join()
     state_processes[1].join()
     web_process.join()
+    deltas.close()
 
 
 if __name__ == "__main__":
@@ -2,28 +2,36 @@
 
 import os
 import sys
+import time
 import socket
 import asyncio
 import logging
 import re
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 
 import dataclasses
 
-from fosdemosc import OSCController, parse_bus, parse_channel, parse_level
-from fosdemosc import VUMeter
+from fosdemosc import AsyncOSCController, parse_bus, parse_channel, parse_level, parse_buses, parse_channels
+from fosdemosc import VUMeter, Dropped, ConnectionFailed, InvalidInput, TopologyChanged
+from fosdemosc import AsyncRampScheduler, PresetStore, parse_duration, recall_async
 
-from typing import List, Any
+from typing import List, Any, Literal
 from collections import defaultdict
 
 from mixerapi.config import get_config
 
-from . import helpers
+from . import analytics, helpers, shm
+from .analytics import LevelAnalytics
+from .history import LevelHistory
+from . import hub
+from .hub import BroadcastHub
+from .wire import LevelEncoder
 
 
-def define_webapp(levels, state):
+def define_webapp():
 
     config = get_config()
 
@@ -31,95 +39,297 @@ def define_webapp(levels, state):
 
     logger = logging.getLogger("mixerapi")
 
-    osc = helpers.connect_osc(config)
+    # connected in the web process once its event loop runs, a slow mixer then only holds up its own callers
+    osc: AsyncOSCController | None = None
+
+    # state no older than this is answered from the mirror, writes made here update it right away
+    max_age = config['state']['max_age'] / 1000 if 'max_age' in config['state'] else None
+
+    # every websocket client is fed from these, the pollers' frames are read once per worker.
+    # Changes made through a worker reach the others' clients through deltas.
+    state_hub = BroadcastHub('state')
+    deltas = shm.DeltaRing(helpers.shm_name(config, 'deltas'))
+    levels_hub = BroadcastHub('levels')
+
+    analytics_hub = BroadcastHub('analytics')
+
+    # fades started through this worker, a new one on a send takes over from the one running on it here only
+    ramps: AsyncRampScheduler | None = None
+    # snapshot files the presets are recalled from, besides the built-in ones
+    store = PresetStore(config.get('presets', {}).get('directory'))
+
+    # recent levels of every channel and bus, and what they tell about them,
+    # kept by every worker from the frames it passes on
+    history: LevelHistory | None = None
+    level_analytics: LevelAnalytics | None = None
+
+    def start_recording(inputs: List[str], outputs: List[str]):
+        nonlocal history, level_analytics
+        history = LevelHistory(inputs, outputs, config['levels']['interval_web'] / 1000,
+                               config['levels'].get('history', 600))
+        level_analytics = analytics.from_config(config, inputs, outputs)
+
+    async def record_levels():
+        queue = levels_hub.subscribe()
+        names = (list(osc.inputs), list(osc.outputs))
+        alerts = None
+        published = 0.0
+        while True:
+            frame = await queue.get()
+            # the pollers follow the mixer when it was renamed or rewired since the topology was cached,
+            # what was recorded under the old names is dropped
+            if (list(frame.data['input']), list(frame.data['output'])) != names:
+                names = (list(frame.data['input']), list(frame.data['output']))
+                logger.info(f"Levels now come for {', '.join(names[0])} and {', '.join(names[1])}")
+                start_recording(*names)
+                alerts = None
+
+            history.add(frame.data)
+            level_analytics.add(frame.data)
+
+            # right away when something starts or stops clipping or being silent, otherwise once a second
+            previous, alerts = alerts, level_analytics.alerts()
+            if alerts != previous or time.monotonic() - published >= 1:
+                analytics_hub.publish(level_analytics.report())
+                published = time.monotonic()
+
+    async def check_topology():
+        try:
+            if await osc.validate():
+                logger.warning(f"The mixer's channels or buses changed, now {osc.inputs} and {osc.outputs}")
+        except Exception as e:
+            # the first request checks it again
+            logger.warning(f"Could not check the mixer's channels and buses: {e}")
+
+    def publish(delta, stored=True):
+        """Pass a change made here on to the state websockets of every worker without asking the mixer"""
+        state_hub.publish_delta(delta, stored)
+        deltas.write(delta, stored)
+
+    def publish_gains(gains):
+        # every tick of a fade, gains aren't part of the state so only delta clients hear about them
+        delta = defaultdict(dict)
+        for (channel, bus), level in gains.items():
+            delta[osc.inputs[channel]][osc.outputs[bus]] = level
+        publish({'gains': dict(delta)}, stored=False)
+
+    @app.on_event("startup")
+    async def connect():
+        nonlocal osc, ramps
+        osc = await helpers.connect_async_osc(config, mirror=True)
+        logger.info(f"Connected to {osc.device}")
+        ramps = AsyncRampScheduler(osc, listener=publish_gains)
+        # names in requests are resolved against the cached topology until this checked it
+        asyncio.create_task(check_topology())
+
+        start_recording(osc.inputs, osc.outputs)
+        asyncio.create_task(record_levels())
+
+        asyncio.create_task(state_hub.run(shm.FrameReader(helpers.shm_name(config, 'state'))))
+        asyncio.create_task(state_hub.relay(deltas))
+        asyncio.create_task(levels_hub.run(shm.FrameReader(helpers.shm_name(config, 'levels'))))
+
+    @app.on_event("shutdown")
+    async def disconnect():
+        state_hub.stop()
+        levels_hub.stop()
+        analytics_hub.stop()
+        osc.close()
+
+    @app.exception_handler(asyncio.TimeoutError)
+    async def mixer_timeout(request: Request, exc: asyncio.TimeoutError):
+        return JSONResponse(status_code=504, content={'detail': 'The mixer did not answer in time'})
+
+    @app.exception_handler(ConnectionFailed)
+    async def mixer_away(request: Request, exc: ConnectionFailed):
+        return JSONResponse(status_code=504, content={'detail': str(exc)})
+
+    @app.exception_handler(Dropped)
+    async def mixer_dropped(request: Request, exc: Dropped):
+        return JSONResponse(status_code=503, content={'detail': str(exc)})
+
+    @app.exception_handler(InvalidInput)
+    async def invalid_input(request: Request, exc: InvalidInput):
+        # unknown, ambiguous or out of range channels and buses, groups where one is needed, malformed values
+        return JSONResponse(status_code=400, content={'detail': str(exc)})
+
+    @app.exception_handler(TopologyChanged)
+    async def topology_changed(request: Request, exc: TopologyChanged):
+        # nothing was written, the same request resolves the names against the new topology
+        return JSONResponse(status_code=409, content={'detail': str(exc)})
 
     @app.get("/")
     @app.get("/state")
     async def get_state():
-        return osc.get_state()
+        return await osc.get_state(max_age)
 
 
     @app.websocket("/state/ws")
-    async def state_ws(websocket: WebSocket):
+    async def state_ws(websocket: WebSocket, deltas: bool = False):
+        # with ?deltas=true, every message after the first is a part of the state to merge into what the client has
+        queue = state_hub.subscribe()
         try:
             await websocket.accept()
-            await websocket.send_json(osc.get_state())
+            if state_hub.snapshot_text is None:
+                state_hub.seed(await osc.get_state(max_age))
+            await websocket.send_text(state_hub.snapshot_text)
             while True:
-                await websocket.send_json(await asyncio.get_event_loop().run_in_executor(None, state.get_copy))
+                frame = await queue.get()
+                if frame.kind == 'delta' and not deltas:
+                    # the delta is already merged into the snapshot, if it's part of the state at all
+                    if frame.stored:
+                        await websocket.send_text(state_hub.snapshot_text)
+                else:
+                    await websocket.send_text(frame.text)
         except WebSocketDisconnect as e:
             return
+        finally:
+            state_hub.unsubscribe(queue)
 
     @app.websocket("/vu/ws")
-    async def vu_ws(websocket: WebSocket):
+    async def vu_ws(websocket: WebSocket, format: Literal['json', 'compact', 'int16', 'float32'] = 'json',
+                    deadband: float = 0.1, keyframe: int = 20):
+        # anything but json is encoded per client, see LevelEncoder for the formats
+        encoder = None
+        if format != 'json':
+            encoder = LevelEncoder(osc.inputs, osc.outputs, format, deadband, keyframe)
+
+        async def send(frame_text, frame_data):
+            if encoder is None:
+                await websocket.send_text(frame_text)
+                return
+
+            payload = encoder.encode(frame_data)
+            if isinstance(payload, bytes):
+                await websocket.send_bytes(payload)
+            elif payload is not None:
+                await websocket.send_text(payload)
+
+        queue = levels_hub.subscribe()
         try:
             await websocket.accept()
-            initial_levels = helpers.get_all_levels(osc)
-            if initial_levels:
-                await websocket.send_json(initial_levels)
+            if levels_hub.snapshot_text is None:
+                initial_levels = await helpers.get_all_levels_async(osc)
+                if initial_levels:
+                    levels_hub.seed(initial_levels)
+            if levels_hub.snapshot_text is not None:
+                await send(levels_hub.snapshot_text, levels_hub.snapshot)
             while True:
-                await websocket.send_json(await asyncio.get_event_loop().run_in_executor(None, levels.get_copy))
+                frame = await queue.get()
+                await send(frame.text, frame.data)
         except WebSocketDisconnect as e:
             return
+        finally:
+            levels_hub.unsubscribe(queue)
+
+    @app.get("/vu/history")
+    async def vu_history(ch: str | None = None, bus: str | None = None, from_: float = Query(-600, alias='from'),
+                         to: float | None = None, res: Literal['auto', 'raw', '1s', '10s', '1m'] = 'auto'):
+        # from and to are unix times, or seconds before now if not positive
+        if (ch is None) == (bus is None):
+            raise HTTPException(status_code=400, detail="Give either ch or bus")
+
+        now = time.time()
+        start = from_ if from_ > 0 else now + from_
+        end = now if to is None else to if to > 0 else now + to
+
+        if ch is not None:
+            return history.query('input', osc.inputs[parse_channel(osc, ch)], start, end, res)
+        return history.query('output', osc.outputs[parse_bus(osc, bus)], start, end, res)
+
+    @app.get("/vu/analytics")
+    async def vu_analytics() -> dict[str, Any]:
+        return level_analytics.report()
+
+    @app.websocket("/vu/analytics/ws")
+    async def vu_analytics_ws(websocket: WebSocket):
+        # the report once a second, and as soon as a channel or bus starts or stops clipping or being silent
+        queue = analytics_hub.subscribe()
+        try:
+            await websocket.accept()
+            await websocket.send_text(analytics_hub.snapshot_text or hub.encode(level_analytics.report()))
+            while True:
+                frame = await queue.get()
+                await websocket.send_text(frame.text)
+        except WebSocketDisconnect as e:
+            return
+        finally:
+            analytics_hub.unsubscribe(queue)
 
     @app.get("/vu/input")
     async def input_vu() -> dict[str, VUMeter]:
-        return osc.get_channel_vu_meters()
+        return await osc.get_channel_vu_meters()
 
     @app.get("/vu/output")
     async def output_vu() -> dict[str, VUMeter]:
-        return osc.get_bus_vu_meters()
+        return await osc.get_bus_vu_meters()
 
     @app.get("/matrix")
     async def get_matrix() -> List[List[float]]:
-        return osc.get_matrix()
+        return (await osc.get_mix_matrix(max_age)).gains.tolist()
+
+    @app.get("/matrix/mix")
+    async def get_mix_matrix() -> dict[str, Any]:
+        # gains and mutes with their axes, and what every send ends up at after its multipliers
+        matrix = await osc.get_mix_matrix(max_age)
+        effective = matrix.effective(await osc.get_channel_multipliers(max_age), await osc.get_bus_multipliers(max_age))
+        return {**matrix.to_dict(), 'effective': effective.tolist()}
 
     @app.get("/multipliers/input")
     async def input_multipliers() -> dict[str, float]:
-        return osc.get_channel_multipliers()
+        return await osc.get_channel_multipliers(max_age)
 
     @app.post("/multipliers/input/{channel}")
     @app.put("/multipliers/input/{channel}")
     @app.get("/multipliers/input/{channel}/{multiplier}")
     async def set_input_multiplier(channel: str, multiplier: float) -> None:
-        channel = parse_channel(osc, channel)
+        channels = parse_channels(osc, channel)
         multiplier = float(multiplier)
 
-        osc.set_channel_multiplier(channel, multiplier)
-        state.set(lambda x: helpers.merge(x, osc.get_state()))
+        async with osc.transaction(max_age=max_age):
+            for channel in channels:
+                await osc.set_channel_multiplier(channel, multiplier)
+        publish({'multipliers': {'input': {osc.inputs[channel]: multiplier for channel in channels}}})
 
     @app.get("/multipliers/output")
     async def output_multipliers() -> dict[str, float]:
-        return osc.get_bus_multipliers()
+        return await osc.get_bus_multipliers(max_age)
 
     @app.post("/multipliers/output/{bus}")
     @app.put("/multipliers/output/{bus}")
     @app.get("/multipliers/output/{bus}/{multiplier}")
     async def set_output_multiplier(bus: str, multiplier: float) -> None:
-        bus = parse_bus(osc, bus)
+        buses = parse_buses(osc, bus)
         multiplier = float(multiplier)
 
-        osc.set_bus_multiplier(bus, multiplier)
-        state.set(lambda x: helpers.merge(x, osc.get_state()))
+        async with osc.transaction(max_age=max_age):
+            for bus in buses:
+                await osc.set_bus_multiplier(bus, multiplier)
+        publish({'multipliers': {'output': {osc.outputs[bus]: multiplier for bus in buses}}})
 
     @app.get("/mutes")
     async def mutes():
-        return osc.get_mutes()
+        return await osc.get_mutes(max_age)
 
     @app.post("/muted/{channel}/{bus}")
     @app.put("/muted/{channel}/{bus}")
     @app.get("/muted/{channel}/{bus}/{mute}")
     async def set_mute(channel: str, bus: str, mute: str):
-        channel = parse_channel(osc, channel)
-        bus = parse_bus(osc, bus)
+        # channel and bus can be groups, all their sends change in one transaction
+        channels = parse_channels(osc, channel)
+        buses = parse_buses(osc, bus)
         muted = helpers.strtobool(mute)
 
-        osc.set_muted(channel, bus, muted)
-        state.set(lambda x: helpers.merge(x, osc.get_state()))
+        async with osc.transaction(max_age=max_age):
+            for channel in channels:
+                for bus in buses:
+                    await osc.set_muted(channel, bus, muted)
+        publish({'mutes': {osc.inputs[channel]: {osc.outputs[bus]: muted for bus in buses} for channel in channels}})
 
 
     @app.get("/multipliers")
     async def multipliers() -> dict[str, dict[str, float]]:
-        return {'input': osc.get_channel_multipliers(), 'output': osc.get_bus_multipliers() }
+        return {'input': await osc.get_channel_multipliers(max_age), 'output': await osc.get_bus_multipliers(max_age) }
 
     @app.get("/info")
     async def info() -> dict[str, Any]:
@@ -145,19 +355,63 @@ def define_webapp(levels, state):
     async def get_gain(channel: str, bus: str) -> float:
         channel = parse_channel(osc, channel)
         bus = parse_bus(osc, bus)
-        return osc.get_gain(channel, bus)
+        return await osc.get_gain(channel, bus)
 
 
     @app.post("/gain/{channel}/{bus}")
     @app.put("/gain/{channel}/{bus}")
     @app.get("/gain/{channel}/{bus}/{level}")
-    async def set_gain(channel: str, bus: str, level: str) -> None:
-        channel = parse_channel(osc, channel)
-        bus = parse_bus(osc, bus)
+    async def set_gain(channel: str, bus: str, level: str, fade: str = '0',
+                       curve: Literal['linear', 'smooth', 'equal-power'] = 'linear') -> None:
+        # fade is how long to take getting there, e.g. 2s or 500ms, the request returns once it started.
+        # channel and bus can be groups
+        cells = [(ch, b) for ch in parse_channels(osc, channel) for b in parse_buses(osc, bus)]
         level = parse_level(osc, level)
+        duration = parse_duration(fade)
 
-        osc.set_gain(channel, bus, level)
+        if duration > 0:
+            await ramps.fade({cell: level for cell in cells}, duration, curve, max_age=max_age)
+            return
 
-        state.set(lambda x: helpers.merge(x, osc.get_state()))
+        ramps.cancel(cells)
+        async with osc.transaction(max_age=max_age):
+            for channel, bus in cells:
+                await osc.set_gain(channel, bus, level)
+        publish_gains({cell: level for cell in cells})
+
+    @app.get("/presets")
+    async def get_presets() -> List[str]:
+        return store.names()
+
+    @app.post("/presets/{name}")
+    @app.put("/presets/{name}")
+    @app.get("/presets/{name}/recall")
+    async def recall_preset(name: str, fade: str = '0',
+                            curve: Literal['linear', 'smooth', 'equal-power'] = 'linear') -> dict[str, int]:
+        if name not in store:
+            raise HTTPException(status_code=404, detail=f"No preset {name}")
+
+        try:
+            # in the mixer's order, to publish what was recalled below
+            snapshot = store.get(name).aligned(osc.inputs, osc.outputs)
+            duration = parse_duration(fade)
+            changed = await recall_async(osc, snapshot, ramps, duration, curve)
+        except TopologyChanged:
+            raise
+        except ValueError as e:
+            # an unreadable snapshot, one for another mixer, or a malformed fade
+            raise HTTPException(status_code=400, detail=str(e))
+
+        matrix = snapshot.matrix
+        if duration <= 0:
+            publish_gains({(i, j): level for i, row in enumerate(matrix.gains.tolist()) for j, level in enumerate(row)})
+        if snapshot.mutes:
+            publish({'mutes': {ch: {bus: bool(matrix.muted[i, j]) for j, bus in enumerate(osc.outputs)}
+                               for i, ch in enumerate(osc.inputs)}})
+        for direction, names, multipliers in (('input', osc.inputs, snapshot.channel_multipliers),
+                                              ('output', osc.outputs, snapshot.bus_multipliers)):
+            if multipliers is not None:
+                publish({'multipliers': {direction: dict(zip(names, multipliers))}})
+        return {'changed': changed}
 
     return app
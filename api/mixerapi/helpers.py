@@ -1,21 +1,51 @@
 import multiprocessing
 
-from fosdemosc import OSCController, parse_bus, parse_channel, parse_level
-from fosdemosc import VUMeter
+from fosdemosc import OSCController, AsyncOSCController, parse_bus, parse_channel, parse_level
+from fosdemosc import VUMeter, InvalidInput
 
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 from asyncio import Event
 
 import dataclasses
 
-def connect_osc(config) -> OSCController:
+def mirror_options(config, mirror):
+    # the mirror is reconciled with the mixer every mirror_interval ms, see OSCController.get_state(max_age)
+    if mirror and config['state'].get('mirror_interval'):
+        return {'mirror': True, 'reconcile_interval': config['state']['mirror_interval'] / 1000}
+    return {}
+
+def name_options(config):
+    # [aliases.channels], [groups.buses] etc., see fosdemosc.names
+    return {'aliases': config.get('aliases'), 'groups': config.get('groups')}
+
+def cache_options(config):
+    # the channels and buses are known from the last run right away, /info is only asked with the first request
+    return {'cache_info': config['conn'].get('cache_info', True)}
+
+def connect_osc(config, mirror=False) -> OSCController:
+    options = {**mirror_options(config, mirror), **name_options(config), **cache_options(config)}
+
+    if 'device' in config['conn'] and config['conn']['device']:
+        osc = OSCController(config['conn']['device'], **options)
+    else:
+        osc = OSCController(config['conn']['host'], config['conn']['port'], mode='udp', **options)
+
+    return osc
+
+async def connect_async_osc(config, mirror=False) -> AsyncOSCController:
+    options = {**mirror_options(config, mirror), **name_options(config), **cache_options(config)}
+
     if 'device' in config['conn'] and config['conn']['device']:
-        osc = OSCController(config['conn']['device'])
+        osc = await AsyncOSCController.connect(config['conn']['device'], **options)
     else:
-        osc = OSCController(config['conn']['host'], config['conn']['port'], mode='udp')
+        osc = await AsyncOSCController.connect(config['conn']['host'], config['conn']['port'], mode='udp', **options)
 
     return osc
 
+def shm_name(config, kind):
+    # the pollers write levels and state to these, see shm.py
+    return f"{config['host'].get('shm_name', 'mixerapi')}-{kind}"
+
 def strtobool(val):
     """Convert a string representation of truth to true (1) or false (0).
     True values are 'y', 'yes', 't', 'true', 'on', and '1'; false values
@@ -28,26 +58,41 @@ def strtobool(val):
     elif val in ('n', 'no', 'f', 'false', 'off', '0'):
         return False
     else:
-        raise ValueError("invalid truth value %r" % (val,))
+        raise InvalidInput("invalid truth value %r" % (val,))
 
 def merge(old, new):
     for k in old.keys():
-        old[k].update(new[k])
+        if isinstance(old[k], dict):
+            old[k].update(new[k])
 
     old.update(new)
 
+def deep_update(old, new):
+    for k, v in new.items():
+        if isinstance(v, dict) and isinstance(old.get(k), dict):
+            deep_update(old[k], v)
+        else:
+            old[k] = v
+
 def dicted(x):
     return {k: dataclasses.asdict(v) for k, v in x.items()}
 
 def get_all_levels(osc: OSCController):
     try:
-        ch = osc.get_channel_vu_meters()
-        bus = osc.get_bus_vu_meters()
+        levels = osc.get_vu_meters()
 
-        return ({'input': dicted(ch), 'output': dicted(bus)})
+        return ({'input': dicted(levels['input']), 'output': dicted(levels['output'])})
     except:
         return None
 
+async def get_all_levels_async(osc: AsyncOSCController):
+    try:
+        levels = await osc.get_vu_meters()
+
+        return ({'input': dicted(levels['input']), 'output': dicted(levels['output'])})
+    except Exception:
+        return None
+
 
 class StateEvent:
     def __init__(self, event, data):
@@ -62,9 +107,11 @@ class StateEvent:
         self.event.set()
 
     def get(self, timeout=None):
-        self.event.wait()
+        if not self.event.wait(timeout):
+            return None
         self.event.clear()
         return self.data
 
     def get_copy(self, timeout=None):
-        return self.get(timeout).copy()
+        data = self.get(timeout)
+        return data.copy() if data is not None else None
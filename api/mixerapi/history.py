@@ -0,0 +1,157 @@
+import math
+import time
+import bisect
+from array import array
+from typing import Any, Iterator, List
+
+# what a level frame holds per channel or bus, in this order
+METERS = ('peak', 'rms', 'smooth')
+
+# seconds of raw level frames kept
+RAW_SECONDS = 600
+# resolution in seconds and how many of its buckets are kept: an hour, six hours and a day
+ROLLUPS = {'1s': (1, 3600), '10s': (10, 2160), '1m': (60, 1440)}
+# points a query returns at most when it picks the resolution itself
+MAX_POINTS = 1000
+
+
+class Ring:
+    """The last size rows of width floats each, with their timestamps, in flat arrays.
+
+    Indexing it gives the timestamps oldest first, so bisect can search it.
+    """
+
+    def __init__(self, size: int, width: int):
+        self.size = size
+        self.width = width
+        self.times = array('d', bytes(8 * size))
+        self.values = array('f', bytes(4 * size * width))
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def __getitem__(self, i: int) -> float:
+        return self.times[self.__index(i)]
+
+    def __index(self, i: int) -> int:
+        return (self.count - len(self) + i) % self.size
+
+    def append(self, t: float, values: List[float]):
+        i = self.count % self.size
+        self.times[i] = t
+        self.values[i * self.width:(i + 1) * self.width] = array('f', values)
+        self.count += 1
+
+    def rows(self, start: float, end: float) -> Iterator[tuple[float, array]]:
+        for i in range(bisect.bisect_left(self, start), bisect.bisect_left(self, end)):
+            j = self.__index(i)
+            yield self.times[j], self.values[j * self.width:(j + 1) * self.width]
+
+
+class Rollup:
+    """Min, max and mean of every value per resolution seconds, including the bucket still being filled"""
+
+    def __init__(self, resolution: float, size: int, width: int):
+        self.resolution = resolution
+        self.ring = Ring(size, width * 3)
+
+        self.bucket: float | None = None
+        self.min: List[float] = []
+        self.max: List[float] = []
+        self.sum: List[float] = []
+        self.n = 0
+
+    def add(self, t: float, values: List[float]):
+        bucket = math.floor(t / self.resolution) * self.resolution
+        if bucket != self.bucket:
+            if self.bucket is not None:
+                self.ring.append(self.bucket, self.__row())
+            self.bucket = bucket
+            self.min = list(values)
+            self.max = list(values)
+            self.sum = list(values)
+            self.n = 1
+            return
+
+        for i, value in enumerate(values):
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+        self.n += 1
+
+    def __row(self) -> List[float]:
+        return [x for i in range(len(self.sum)) for x in (self.min[i], self.max[i], self.sum[i] / self.n)]
+
+    def rows(self, start: float, end: float) -> Iterator[tuple[float, List[float] | array]]:
+        yield from self.ring.rows(start, end)
+        if self.bucket is not None and start <= self.bucket < end:
+            yield self.bucket, self.__row()
+
+
+class LevelHistory:
+    """Recent level frames of every channel and bus, raw and rolled up to 1 s, 10 s and 1 min"""
+
+    def __init__(self, inputs: List[str], outputs: List[str], interval: float, raw_seconds=RAW_SECONDS):
+        self.meters = [('input', name) for name in inputs] + [('output', name) for name in outputs]
+        width = len(self.meters) * len(METERS)
+
+        self.raw = Ring(math.ceil(raw_seconds / interval), width)
+        self.rollups = {name: Rollup(resolution, size, width) for name, (resolution, size) in ROLLUPS.items()}
+
+        # seconds per point and seconds kept, finest first
+        self.resolutions = {'raw': (interval, raw_seconds)}
+        self.resolutions.update({name: (resolution, resolution * size) for name, (resolution, size) in ROLLUPS.items()})
+
+    def add(self, levels: dict[str, Any]):
+        try:
+            values = [levels[direction][name][meter] for direction, name in self.meters for meter in METERS]
+        except KeyError:
+            # from before the mixer's channels changed
+            return
+
+        t = levels.get('time') or time.time()
+        self.raw.append(t, values)
+        for rollup in self.rollups.values():
+            rollup.add(t, values)
+
+    def pick(self, start: float, end: float) -> str:
+        """The finest resolution that still holds start and gives at most MAX_POINTS points"""
+        now = time.time()
+        for name, (resolution, kept) in self.resolutions.items():
+            if start >= now - kept and (end - start) / resolution <= MAX_POINTS:
+                return name
+        return name
+
+    def query(self, direction: str, name: str, start: float, end: float, res='auto') -> dict[str, Any]:
+        """Levels of one channel or bus between start and end, as columns.
+
+        raw:     {"time": [...], "peak": [...], "rms": [...], "smooth": [...]}
+        rollups: {"time": [...], "peak": {"min": [...], "max": [...], "mean": [...]}, ...}
+        """
+        if res == 'auto':
+            res = self.pick(start, end)
+
+        meter = self.meters.index((direction, name))
+        result: dict[str, Any] = {'res': res, 'time': []}
+
+        if res == 'raw':
+            base = meter * len(METERS)
+            columns = {m: [] for m in METERS}
+            for t, values in self.raw.rows(start, end):
+                result['time'].append(t)
+                for i, m in enumerate(METERS):
+                    columns[m].append(values[base + i])
+        else:
+            base = meter * len(METERS) * 3
+            columns = {m: {'min': [], 'max': [], 'mean': []} for m in METERS}
+            for t, values in self.rollups[res].rows(start, end):
+                result['time'].append(t)
+                for i, m in enumerate(METERS):
+                    for j, stat in enumerate(('min', 'max', 'mean')):
+                        columns[m][stat].append(values[base + i * 3 + j])
+
+        result.update(columns)
+        return result
@@ -0,0 +1,104 @@
+import json
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from typing import Any
+
+from . import helpers, shm
+
+logger = logging.getLogger("hub")
+
+# frames a client may fall behind before the oldest ones are dropped
+QUEUE_SIZE = 8
+# seconds between looks at the pollers' ring buffer, which only costs reading its head
+POLL_INTERVAL = 0.01
+
+
+def encode(data) -> str:
+    # the same encoding WebSocket.send_json() uses, done once for all clients
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+@dataclass
+class Frame:
+    # 'full' replaces the snapshot, 'delta' is merged into it
+    kind: str
+    text: str
+    # False for deltas about things the snapshot doesn't hold
+    stored: bool = True
+    # what text encodes, for clients that want it in another format
+    data: Any = None
+
+
+class BroadcastHub:
+    """Fans frames from one source out to every websocket client, each with a bounded queue that drops its oldest frame"""
+
+    def __init__(self, name: str, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.queue_size = queue_size
+        self.clients: set[asyncio.Queue] = set()
+
+        # latest full frame with every delta since merged into it, for clients that just connected
+        self.snapshot: dict[str, Any] | None = None
+        self.snapshot_text: str | None = None
+
+        self.frames = 0
+        self.dropped = 0
+        self.running = False
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.clients.discard(queue)
+
+    def __put(self, frame: Frame):
+        self.frames += 1
+        for queue in self.clients:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(frame)
+
+    def seed(self, data: dict[str, Any]):
+        """Use data as the snapshot until the source sends one, without sending it to anyone"""
+        if self.snapshot is None:
+            self.snapshot = data
+            self.snapshot_text = encode(data)
+
+    def publish(self, data: dict[str, Any]):
+        self.snapshot = data
+        self.snapshot_text = encode(data)
+        self.__put(Frame('full', self.snapshot_text, data=data))
+
+    def publish_delta(self, delta: dict[str, Any], stored=True):
+        """Pass on a partial state, merging it into the snapshot unless it isn't part of it"""
+        if stored and self.snapshot is not None:
+            helpers.deep_update(self.snapshot, delta)
+            self.snapshot_text = encode(self.snapshot)
+        self.__put(Frame('delta', encode(delta), stored, delta))
+
+    async def run(self, source: shm.FrameReader, interval=POLL_INTERVAL):
+        """Pass on the newest frame the pollers wrote to source, once, without locking or asking another process"""
+        self.running = True
+        while self.running:
+            data = source.read()
+            if data:
+                self.publish(data)
+            await asyncio.sleep(interval)
+        source.close()
+
+    async def relay(self, deltas: shm.DeltaRing, interval=POLL_INTERVAL):
+        """Pass on the deltas other workers published, so their changes reach this worker's clients too"""
+        self.running = True
+        while self.running:
+            for delta, stored in deltas.read():
+                self.publish_delta(delta, stored)
+            await asyncio.sleep(interval)
+        deltas.close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,171 @@
+import os
+import gzip
+import time
+import logging
+import tempfile
+import urllib.parse
+from typing import Any, List
+
+import requests
+
+logger = logging.getLogger("influx")
+
+# points sent in one request at most
+BATCH_SIZE = 5000
+# seconds a point may wait for its batch to fill up
+FLUSH_INTERVAL = 5
+# seconds a request may take before influx counts as away
+TIMEOUT = 5
+# seconds to wait after a failed request, doubled with every failure in a row
+BACKOFF_MIN = 1
+BACKOFF_MAX = 300
+# megabytes of gzipped batches kept on disk while influx is away, the oldest are dropped beyond this
+SPOOL_SIZE = 64
+# seconds the pushers wait for a frame before sending whatever is due anyway
+POLL_INTERVAL = 1
+
+
+class InfluxWriter:
+    """Batches line protocol points for one influx database, spooling them to disk while it can't be reached.
+
+    Batches go out gzipped over one kept-alive connection. When a request fails, that batch and every one after it
+    goes to the spool, until the backoff has passed and the spool is replayed, oldest first.
+    """
+
+    def __init__(self, host: str, db: str, spool_dir: str, spool_size=SPOOL_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, timeout=TIMEOUT):
+        self.url = urllib.parse.urlunsplit(('http', host, '/write', f'db={db}&precision=ms', ''))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Encoding': 'gzip', 'Content-Type': 'text/plain; charset=utf-8'})
+
+        self.batch: List[str] = []
+        self.batch_since = 0.0
+
+        self.backoff = 0
+        self.retry_at = 0.0
+
+        self.spool_dir = spool_dir
+        self.spool_size = spool_size * 1024 * 1024
+        os.makedirs(spool_dir, exist_ok=True)
+        for name in os.listdir(spool_dir):
+            if name.endswith('.tmp'):
+                # a batch we didn't finish spooling
+                os.remove(os.path.join(spool_dir, name))
+        self.spooled = sorted(name for name in os.listdir(spool_dir) if name.endswith('.lp.gz'))
+        self.spool_bytes = sum(os.path.getsize(os.path.join(spool_dir, name)) for name in self.spooled)
+        self.next_spool = int(self.spooled[-1].split('.')[0]) + 1 if self.spooled else 0
+
+        if self.spooled:
+            logger.info(f"{len(self.spooled)} batches spooled in {spool_dir}, sending them first")
+
+    def write(self, lines: List[str]):
+        if not self.batch:
+            self.batch_since = time.monotonic()
+        self.batch.extend(lines)
+        self.poll()
+
+    def poll(self):
+        """Send what is due: the spool once the backoff has passed, then the batch once it is full or old enough"""
+        now = time.monotonic()
+        if self.spooled and now >= self.retry_at:
+            self.__replay()
+
+        if self.batch and (len(self.batch) >= self.batch_size or now - self.batch_since >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        body = gzip.compress('\n'.join(self.batch).encode())
+        self.batch = []
+
+        # behind what is already waiting, so influx gets everything in order
+        if self.spooled or time.monotonic() < self.retry_at or not self.__post(body):
+            self.__spool(body)
+
+    def close(self):
+        self.flush()
+        self.session.close()
+
+    def __post(self, body: bytes) -> bool:
+        """Whether influx took body, or never will, so it shouldn't be sent again"""
+        try:
+            response = self.session.post(self.url, data=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.__failed(str(e))
+            return False
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.__failed(f"{response.status_code} {response.text.strip()}")
+            return False
+
+        if self.backoff:
+            logger.info("Writing to influx works again")
+        self.backoff = 0
+
+        if not response.ok:
+            # malformed points or a missing database, sending them again won't help
+            logger.error(f"Influx rejected a batch: {response.status_code} {response.text.strip()}")
+        return True
+
+    def __failed(self, reason: str):
+        self.backoff = min(max(self.backoff * 2, BACKOFF_MIN), BACKOFF_MAX)
+        self.retry_at = time.monotonic() + self.backoff
+        logger.warning(f"Writing to influx failed, trying again in {self.backoff} s: {reason}")
+
+    def __spool(self, body: bytes):
+        name = f"{self.next_spool:012d}.lp.gz"
+        path = os.path.join(self.spool_dir, name)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.error(f"Dropping a batch, can't spool it: {e}")
+            return
+
+        self.next_spool += 1
+        self.spooled.append(name)
+        self.spool_bytes += len(body)
+
+        while self.spool_bytes > self.spool_size and len(self.spooled) > 1:
+            logger.warning(f"Spool is full, dropping its oldest batch {self.spooled[0]}")
+            self.__unspool()
+
+    def __unspool(self):
+        path = os.path.join(self.spool_dir, self.spooled.pop(0))
+        self.spool_bytes -= os.path.getsize(path)
+        os.remove(path)
+
+    def __replay(self):
+        count = len(self.spooled)
+        while self.spooled:
+            with open(os.path.join(self.spool_dir, self.spooled[0]), 'rb') as f:
+                body = f.read()
+            if not self.__post(body):
+                return
+            self.__unspool()
+        logger.info(f"Sent {count} spooled batches")
+
+
+def from_config(section: dict[str, Any], name: str) -> InfluxWriter | None:
+    """The writer for a [levels] or [state] section, or None if it doesn't name an influx host and database"""
+    if not ('influx_host' in section and 'influx_db' in section):
+        return None
+
+    # systemd's StateDirectory= survives restarts, PrivateTmp doesn't
+    default_spool = os.path.join(os.environ.get('STATE_DIRECTORY', tempfile.gettempdir()), f'influx-{name}')
+
+    return InfluxWriter(
+        section['influx_host'],
+        section['influx_db'],
+        section.get('influx_spool', default_spool),
+        spool_size=section.get('influx_spool_size', SPOOL_SIZE),
+        batch_size=section.get('influx_batch_size', BATCH_SIZE),
+        flush_interval=section.get('influx_flush_interval', FLUSH_INTERVAL),
+    )
@@ -1,37 +1,108 @@
 from fosdemosc import OSCController
 
-import urllib.parse
-
-import requests
-
 import socket
 
 import math
-import itertools
 import dataclasses
 
 import multiprocessing
 import time
 
-from . import helpers
+from . import helpers, influx, shm
 
 import logging
 
 logger = logging.getLogger("levels")
 
-def start(config, web_state, manager = multiprocessing.Manager()):
+# seconds between logging the rate and jitter the poller achieved
+REPORT_INTERVAL = 60
+
+
+class Ticker:
+    """Ticks every period seconds on the monotonic clock, however long the work between them takes.
+
+    A tick that is late by less than a period still runs, ticks whose whole period has already passed are skipped
+    and counted, so a slow poll shifts neither later samples nor piles up a burst of them.
+    """
+
+    def __init__(self, period: float):
+        self.period = period
+        self.start = time.monotonic()
+        self.tick = 0
+        self.missed = 0
+
+    def wait(self) -> tuple[int, float]:
+        """Sleep until the next tick, returning its number and how many seconds late it started"""
+        self.tick += 1
+        late = time.monotonic() - (self.start + self.tick * self.period)
+        if late >= self.period:
+            skipped = int(late // self.period)
+            self.tick += skipped
+            self.missed += skipped
+
+        delay = self.start + self.tick * self.period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return self.tick, time.monotonic() - (self.start + self.tick * self.period)
+
+
+class PollStats:
+    """Achieved rate, jitter and poll time, logged every REPORT_INTERVAL seconds"""
+
+    def __init__(self, ticker: Ticker):
+        self.ticker = ticker
+        self.reset()
+
+    def reset(self):
+        self.since = time.monotonic()
+        self.missed_before = self.ticker.missed
+        self.polls = 0
+        self.failed = 0
+        self.late = []
+        self.durations = []
+
+    def polled(self, late: float, duration: float, ok: bool):
+        self.polls += 1
+        self.failed += not ok
+        self.late.append(late)
+        self.durations.append(duration)
+
+        if time.monotonic() - self.since >= REPORT_INTERVAL:
+            self.report()
+            self.reset()
+
+    def report(self):
+        elapsed = time.monotonic() - self.since
+        rate = self.polls / elapsed
+        target = 1 / self.ticker.period
+        missed = self.ticker.missed - self.missed_before
+
+        message = (f"Polled {rate:.1f}/s of {target:.1f}/s, "
+                   f"jitter avg {sum(self.late) / len(self.late) * 1000:.1f} ms max {max(self.late) * 1000:.1f} ms, "
+                   f"poll avg {sum(self.durations) / len(self.durations) * 1000:.1f} ms max {max(self.durations) * 1000:.1f} ms, "
+                   f"{missed} ticks missed, {self.failed} polls failed")
+
+        if missed or self.failed or rate < target * 0.95:
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+def start(config, manager = multiprocessing.Manager()):
     global influxdb_state
     influxdb_state = helpers.StateEvent(manager.Event(), manager.dict())
 
-    poller_process = multiprocessing.Process(target=poll_levels, args=(config, web_state, influxdb_state,))
+    poller_process = multiprocessing.Process(target=poll_levels, args=(config, influxdb_state,))
     influx_process = multiprocessing.Process(target=push_influxdb, args=(config, influxdb_state,))
 
     return (poller_process, influx_process)
 
-def poll_levels(config, web_state, influx_state):
+def poll_levels(config, influx_state):
     osc = helpers.connect_osc(config)
     logger.info(f"Connected to {osc.device}")
 
+    # read by every web worker, without asking us
+    web = shm.FrameWriter(helpers.shm_name(config, 'levels'), shm.LevelsLayout(osc.inputs, osc.outputs))
+
     int_web = config['levels']['interval_web']
     int_influxdb = config['levels']['interval_influx']
 
@@ -49,23 +120,31 @@ def poll_levels(config, web_state, influx_state):
 
     logger.info(f"Polling cycles: {poll_count}, each {poll_base} ms, web every {mult_web}, influxdb every {mult_influxdb}")
 
-    # like `while True`, but counts the cycle, and keeps it from overflowing
-    for i in itertools.cycle(range(poll_count)):
-        time.sleep(poll_base / 1000)
+    ticker = Ticker(poll_base / 1000)
+    stats = PollStats(ticker)
+
+    while True:
+        tick, late = ticker.wait()
+
+        started = time.time()
         levels = helpers.get_all_levels(osc)
+        duration = time.time() - started
 
+        stats.polled(late, duration, bool(levels))
         if not levels:
             logger.error('No levels from mixer')
             continue
 
-        if i % mult_web == 0:
+        # when the mixer most likely measured them, half way through the exchange
+        levels['time'] = started + duration / 2
+
+        if tick % mult_web == 0:
             logger.debug('polling web')
-            if web_state.is_set():
-                logger.debug('no web clients to update')
-            else:
-                web_state.set(lambda x: helpers.merge(x, levels))
+            # the cached topology we started with may have been corrected by the first poll
+            web.follow(osc.inputs, osc.outputs)
+            web.write(levels)
 
-        if i % mult_influxdb == 0:
+        if tick % mult_influxdb == 0:
             logger.debug('polling influxdb')
             if influx_state.is_set():
                 logger.warn('influxdb still waiting')
@@ -73,24 +152,23 @@ def poll_levels(config, web_state, influx_state):
                 influx_state.set(lambda x: helpers.merge(x, levels))
 
 def push_influxdb(config, influxdb_state):
-    if not ('influx_host' and 'influx_db') in config['levels']:
+    writer = influx.from_config(config['levels'], 'levels')
+    if writer is None:
         logger.info('no influx')
         return
 
-    host = config['levels']['influx_host']
-    db = config['levels']['influx_db']
-
-    url = urllib.parse.urlunsplit(('http', host, '/write', f'db={db}', ''))
-
     hostname = socket.gethostname()
 
     while True:
-        levels = influxdb_state.get()
+        levels = influxdb_state.get(influx.POLL_INTERVAL)
+        if levels is None:
+            writer.poll()
+            continue
+
+        timestamp = round(levels['time'] * 1000)
 
-        data = '\n'.join(
-                [f'input_levels,box={hostname},ch={ch} rms={vu["rms"]},peak={vu["peak"]},smooth={vu["smooth"]}' 
+        writer.write(
+                [f'input_levels,box={hostname},ch={ch} rms={vu["rms"]},peak={vu["peak"]},smooth={vu["smooth"]} {timestamp}'
                  for ch, vu in levels['input'].items()] +
-                [f'output_levels,box={hostname},bus={bus} rms={vu["rms"]},peak={vu["peak"]},smooth={vu["smooth"]}' 
+                [f'output_levels,box={hostname},bus={bus} rms={vu["rms"]},peak={vu["peak"]},smooth={vu["smooth"]} {timestamp}'
                  for bus, vu in levels['output'].items()])
-
-        requests.post(url, data=data.encode())
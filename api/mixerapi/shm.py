@@ -0,0 +1,366 @@
+import json
+import os
+import sys
+import fcntl
+import struct
+import logging
+from typing import Any, Iterator, List
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+logger = logging.getLogger("shm")
+
+MAGIC = b'MXRB'
+VERSION = 1
+
+# magic, version, closed flag, slot count, slot size, metadata length, head (generation of the newest frame)
+HEADER = struct.Struct('<4sHBxIIIxxxxQ')
+HEAD_OFFSET = HEADER.size - 8
+# names of channels and buses, as JSON
+META_SIZE = 4096
+# sequence number and payload length in front of every slot
+SLOT_HEADER = struct.Struct('<QI4x')
+SEQ = struct.Struct('<Q')
+
+SLOTS = 64
+# how often a reader retries a slot the writer is busy with
+READ_TRIES = 4
+# largest delta the web workers pass each other, a gain matrix of 32x32 named sends fits
+DELTA_SIZE = 32768
+
+
+class SharedRing:
+    """Ring buffer of frames in shared memory, for one writer and any number of readers in other processes.
+
+    Every slot has a seqlock: the writer makes its sequence number odd while it writes, and sets it to twice the
+    frame's generation once done. Readers copy the slot and check the number didn't change, so they never lock.
+    Several writers take turns with locked(), readers still don't lock.
+    """
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+
+        magic, version, _, self.slots, self.slot_size, meta_len, _ = HEADER.unpack_from(self.buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{shm.name} is not a level ring buffer")
+
+        self.meta = json.loads(bytes(self.buf[HEADER.size:HEADER.size + meta_len]))
+        self.stride = SLOT_HEADER.size + (self.slot_size + 7) // 8 * 8
+
+    @classmethod
+    def create(cls, name: str, slot_size: int, meta: dict[str, Any], slots=SLOTS) -> 'SharedRing':
+        stride = SLOT_HEADER.size + (slot_size + 7) // 8 * 8
+        size = HEADER.size + META_SIZE + slots * stride
+
+        # readers sharing our resource tracker leave the segment registered, see attach()
+        meta_bytes = json.dumps({**meta, 'tracker': tracker_id()}).encode()
+        if len(meta_bytes) > META_SIZE:
+            raise ValueError("Ring buffer metadata too large")
+
+        try:
+            shm = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a poller that didn't exit cleanly, tell its readers and start over
+            old = SharedMemory(name)
+            try:
+                cls(old, owner=True).close()
+            except ValueError:
+                old.close()
+                old.unlink()
+            shm = SharedMemory(name, create=True, size=size)
+
+        shm.buf[:size] = bytes(size)
+        shm.buf[HEADER.size:HEADER.size + len(meta_bytes)] = meta_bytes
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, 0, slots, slot_size, len(meta_bytes), 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedRing | None':
+        try:
+            if sys.version_info >= (3, 13):
+                return cls.__attach(SharedMemory(name, track=False))
+            shm = SharedMemory(name)
+        except FileNotFoundError:
+            return None
+
+        # before Python 3.13 attaching registers the segment too. A tracker of our own would unlink it when we exit,
+        # the one we share with the creator (every process of the API uses the entrypoint's) needs to keep it
+        ring = cls.__attach(shm)
+        if ring is None or ring.meta.get('tracker') != tracker_id():
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return ring
+
+    @classmethod
+    def __attach(cls, shm: SharedMemory) -> 'SharedRing | None':
+        try:
+            return cls(shm, owner=False)
+        except ValueError:
+            shm.close()
+            return None
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.buf[6])
+
+    @property
+    def head(self) -> int:
+        return SEQ.unpack_from(self.buf, HEAD_OFFSET)[0]
+
+    def __slot(self, generation: int) -> int:
+        return HEADER.size + META_SIZE + (generation - 1) % self.slots * self.stride
+
+    def write(self, payload: bytes):
+        if len(payload) > self.slot_size:
+            raise ValueError(f"Frame of {len(payload)} bytes doesn't fit in {self.slot_size}")
+
+        generation = self.head + 1
+        offset = self.__slot(generation)
+
+        SLOT_HEADER.pack_into(self.buf, offset, 2 * generation - 1, len(payload))
+        self.buf[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+        SEQ.pack_into(self.buf, offset, 2 * generation)
+        SEQ.pack_into(self.buf, HEAD_OFFSET, generation)
+
+    def locked(self) -> 'RingLock':
+        """Hold this while writing when other processes write to the ring too"""
+        return RingLock(self.shm)
+
+    def __read(self, generation: int) -> bytes | None:
+        offset = self.__slot(generation)
+        seq, length = SLOT_HEADER.unpack_from(self.buf, offset)
+        if seq != 2 * generation:
+            # being written, or overwritten already
+            return None
+
+        payload = bytes(self.buf[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length])
+        if SEQ.unpack_from(self.buf, offset)[0] != seq:
+            return None
+        return payload
+
+    def latest(self, after=0) -> tuple[int, bytes] | None:
+        """The newest frame and its generation, if it is newer than after"""
+        for _ in range(READ_TRIES):
+            generation = self.head
+            if generation <= after:
+                return None
+
+            payload = self.__read(generation)
+            if payload is not None:
+                return generation, payload
+            # the head has moved on
+        return None
+
+    def frames(self, after=0) -> Iterator[tuple[int, bytes]]:
+        """Every frame newer than after that is still in the ring, oldest first"""
+        head = self.head
+        for generation in range(max(after + 1, head - self.slots + 1), head + 1):
+            for _ in range(READ_TRIES):
+                payload = self.__read(generation)
+                if payload is not None:
+                    yield generation, payload
+                    break
+                if self.head - generation >= self.slots:
+                    # a reader that fell this far behind loses the frame
+                    break
+
+    def close(self):
+        buf, self.buf = self.buf, None
+        if self.owner:
+            buf[6] = 1
+        buf.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def tracker_id() -> int:
+    # the pipe to the resource tracker, the same one in every process sharing it
+    return os.fstat(resource_tracker.getfd()).st_ino
+
+
+class RingLock:
+    """flock() on the shared memory itself, so writers in unrelated processes (uvicorn's workers) need nothing else"""
+
+    def __init__(self, shm: SharedMemory):
+        self.fd = shm._fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+class LevelsLayout:
+    """When the levels were read as float64, then peak, rms and smooth of every channel and every bus as float32"""
+
+    def __init__(self, inputs: List[str], outputs: List[str]):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.meters = [('input', name) for name in inputs] + [('output', name) for name in outputs]
+        self.struct = struct.Struct(f"<d{len(self.meters) * 3}f")
+        self.size = self.struct.size
+        self.meta = {'kind': 'levels', 'inputs': inputs, 'outputs': outputs}
+
+    def pack(self, levels: dict[str, Any]) -> bytes:
+        return self.struct.pack(levels.get('time', 0.0), *(levels[direction][name][meter] for direction, name in self.meters
+                                                             for meter in ('peak', 'rms', 'smooth')))
+
+    def unpack(self, payload: bytes) -> dict[str, Any]:
+        acquired, *values = self.struct.unpack(payload)
+        levels = {'time': acquired, 'input': {}, 'output': {}}
+        for i, (direction, name) in enumerate(self.meters):
+            levels[direction][name] = {'peak': values[i * 3], 'rms': values[i * 3 + 1], 'smooth': values[i * 3 + 2]}
+        return levels
+
+
+class StateLayout:
+    """Mutes of every channel to bus as bytes, then channel and bus multipliers as float32"""
+
+    def __init__(self, inputs: List[str], outputs: List[str]):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.struct = struct.Struct(f"<{len(inputs) * len(outputs)}B{len(inputs) + len(outputs)}f")
+        self.size = self.struct.size
+        self.meta = {'kind': 'state', 'inputs': inputs, 'outputs': outputs}
+
+    def pack(self, state: dict[str, Any]) -> bytes:
+        mutes = [bool(state['mutes'][ch][bus]) for ch in self.inputs for bus in self.outputs]
+        multipliers = ([state['multipliers']['input'][ch] for ch in self.inputs] +
+                       [state['multipliers']['output'][bus] for bus in self.outputs])
+        return self.struct.pack(*mutes, *multipliers)
+
+    def unpack(self, payload: bytes) -> dict[str, Any]:
+        values = self.struct.unpack(payload)
+        mutes = iter(values[:len(self.inputs) * len(self.outputs)])
+        multipliers = iter(values[len(self.inputs) * len(self.outputs):])
+        return {
+            'mutes': {ch: {bus: bool(next(mutes)) for bus in self.outputs} for ch in self.inputs},
+            'multipliers': {
+                'input': {ch: next(multipliers) for ch in self.inputs},
+                'output': {bus: next(multipliers) for bus in self.outputs},
+            },
+        }
+
+
+LAYOUTS = {'levels': LevelsLayout, 'state': StateLayout}
+
+
+class FrameWriter:
+    """The poller's end: packs frames and writes them to the ring called name"""
+
+    def __init__(self, name: str, layout: LevelsLayout | StateLayout):
+        self.name = name
+        self.layout = layout
+        self.ring = SharedRing.create(name, layout.size, layout.meta)
+        logger.info(f"Publishing {layout.meta['kind']} to shared memory {name}")
+
+    def follow(self, inputs: List[str], outputs: List[str]):
+        """Start over with another layout once the mixer's channels or buses changed, readers reattach like after a restart"""
+        if inputs == self.layout.meta['inputs'] and outputs == self.layout.meta['outputs']:
+            return
+
+        logger.warning(f"The mixer's channels or buses changed, starting over with shared memory {self.name}")
+        self.ring.close()
+        self.layout = type(self.layout)(inputs, outputs)
+        self.ring = SharedRing.create(self.name, self.layout.size, self.layout.meta)
+
+    def write(self, data: dict[str, Any]):
+        self.ring.write(self.layout.pack(data))
+
+    def close(self):
+        self.ring.close()
+
+
+class FrameReader:
+    """A web worker's end: the newest frame from the ring called name, following it when the poller restarts"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ring: SharedRing | None = None
+        self.layout: LevelsLayout | StateLayout | None = None
+        self.generation = 0
+
+    def read(self) -> dict[str, Any] | None:
+        """The newest frame if there is one we haven't returned yet"""
+        if self.ring is not None and self.ring.closed:
+            self.ring.close()
+            self.ring = None
+
+        if self.ring is None:
+            self.ring = SharedRing.attach(self.name)
+            if self.ring is None:
+                return None
+            meta = self.ring.meta
+            self.layout = LAYOUTS[meta['kind']](meta['inputs'], meta['outputs'])
+            self.generation = 0
+
+        latest = self.ring.latest(self.generation)
+        if latest is None:
+            return None
+
+        self.generation, payload = latest
+        return self.layout.unpack(payload)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class DeltaRing:
+    """Deltas the web workers pass each other through the ring called name, which the entrypoint creates.
+
+    A worker publishes what it changed to its own clients and then here, every other worker reads it from here.
+    Without the ring (e.g. uvicorn started by hand with one worker) deltas stay in the worker.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ring: SharedRing | None = None
+        self.generation = 0
+
+    @staticmethod
+    def create(name: str) -> SharedRing:
+        return SharedRing.create(name, DELTA_SIZE, {'kind': 'deltas'})
+
+    def __attach(self) -> bool:
+        if self.ring is not None and self.ring.closed:
+            self.ring.close()
+            self.ring = None
+
+        if self.ring is None:
+            self.ring = SharedRing.attach(self.name)
+            if self.ring is None:
+                return False
+            # only what is published from now on, the snapshot already holds the rest
+            self.generation = self.ring.head
+        return True
+
+    def write(self, delta: dict[str, Any], stored: bool):
+        if not self.__attach():
+            return
+
+        payload = json.dumps({'pid': os.getpid(), 'stored': stored, 'delta': delta}).encode()
+        try:
+            with self.ring.locked():
+                self.ring.write(payload)
+        except ValueError as e:
+            logger.warning(f"Not passing a delta on to the other workers: {e}")
+
+    def read(self) -> Iterator[tuple[dict[str, Any], bool]]:
+        """Deltas the other workers published since the last call, and whether they are part of the state"""
+        if not self.__attach():
+            return
+
+        for self.generation, payload in self.ring.frames(self.generation):
+            frame = json.loads(payload)
+            if frame['pid'] != os.getpid():
+                yield frame['delta'], frame['stored']
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -1,7 +1,5 @@
 from fosdemosc import OSCController
 
-import urllib.parse
-import requests
 import time
 
 import multiprocessing
@@ -12,27 +10,28 @@ import math
 import itertools
 import dataclasses
 
-from . import helpers
+from . import helpers, influx, shm
 
 import logging
 
 logger = logging.getLogger("state")
 
-def start(config, web_state_real, manager = multiprocessing.Manager()):
-    global web_state
+def start(config, manager = multiprocessing.Manager()):
     global influxdb_state
     influxdb_state = helpers.StateEvent(manager.Event(), manager.dict())
-    web_state = web_state_real
 
-    poller_process = multiprocessing.Process(target=poll_state, args=(config, web_state, influxdb_state,))
+    poller_process = multiprocessing.Process(target=poll_state, args=(config, influxdb_state,))
     influx_process = multiprocessing.Process(target=push_influxdb, args=(config, influxdb_state,))
 
     return (poller_process, influx_process)
 
-def poll_state(config, web_state, influx_state):
+def poll_state(config, influx_state):
     osc = helpers.connect_osc(config)
     logger.info(f"Connected to {osc.device}")
 
+    # read by every web worker, without asking us
+    web = shm.FrameWriter(helpers.shm_name(config, 'state'), shm.StateLayout(osc.inputs, osc.outputs))
+
     int_web = config['state']['interval_web']
     int_influxdb = config['state']['interval_influx']
 
@@ -53,18 +52,20 @@ def poll_state(config, web_state, influx_state):
     # like `while True`, but counts the cycle, and keeps it from overflowing
     for i in itertools.cycle(range(poll_count)):
         time.sleep(poll_base / 1000)
+        started = time.time()
         state = osc.get_state()
 
         if not state:
             logger.error('No state from mixer')
             continue
 
+        state['time'] = started + (time.time() - started) / 2
+
         if i % mult_web == 0:
             logger.debug('polling web')
-            if web_state.is_set():
-                logger.debug('no web clients to update')
-            else:
-                web_state.set(lambda x: helpers.merge(x, state))
+            # the cached topology we started with may have been corrected by the first poll
+            web.follow(osc.inputs, osc.outputs)
+            web.write(state)
 
         if i % mult_influxdb == 0:
             logger.debug('polling influxdb')
@@ -75,27 +76,26 @@ def poll_state(config, web_state, influx_state):
 
 
 def push_influxdb(config, influxdb_state):
-    if not ('influx_host' and 'influx_db') in config['state']:
+    writer = influx.from_config(config['state'], 'state')
+    if writer is None:
         logger.info('no influx')
         return
 
-    host = config['state']['influx_host']
-    db = config['state']['influx_db']
-
-    url = urllib.parse.urlunsplit(('http', host, '/write', f'db={db}', ''))
-
     hostname = socket.gethostname()
 
     while True:
-        state = influxdb_state.get()
+        state = influxdb_state.get(influx.POLL_INTERVAL)
+        if state is None:
+            writer.poll()
+            continue
 
-        data = '\n'.join(
-                [f'input_multipliers,box={hostname},ch={ch} multiplier={mult}'
+        timestamp = round(state['time'] * 1000)
+
+        writer.write(
+                [f'input_multipliers,box={hostname},ch={ch} multiplier={mult} {timestamp}'
                  for ch, mult in state['multipliers']['input'].items()] +
-                [f'output_multipliers,box={hostname},bus={bus} multiplier={mult}'
+                [f'output_multipliers,box={hostname},bus={bus} multiplier={mult} {timestamp}'
                  for bus, mult in state['multipliers']['output'].items()] +
-                [f'mutes,box={hostname},ch={ch},bus={bus} muted={muted}'
+                [f'mutes,box={hostname},ch={ch},bus={bus} muted={muted} {timestamp}'
                  for ch, kvp in state['mutes'].items() for bus, muted in kvp.items()]
                 )
-
-        requests.post(url, data=data.encode())
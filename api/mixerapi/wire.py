@@ -0,0 +1,89 @@
+import json
+import struct
+from typing import Any, List
+
+# what a level frame holds per channel or bus, in this order
+METERS = ('peak', 'rms', 'smooth')
+# what the mixer reports for silence, see padinf()
+FLOOR = -60
+
+FORMATS = ('json', 'compact', 'int16', 'float32')
+
+# binary frames start with the frame type, a reserved byte and a sequence number
+KEYFRAME = 0
+DELTA = 1
+HEADER = struct.Struct('<BBH')
+
+
+class LevelEncoder:
+    """Turns level frames into compact keyframes and deltas for one websocket client.
+
+    Levels are quantized to tenths of a dB, channels first, then buses, in the order /info lists them.
+    A meter is only sent again once one of its values moved by at least `deadband` dB from what this client
+    last got, and every `keyframe_interval` frames the client gets everything.
+
+    compact: {"k": 1, "s": seq, "v": [[peak, rms, smooth], ...]} and {"s": seq, "d": [[index, peak, rms, smooth], ...]},
+             with values in tenths of a dB
+    int16:   header, then peak, rms, smooth of every meter as int16 tenths of a dB for keyframes,
+             or a uint16 count followed by uint16 index and 3 int16 per meter for deltas
+    float32: the same with float32 dB instead of int16
+    """
+
+    def __init__(self, inputs: List[str], outputs: List[str], format='compact', deadband=0.1, keyframe_interval=20):
+        if format not in FORMATS[1:]:
+            raise ValueError(f"Unknown format {format}")
+
+        self.meters = [('input', name) for name in inputs] + [('output', name) for name in outputs]
+        self.format = format
+        self.deadband = max(1, round(deadband * 10))
+        self.keyframe_interval = keyframe_interval
+
+        self.last: List[List[int]] | None = None
+        self.since_keyframe = 0
+        self.seq = 0
+
+        value = 'h' if format == 'int16' else 'f'
+        self.keyframe_struct = struct.Struct(f"<{len(self.meters) * len(METERS)}{value}")
+        self.delta_struct = struct.Struct(f"<H{len(METERS)}{value}")
+
+    def quantize(self, levels: dict[str, Any]) -> List[List[int]]:
+        values = []
+        for direction, name in self.meters:
+            vu = levels.get(direction, {}).get(name) or {}
+            values.append([round(max(vu.get(meter, FLOOR), FLOOR) * 10) for meter in METERS])
+        return values
+
+    def encode(self, levels: dict[str, Any]) -> str | bytes | None:
+        """The next frame for this client, or None if nothing moved past the dead-band"""
+        values = self.quantize(levels)
+
+        if self.last is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            self.last = values
+            self.since_keyframe = 0
+            return self.__frame(KEYFRAME, list(enumerate(values)))
+
+        self.since_keyframe += 1
+        changed = []
+        for i, (new, old) in enumerate(zip(values, self.last)):
+            if any(abs(a - b) >= self.deadband for a, b in zip(new, old)):
+                changed.append((i, new))
+                self.last[i] = new
+
+        if not changed:
+            return None
+        return self.__frame(DELTA, changed)
+
+    def __frame(self, kind: int, meters: List[tuple[int, List[int]]]) -> str | bytes:
+        self.seq = (self.seq + 1) % 65536
+
+        if self.format == 'compact':
+            if kind == KEYFRAME:
+                return json.dumps({'k': 1, 's': self.seq, 'v': [v for _, v in meters]}, separators=(",", ":"))
+            return json.dumps({'s': self.seq, 'd': [[i] + v for i, v in meters]}, separators=(",", ":"))
+
+        scale = 1 if self.format == 'int16' else 0.1
+        header = HEADER.pack(kind, 0, self.seq)
+        if kind == KEYFRAME:
+            return header + self.keyframe_struct.pack(*(x * scale for _, v in meters for x in v))
+        return header + struct.pack('<H', len(meters)) + b''.join(
+            self.delta_struct.pack(i, *(x * scale for x in v)) for i, v in meters)
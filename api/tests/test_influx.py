@@ -0,0 +1,126 @@
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from mixerapi.influx import InfluxWriter
+
+
+class FakeInflux(BaseHTTPRequestHandler):
+    # answers every write with server.status, keeping what it was sent
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InfluxWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeInflux)
+        self.server.requests = []
+        self.server.status = 204
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.spool = tempfile.TemporaryDirectory()
+        self.writer = self.new_writer()
+
+    def tearDown(self):
+        self.writer.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.spool.cleanup()
+
+    def new_writer(self):
+        return InfluxWriter(f'127.0.0.1:{self.server.server_port}', 'mixer', self.spool.name, batch_size=2)
+
+    def sent(self):
+        return [gzip.decompress(body).decode().split('\n') for _, _, body in self.server.requests]
+
+    def spooled(self):
+        return sorted(os.listdir(self.spool.name))
+
+    def test_gzipped_batches_in_ms(self):
+        self.writer.write(['levels,bus=0 rms=-20 1700000000000'])
+        self.assertEqual(self.server.requests, [])
+        self.writer.write(['levels,bus=1 rms=-30 1700000000000'])
+
+        path, headers, _ = self.server.requests[0]
+        url = urllib.parse.urlsplit(path)
+        self.assertEqual(url.path, '/write')
+        self.assertEqual(urllib.parse.parse_qs(url.query), {'db': ['mixer'], 'precision': ['ms']})
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.sent(), [['levels,bus=0 rms=-20 1700000000000', 'levels,bus=1 rms=-30 1700000000000']])
+
+    def test_flush_interval(self):
+        self.writer.write(['a 1'])
+        with mock.patch('time.monotonic', return_value=time.monotonic() + self.writer.flush_interval):
+            self.writer.poll()
+        self.assertEqual(self.sent(), [['a 1']])
+
+    def test_spooled_while_failing_then_replayed(self):
+        self.server.status = 503
+        with self.assertLogs('influx', 'WARNING'):
+            self.writer.write(['a 1', 'a 2'])
+        self.assertEqual(len(self.spooled()), 1)
+
+        # backing off, queued behind the spool without asking influx
+        self.writer.write(['a 3', 'a 4'])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(self.spooled()), 2)
+
+        self.server.status = 204
+        self.server.requests.clear()
+        self.writer.write(['a 5'])
+        self.assertEqual(self.server.requests, [])
+
+        # once the backoff has passed, oldest first, then what was batched since
+        with mock.patch('time.monotonic', return_value=time.monotonic() + self.writer.flush_interval):
+            self.writer.poll()
+        self.assertEqual(self.sent(), [['a 1', 'a 2'], ['a 3', 'a 4'], ['a 5']])
+        self.assertEqual(self.spooled(), [])
+
+    def test_spool_kept_over_restarts(self):
+        self.server.status = 503
+        with self.assertLogs('influx', 'WARNING'):
+            self.writer.write(['a 1', 'a 2'])
+        self.writer.session.close()
+
+        self.server.status = 204
+        self.server.requests.clear()
+        self.writer = self.new_writer()
+        self.assertEqual(len(self.writer.spooled), 1)
+        self.writer.poll()
+        self.assertEqual(self.sent(), [['a 1', 'a 2']])
+        self.assertEqual(self.spooled(), [])
+
+    def test_backoff_after_failed_replay(self):
+        self.server.status = 500
+        with self.assertLogs('influx', 'WARNING'):
+            self.writer.write(['a 1', 'a 2'])
+            later = time.monotonic() + self.writer.backoff
+            with mock.patch('time.monotonic', return_value=later):
+                self.writer.poll()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.writer.backoff, 2)
+        self.assertEqual(len(self.spooled()), 1)
+
+    def test_rejected_batches_dropped(self):
+        self.server.status = 400
+        with self.assertLogs('influx', 'ERROR'):
+            self.writer.write(['not line protocol', 'a 1'])
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(self.writer.backoff, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,12 @@ import os
 import socket
 import sys
 
+try:
+    import tomllib
+except ImportError:
+    # Python 3.10, no aliases and groups then
+    tomllib = None
+
 import click
 import tabulate
 from click_repl import repl, ExitReplException
@@ -11,9 +17,30 @@ from prompt_toolkit.output import ColorDepth
 from prompt_toolkit.shortcuts import CompleteStyle
 
 from fosdemosc import *
-from fosdemosc import presets
 
 osc: OSCController
+store: PresetStore
+# not "ramps", the star import above already brings in the fosdemosc.ramps module under that name
+fader: RampScheduler
+
+# snapshots saved with save-preset, and recalled with preset next to the built-in ones
+PRESETS_DIR = os.environ.get('MIXER_PRESETS', os.path.expanduser('~/.config/fosdem-mixer/presets'))
+# aliases and groups of channels and buses, e.g.
+#   [aliases.channels]
+#   host = 'IN 1'
+#   [groups.buses]
+#   headphones = ['Headphones L', 'Headphones R']
+NAMES_FILE = os.environ.get('MIXER_NAMES', os.path.expanduser('~/.config/fosdem-mixer/names.toml'))
+
+
+def load_names(path: str) -> dict:
+    if not os.path.isfile(path):
+        return {}
+    if tomllib is None:
+        click.echo(f'Ignoring {path}, reading it needs Python 3.11', err=True)
+        return {}
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
 
 
 class AliasedGroup(click.Group):
@@ -34,9 +61,13 @@ class AliasedGroup(click.Group):
         _, cmd, args = super().resolve_command(ctx, args)
         return cmd.name, cmd, args
 
-def preset_choices():
-    return [x for x in presets.keys()]
-
+    def invoke(self, ctx):
+        # the controller only connects with the first command that talks to the mixer, other errors are bugs
+        try:
+            return super().invoke(ctx)
+        except ConnectionFailed as e:
+            click.echo(f'Cannot connect to device: {e}', err=True)
+            sys.exit(e.errno or 1)
 
 @click.command(invoke_without_command=True, cls=AliasedGroup)
 @click.option('--udp/--serial', '-u/-s', default=True, help='Choose whether to use UDP or serial')
@@ -44,25 +75,42 @@ def preset_choices():
 @click.option('--port', '-p', type=int, default='10024', help='Port to use for UDP')
 @click.option('--device', '-d', type=click.File('wb'), default='/dev/tty_fosdem_audio_ctl',
               help='Override the serial port on which the mixer is attached')
+@click.option('--presets', type=click.Path(file_okay=False), default=PRESETS_DIR,
+              help='Directory with preset snapshots (defaults to $MIXER_PRESETS or ~/.config/fosdem-mixer/presets)')
+@click.option('--names', type=click.Path(dir_okay=False), default=NAMES_FILE,
+              help='TOML file with channel and bus aliases and groups (defaults to $MIXER_NAMES or ~/.config/fosdem-mixer/names.toml)')
 @click.pass_context
-def cli(ctx: click.Context, udp: bool, host: str, port: int, device: click.File):
+def cli(ctx: click.Context, udp: bool, host: str, port: int, device: click.File, presets: str, names: str):
     prompt_kwargs = {
         'message': 'mixer@%s> ' % socket.gethostname(),
         'color_depth': ColorDepth.MONOCHROME,
         'complete_style': CompleteStyle.READLINE_LIKE
     }
 
+    global store
+    if not 'store' in globals():
+        store = PresetStore(presets)
+
     try:
         global osc
         if not 'osc' in globals():
+            options = load_names(names)
+            options = {'aliases': options.get('aliases'), 'groups': options.get('groups')}
             if udp:
-                osc = OSCController(host, port, mode='udp')
+                osc = OSCController(host, port, mode='udp', **options)
             else:  # serial
-                osc = OSCController(device.name)
+                osc = OSCController(device.name, **options)
 
-    except OSError as e:
+    except ConnectionFailed as e:
         click.echo(f'Cannot connect to device: {e}', err=True)
-        sys.exit(e.errno)
+        sys.exit(e.errno or 1)
+    except ValueError as e:
+        click.echo(f'Invalid aliases or groups in {names}: {e}', err=True)
+        sys.exit(1)
+
+    global fader
+    if not 'fader' in globals():
+        fader = RampScheduler(osc)
 
     if ctx.invoked_subcommand is None:
         @cli.command(hidden=True)
@@ -87,35 +135,34 @@ def matrix():
 
     formatted = [
         [osc.outputs[i], *line]
-        for i, line in enumerate([list(x) for x in zip(*osc.get_matrix())])  # transpose the matrix
+        for i, line in enumerate(osc.get_mix_matrix().gains.T.tolist())  # buses as rows
     ]
 
     click.echo(tabulate.tabulate(formatted, headers=head, floatfmt=".2f", tablefmt='simple_grid'))
 
 
-@cli.command(help='Mute channel->bus send')
-@click.argument('channel')
-@click.argument('bus')
-def mute(channel: int | str, bus : int | str):
+def set_muted(channel: int | str, bus: int | str, muted: bool):
     try:
-        channel = parse_channel(osc, channel)
-        bus = parse_bus(osc, bus)
-
-        osc.set_muted(channel, bus, True)
+        channels = parse_channels(osc, channel)
+        buses = parse_buses(osc, bus)
+        with osc.transaction():
+            for channel in channels:
+                for bus in buses:
+                    osc.set_muted(channel, bus, muted)
     except ValueError as e:
         click.echo(f'Invalid input: {e}', err=True)
 
-@cli.command(help='Mute channel->bus send')
+@cli.command(help='Mute channel->bus send, either can be a group')
 @click.argument('channel')
 @click.argument('bus')
-def unmute(channel: int | str, bus : int | str):
-    try:
-        channel = parse_channel(osc, channel)
-        bus = parse_bus(osc, bus)
+def mute(channel: int | str, bus : int | str):
+    set_muted(channel, bus, True)
 
-        osc.set_muted(channel, bus, False)
-    except ValueError as e:
-        click.echo(f'Invalid input: {e}', err=True)
+@cli.command(help='Unmute channel->bus send, either can be a group')
+@click.argument('channel')
+@click.argument('bus')
+def unmute(channel: int | str, bus : int | str):
+    set_muted(channel, bus, False)
 
 @cli.command(help='Show muted channels')
 def get_mutes():
@@ -123,7 +170,7 @@ def get_mutes():
 
     formatted = [
         [osc.outputs[i], *line]
-        for i, line in enumerate([list(x) for x in zip(*osc.mute_matrix())])  # transpose the matrix
+        for i, line in enumerate(osc.get_mix_matrix().muted.T.tolist())  # buses as rows
     ]
 
     click.echo(tabulate.tabulate(formatted, headers=head, floatfmt=".2f", tablefmt='simple_grid'))
@@ -156,8 +203,16 @@ def list_channels_buses():
     ], headers=header, tablefmt='simple_grid'))
 
     click.echo('Presets:')
-    header = ['#', *range(len(presets))]
-    click.echo(tabulate.tabulate([['Preset', *presets.keys()]], headers=header, tablefmt='simple_grid'))
+    names = store.names()
+    header = ['#', *range(len(names))]
+    click.echo(tabulate.tabulate([['Preset', *names]], headers=header, tablefmt='simple_grid'))
+
+    groups = [[kind, group, ', '.join(index.names[i] for i in members)]
+              for kind, index in (('Channels', osc.channel_index), ('Buses', osc.bus_index))
+              for group, members in index.groups.items()]
+    if groups:
+        click.echo('Groups:')
+        click.echo(tabulate.tabulate(groups, headers=['#', 'Group', 'Members'], tablefmt='simple_grid'))
 
 
 @cli.command()
@@ -184,8 +239,10 @@ def img(channel: int | str):
 @click.argument('multiplier')
 def ims(channel: int | str, multiplier: float | str):
     try:
-        channel = parse_channel(osc, channel)
-        osc.set_channel_multiplier(channel, float(multiplier))
+        channels = parse_channels(osc, channel)
+        with osc.transaction():
+            for channel in channels:
+                osc.set_channel_multiplier(channel, float(multiplier))
     except ValueError as e:
         click.echo(f'Invalid input: {e}', err=True)
 
@@ -205,8 +262,10 @@ def omg(bus: int | str):
 @click.argument('multiplier')
 def oms(bus: int | str, multiplier: float | str):
     try:
-        bus = parse_bus(osc, bus)
-        osc.set_bus_multiplier(bus, float(multiplier))
+        buses = parse_buses(osc, bus)
+        with osc.transaction():
+            for bus in buses:
+                osc.set_bus_multiplier(bus, float(multiplier))
     except ValueError as e:
         click.echo(f'Invalid input: {e}', err=True)
 
@@ -223,31 +282,81 @@ def get_gain(channel: int | str, bus: int | str):
         click.echo(f'Invalid input: {e}', err=True)
 
 
-@cli.command(help='Set the gain for a specified channel')
+def wait_for_fade():
+    try:
+        fader.wait()
+    except KeyboardInterrupt:
+        fader.cancel()
+        click.echo('Fade stopped', err=True)
+    except (OSError, ValueError) as e:
+        click.echo(f'Fade failed: {e}', err=True)
+
+
+fade_option = click.option('--fade', '-f', default='0', help='Fade there over this long, e.g. 2s or 500ms')
+curve_option = click.option('--curve', type=click.Choice(list(CURVES)), default='linear', help='Shape of the fade')
+
+
+@cli.command(help='Set the gain for a specified channel, channel and bus can be groups')
 @click.argument('channel')
 @click.argument('bus')
 @click.argument('level', type=float)
-def set_gain(channel: int | str, bus : int | str, level: float | str):
+@fade_option
+@curve_option
+def set_gain(channel: int | str, bus : int | str, level: float | str, fade: str, curve: str):
     try:
-        channel = parse_channel(osc, channel)
-        bus = parse_bus(osc, bus)
+        cells = [(ch, b) for ch in parse_channels(osc, channel) for b in parse_buses(osc, bus)]
         level = parse_level(osc, level)
+        duration = parse_duration(fade)
+    except ValueError as e:
+        click.echo(f'Invalid input: {e}', err=True)
+        return
 
-        osc.set_gain(channel, bus, level)
+    try:
+        if duration > 0:
+            fader.fade({cell: level for cell in cells}, duration, curve)
+        else:
+            fader.cancel(cells)
+            with osc.transaction():
+                for channel, bus in cells:
+                    osc.set_gain(channel, bus, level)
     except ValueError as e:
+        # TopologyChanged, nothing was written
         click.echo(f'Invalid input: {e}', err=True)
+        return
+
+    if duration > 0:
+        wait_for_fade()
 
 
 @cli.command(help='Apply preset')
-@click.argument('preset', type=click.Choice(preset_choices()))
+@click.argument('preset')
+@fade_option
+@curve_option
 @click.help_option()
-def preset(preset: str):
-    if preset not in presets:
+def preset(preset: str, fade: str, curve: str):
+    if preset not in store:
         click.echo('Preset not found', err=True)
-    else:
-        for i in range(0, len(osc.inputs)):
-            for j in range(0, len(osc.outputs)):
-                osc.set_gain(i, j, presets[preset][i][j])
+        return
+
+    try:
+        writes = recall(osc, store.get(preset), fader, parse_duration(fade), curve)
+        click.echo(f'{writes} values changed')
+    except ValueError as e:
+        click.echo(f'Invalid preset: {e}', err=True)
+        return
+
+    wait_for_fade()
+
+
+@cli.command(help='Save gains, mutes and multipliers as a preset')
+@click.argument('preset')
+def save_preset(preset: str):
+    try:
+        path = store.save(preset, Snapshot.capture(osc))
+    except (ValueError, OSError) as e:
+        click.echo(f'Cannot save preset: {e}', err=True)
+        return
+    click.echo(f'Saved to {path}')
 
 
 @cli.command()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Round-trip latency through the proxy for each engine, against a fake mixer on a pty.
+# The fake mixer answers every message with its address and a float, like a gain read.
+#
+#   python3 bench/proxy_latency.py --requests 5000
+
+import os
+import sys
+import time
+import tty
+import signal
+import socket
+import statistics
+import subprocess
+import threading
+
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fosdemosc.helpers import parse_osc_bytes, flatten
+from fosdemosc.slip_client import SLIPDecoder, slip_encode
+
+
+def fake_mixer() -> str:
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    def serve():
+        decoder = SLIPDecoder()
+        while True:
+            for frame in decoder.feed(os.read(master, 4096)):
+                request = next(flatten(parse_osc_bytes(frame)))
+                reply = OscMessageBuilder(request.address)
+                reply.add_arg(0.5)
+                os.write(master, slip_encode(reply.build().dgram))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return os.ttyname(slave)
+
+
+def measure(port: int, count: int, clients: int):
+    request = OscMessageBuilder('/ch/0/mix/0/level').build().dgram
+    latencies = []
+
+    def client():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(2)
+        for _ in range(count // clients):
+            start = time.perf_counter()
+            sock.sendto(request, ('127.0.0.1', port))
+            sock.recv(4096)
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def wait_ready(port: int):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.2)
+    request = OscMessageBuilder('/info').build().dgram
+    for _ in range(50):
+        sock.sendto(request, ('127.0.0.1', port))
+        try:
+            sock.recv(4096)
+            return
+        except socket.timeout:
+            pass
+    raise RuntimeError('proxy did not come up')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Proxy latency per engine")
+    parser.add_argument("--requests", "-n", type=int, default=5000, help="Requests per engine (defaults to 5000)")
+    parser.add_argument("--clients", "-c", type=int, default=1, help="Concurrent UDP clients (defaults to 1)")
+    parser.add_argument("--port", "-p", type=int, default=10124, help="Port for the proxy under test (defaults to 10124)")
+    args = parser.parse_args()
+
+    device = fake_mixer()
+    env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+    print(f"{'engine':<16} {'req/s':>8} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for engine in ('multiprocessing', 'asyncio'):
+        proxy = subprocess.Popen([sys.executable, '-m', 'fosdemosc.proxy', '--engine', engine, '--no-cache',
+                                  '--uart', device, '--port', str(args.port)], env=env, stderr=subprocess.DEVNULL,
+                                 start_new_session=True)
+        try:
+            wait_ready(args.port)
+            latencies, elapsed = measure(args.port, args.requests, args.clients)
+        finally:
+            # the multiprocessing engine leaves its children behind otherwise
+            os.killpg(proxy.pid, signal.SIGTERM)
+            proxy.wait()
+            time.sleep(0.5)
+
+        ms = sorted(x * 1000 for x in latencies)
+        print(f"{engine:<16} {len(ms) / elapsed:>8.0f} {statistics.mean(ms):>8.3f} "
+              f"{ms[len(ms) // 2]:>8.3f} {ms[int(len(ms) * 0.99)]:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
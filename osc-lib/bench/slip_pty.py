@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the SLIP codec: pushes OSC frames through a pty pair and
+# compares the streaming SLIPClient against the old byte-at-a-time receive loop.
+#
+#   python3 bench/slip_pty.py --frames 20000
+
+import os
+import sys
+import time
+import resource
+import threading
+
+import serial
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fosdemosc.slip_client import SLIPClient, slip_encode
+
+
+class LegacySLIPClient(SLIPClient):
+    """The receive loop as it was before the streaming decoder"""
+
+    def receive(self) -> bytes:
+        buffer = b''
+        while True:
+            c = self.ser.read(1)
+            if c is None or not len(c):
+                raise serial.SerialTimeoutException('Cannot read from serial port')
+
+            if c == self.END:
+                if len(buffer):
+                    break
+                continue
+
+            if c == self.ESC:
+                c = self.ser.read(1)
+                if c is None or not len(c):
+                    raise serial.SerialTimeoutException('Packet ended too early')
+                if c == self.ESC_END:
+                    buffer += self.END
+                elif c == self.ESC_ESC:
+                    buffer += self.ESC
+            else:
+                buffer += c
+        return buffer
+
+
+def levels_reply(ch: int) -> bytes:
+    # same shape as the mixer's answer to /ch/N/levels, with a few bytes that need escaping
+    bundle = OscBundleBuilder(IMMEDIATELY)
+    for name, value in (('peak', -3.25), ('rms', -12.5), ('smooth', -9.0)):
+        message = OscMessageBuilder(f"/ch/{ch}/levels/{name}")
+        message.add_arg(value)
+        message.add_arg(b'\xc0\xdb', arg_type='b')
+        bundle.add_content(message.build())
+    return bundle.build().dgram
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(cls, frames: int, batch: int):
+    master, slave = os.openpty()
+    client = cls(os.ttyname(slave), baud=1152000, timeout=1, write_timeout=1)
+
+    payload = b''.join(slip_encode(levels_reply(i % 6)) for i in range(batch))
+
+    def writer():
+        for _ in range(frames // batch):
+            os.write(master, payload)
+
+    thread = threading.Thread(target=writer, daemon=True)
+
+    start_wall, start_cpu = time.perf_counter(), cpu_time()
+    thread.start()
+    for _ in range(frames // batch * batch):
+        client.receive()
+    wall, cpu = time.perf_counter() - start_wall, cpu_time() - start_cpu
+
+    thread.join()
+    client.ser.close()
+    os.close(master)
+    os.close(slave)
+    return wall, cpu
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SLIP codec benchmark over a pty pair")
+    parser.add_argument("--frames", "-n", type=int, default=20000, help="Frames to receive per run (defaults to 20000)")
+    parser.add_argument("--batch", "-b", type=int, default=12, help="Frames written per write() (defaults to 12)")
+    args = parser.parse_args()
+
+    print(f"{'client':<12} {'frames/s':>12} {'cpu us/frame':>14}")
+    for name, cls in (('legacy', LegacySLIPClient), ('streaming', SLIPClient)):
+        wall, cpu = run(cls, args.frames, args.batch)
+        count = args.frames // args.batch * args.batch
+        print(f"{name:<12} {count / wall:>12.0f} {cpu / count * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,9 @@
-from .osc_controller import OSCController, VUMeter, parse_channel, parse_bus, parse_level
+from .osc_controller import OSCController, VUMeter, parse_channel, parse_bus, parse_level, parse_channels, parse_buses
+from .async_controller import AsyncOSCController
+from .protocol import Dropped, ConnectionFailed
+from .topology import TopologyChanged
+from .names import InvalidInput, InvalidName
+from .matrix import MixMatrix
 from .presets import presets
+from .snapshots import Snapshot, PresetStore, recall, recall_async
+from .ramps import RampScheduler, AsyncRampScheduler, CURVES, parse_duration
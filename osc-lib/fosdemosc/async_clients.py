@@ -0,0 +1,128 @@
+import os
+import asyncio
+from typing import Union
+
+import serial
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message import OscMessage
+
+from .helpers import parse_osc_bytes
+from .slip_client import SLIPDecoder, slip_encode
+
+
+class AsyncClient:
+    """Replies from the mixer as they arrive, for clients driven by the event loop"""
+
+    def __init__(self):
+        self.replies: asyncio.Queue[OscBundle | OscMessage | Exception] = asyncio.Queue()
+
+    def reset_input_buffer(self) -> None:
+        while not self.replies.empty():
+            self.replies.get_nowait()
+
+    async def receive_obj(self) -> OscBundle | OscMessage:
+        reply = await self.replies.get()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def received(self, data: bytes) -> None:
+        try:
+            self.replies.put_nowait(parse_osc_bytes(data))
+        except Exception as e:
+            self.replies.put_nowait(e)
+
+
+class AsyncUDPClient(AsyncClient, asyncio.DatagramProtocol):
+    def __init__(self):
+        super().__init__()
+        self.transport: asyncio.DatagramTransport | None = None
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> 'AsyncUDPClient':
+        _, client = await asyncio.get_running_loop().create_datagram_endpoint(cls, remote_addr=(host, port))
+        return client
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received(data)
+
+    def error_received(self, exc):
+        # e.g. nothing listening on the port, let the caller know instead of waiting for its timeout
+        self.replies.put_nowait(exc)
+
+    def send(self, content: Union[OscMessage, OscBundle]) -> None:
+        self.transport.sendto(content.dgram)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncSLIPClient(AsyncClient):
+    def __init__(self, device, baud=9600):
+        super().__init__()
+        self.loop = asyncio.get_running_loop()
+
+        # non-blocking, the event loop tells us when the port is ready
+        self.ser = serial.Serial(device, baudrate=baud, timeout=0)
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+
+        self.decoder = SLIPDecoder()
+        self.outgoing = bytearray()
+        self.loop.add_reader(self.ser.fileno(), self.__readable)
+
+    def reset_input_buffer(self) -> None:
+        self.ser.reset_input_buffer()
+        self.decoder.reset()
+        super().reset_input_buffer()
+
+    def __readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            # the port went away, fail whoever waits for a reply instead of spinning on the fd
+            self.loop.remove_reader(self.ser.fileno())
+            self.replies.put_nowait(e)
+            return
+
+        for frame in self.decoder.feed(data):
+            self.received(frame)
+
+    def __write_some(self) -> None:
+        # the port is opened O_NONBLOCK, write what the driver takes and keep the rest
+        try:
+            sent = os.write(self.ser.fileno(), self.outgoing)
+        except BlockingIOError:
+            sent = 0
+        del self.outgoing[:sent]
+
+    def __writable(self):
+        try:
+            self.__write_some()
+        except Exception as e:
+            self.loop.remove_writer(self.ser.fileno())
+            self.replies.put_nowait(e)
+            return
+
+        if not self.outgoing:
+            self.loop.remove_writer(self.ser.fileno())
+
+    def send(self, content: Union[OscMessage, OscBundle]) -> None:
+        pending = bool(self.outgoing)
+        self.outgoing += slip_encode(content.dgram)
+        if pending:
+            return
+
+        # most of the time it all fits in the driver's buffer right away
+        self.__write_some()
+        if self.outgoing:
+            self.loop.add_writer(self.ser.fileno(), self.__writable)
+
+    def close(self) -> None:
+        self.loop.remove_reader(self.ser.fileno())
+        if self.outgoing:
+            self.loop.remove_writer(self.ser.fileno())
+        self.ser.close()
@@ -0,0 +1,425 @@
+from typing import Any, List, Mapping
+from pythonosc.osc_message import OscMessage, ParseError as MessageParseError
+from pythonosc.osc_bundle import OscBundle, ParseError as BundleParseError
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import time
+
+from .helpers import flatten, answers
+from .matrix import MixMatrix
+from .mirror import StateMirror
+from .async_clients import AsyncClient, AsyncSLIPClient, AsyncUDPClient
+from .names import NameIndex
+from . import topology
+from .topology import TopologyChanged
+from .protocol import (Channel, Bus, Level, VUMeter, BundleSupport, vu_meter, vu_meters, build, bundle, mix_address,
+                       multiplier_address, levels_address, mix_addresses, matrices, mirrored_addresses, chunks,
+                       pack, match_replies, first_params, changed, check_dropped, parse_info, topology_of,
+                       ConnectionFailed)
+from .osc_controller import name_indexes
+
+# seconds to wait for the mixer to answer one message or bundle
+TIMEOUT = 1
+
+
+class AsyncOSCController:
+    """OSCController for asyncio: the same calls as coroutines, so waiting on the mixer doesn't block the event loop.
+
+    Create it with `await AsyncOSCController.connect(...)`. Round trips are serialized, a reply that doesn't come
+    within `timeout` seconds raises asyncio.TimeoutError. A call that is cancelled or times out leaves its reply in flight,
+    it is recognised by its address and skipped when it turns up later.
+    """
+
+    inputs: List[str]
+    outputs: List[str]
+    # resolve names against the cached topology until it was checked, call validate() before to be sure,
+    # requests with numbers worked out from them raise TopologyChanged when their check finds it changed
+    channel_index: NameIndex
+    bus_index: NameIndex
+
+    def __init__(self, client: AsyncClient, device: str, timeout=TIMEOUT, use_bundles=True, mirror=False,
+                 aliases: Mapping[str, Mapping] | None = None, groups: Mapping[str, Mapping] | None = None,
+                 cache_info=True, cache_dir: str | None = None):
+        self.client = client
+        self.aliases = aliases or {}
+        self.groups = groups or {}
+        self.cache_info = cache_info
+        self.cache_dir = cache_dir
+        self._device = device
+        self.timeout = timeout
+        # stops bundling for a while when the firmware keeps failing to answer bundles
+        self.bundles = BundleSupport(use_bundles)
+        self.mirror = StateMirror() if mirror else None
+
+        self.__lock = asyncio.Lock()
+        # cleared while a topology from the cache hasn't been checked against /info yet
+        self.__validated = True
+        # one check at a time, and how often one found other channels or buses than were cached
+        self.__validation = asyncio.Lock()
+        self.__generation = 0
+        self.__info: dict[str, Any] = {}
+        # writes collected by an open transaction(), per task so concurrent callers don't end up in each other's
+        self.__pending: ContextVar[dict[str, Any] | None] = ContextVar('pending', default=None)
+        self.__reconciler: asyncio.Task | None = None
+
+    @classmethod
+    async def connect(cls, device: str, baud=1152000, mode='serial', timeout=TIMEOUT, use_bundles=True,
+                      mirror=False, reconcile_interval: float | None = None, aliases: Mapping[str, Mapping] | None = None,
+                      groups: Mapping[str, Mapping] | None = None, cache_info=True,
+                      cache_dir: str | None = None) -> 'AsyncOSCController':
+        try:
+            if mode == 'serial':
+                client = AsyncSLIPClient(device, baud)
+                name = device
+            elif mode == 'udp':
+                client = await AsyncUDPClient.connect(device, baud)
+                name = f"{device}:{baud}"
+            else:
+                raise ValueError('mode')
+        except OSError as e:
+            raise ConnectionFailed(f"Cannot open {device}: {e}") from e
+
+        osc = cls(client, name, timeout, use_bundles, mirror or bool(reconcile_interval), aliases, groups,
+                  cache_info, cache_dir)
+        # with a cached topology nothing is sent yet, the first request checks it like OSCController does
+        cached = topology.load_info(name, cache_dir) if cache_info else None
+        try:
+            if cached is not None:
+                try:
+                    osc.__apply_info(cached)
+                    osc.__validated = False
+                except Exception:
+                    # a truncated or hand-edited file, or aliases and groups naming channels or buses it doesn't have,
+                    # ask the mixer instead
+                    cached = None
+            if cached is None:
+                await osc.__initialize()
+        except BaseException:
+            client.close()
+            raise
+
+        if reconcile_interval:
+            osc.__reconciler = asyncio.create_task(osc.__reconcile_loop(reconcile_interval))
+        return osc
+
+    def close(self):
+        if self.__reconciler:
+            self.__reconciler.cancel()
+        self.client.close()
+
+    @property
+    def device(self) -> str | None:
+        return self._device
+
+    async def __reply_to(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle:
+        while True:
+            reply = await self.client.receive_obj()
+            if answers(request, reply):
+                return reply
+            # left over from a call that was cancelled or timed out
+
+    async def validate(self) -> bool:
+        """Check the cached channels and buses against the mixer now instead of with the first request,
+        returning whether they had changed, also when another task's check was under way"""
+        if self.__validated:
+            return False
+
+        generation = self.__generation
+        async with self.__validation:
+            if not self.__validated:
+                info = await self.__get_info()
+                if info != self.__info:
+                    self.__apply_info(info)
+                    self.__save_info()
+                    self.__generation += 1
+                self.__validated = True
+        return self.__generation != generation
+
+    async def __check_topology(self):
+        # numbers the caller worked out from names before the cache was checked may mean other sends now
+        if await self.validate():
+            raise TopologyChanged("The mixer's channels or buses changed since they were cached, nothing was sent")
+
+    async def __exchange(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle:
+        async with self.__lock:
+            self.client.send(request)
+            reply = await asyncio.wait_for(self.__reply_to(request), self.timeout)
+
+        check_dropped(request, reply)
+        return reply
+
+    async def __roundtrip(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle:
+        await self.validate()
+        return await self.__exchange(request)
+
+    async def __send(self, address: str, *args):
+        return await self.__roundtrip(build(address, *args))
+
+    async def __read(self, address: str):
+        # of a channel or bus the caller names by number, see __check_topology()
+        await self.__check_topology()
+        return await self.__send(address)
+
+    async def __write(self, address: str, value: Any) -> None:
+        await self.__check_topology()
+        pending = self.__pending.get()
+        if pending is not None:
+            pending[address] = value
+            return
+
+        await self.__send(address, value)
+        if self.mirror is not None:
+            self.mirror.write(address, value)
+
+    async def __commit(self, writes: dict[str, Any], skip_unchanged: bool, max_age: float | None) -> None:
+        if skip_unchanged and writes:
+            current = await self.__query_params(list(writes), max_age)
+            writes = changed(writes, current)
+
+        sent = {}
+        try:
+            for part in pack(writes):
+                await self.__commit_chunk(part)
+                sent.update(part)
+        finally:
+            if self.mirror is not None:
+                for address, value in sent.items():
+                    self.mirror.write(address, value)
+
+    async def __commit_chunk(self, writes: dict[str, Any]) -> None:
+        if self.bundles.usable():
+            try:
+                await self.__roundtrip(bundle([build(address, value) for address, value in writes.items()]))
+                self.bundles.succeeded()
+                return
+            except asyncio.TimeoutError:
+                pass
+            except (MessageParseError, BundleParseError):
+                self.bundles.failed()
+
+        for address, value in writes.items():
+            await self.__send(address, value)
+
+    @asynccontextmanager
+    async def transaction(self, skip_unchanged=True, max_age: float | None = None):
+        """Collect all writes made inside the block and send them in one bundle once it exits, like OSCController.transaction().
+
+        Skipping unchanged writes reads them first, unless the mirror has them from the last max_age seconds.
+        """
+        if self.__pending.get() is not None:
+            yield self
+            return
+
+        await self.__check_topology()
+        token = self.__pending.set({})
+        try:
+            yield self
+            writes = self.__pending.get()
+        finally:
+            self.__pending.reset(token)
+
+        await self.__commit(writes, skip_unchanged, max_age)
+
+    async def __query_bundle(self, addresses: List[str]) -> dict[str, List[OscMessage]] | None:
+        # a timeout doesn't count against bundles, like in OSCController
+        try:
+            replies = match_replies(addresses, flatten(await self.__roundtrip(bundle([build(address) for address in addresses]))))
+        except asyncio.TimeoutError:
+            return None
+        except (MessageParseError, BundleParseError):
+            replies = None
+
+        if replies is None or not all(replies.values()):
+            self.bundles.failed()
+            return None
+        self.bundles.succeeded()
+        return replies
+
+    async def __query(self, addresses: List[str]) -> dict[str, List[OscMessage]]:
+        """Read all addresses, BUNDLE_SIZE at a time, falling back to one round trip each like OSCController"""
+        replies = {}
+        for chunk in chunks(addresses):
+            if self.bundles.usable():
+                bundled = await self.__query_bundle(chunk)
+                if bundled is not None:
+                    replies.update(bundled)
+                    continue
+
+            for address in chunk:
+                replies[address] = list(flatten(await self.__send(address)))
+        return replies
+
+    async def __query_params(self, addresses: List[str], max_age: float | None = None) -> dict[str, Any]:
+        if self.mirror is not None and max_age is not None:
+            mirrored = self.mirror.get(addresses, max_age)
+            if mirrored is not None:
+                return mirrored
+
+        # other tasks may write while the chunks go back and forth, their values must win
+        started = time.monotonic()
+        params = first_params(await self.__query(addresses))
+        if self.mirror is not None:
+            self.mirror.update(params, started)
+        return params
+
+    async def __get_mix_matrix(self, name: str, max_age: float | None = None) -> List[List[Any]]:
+        return (await self.__get_mix_matrices([name], max_age))[name]
+
+    async def __get_mix_matrices(self, names: List[str], max_age: float | None = None) -> dict[str, List[List[Any]]]:
+        # every read of the whole mixer goes by the channels and buses it has now
+        await self.validate()
+        addresses = mix_addresses(names, self.inputs, self.outputs)
+        params = await self.__query_params([address for rows in addresses.values() for row in rows for address in row], max_age)
+        return matrices(addresses, params)
+
+    def __names(self, specifier: str) -> List[str]:
+        return self.inputs if specifier == 'ch' else self.outputs
+
+    async def __get_chbus_multipliers(self, specifier: str, max_age: float | None = None) -> dict[str, float]:
+        await self.validate()
+        names = self.__names(specifier)
+        addresses = [multiplier_address(specifier, num) for num in range(len(names))]
+        params = await self.__query_params(addresses, max_age)
+        return {name: float(params[address]) for name, address in zip(names, addresses)}
+
+    async def __get_chbus_vu_meters(self, specifier: str) -> dict[str, VUMeter]:
+        await self.validate()
+        names = self.__names(specifier)
+        addresses = [levels_address(specifier, num) for num in range(len(names))]
+        return vu_meters(names, addresses, await self.__query(addresses))
+
+    async def __get_info(self) -> dict[str, Any]:
+        # the first exchange with the mixer, whether it is there at all shows here
+        try:
+            return parse_info(await self.__exchange(build("/info")))
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectionFailed(f"No answer from {self._device}: {e}") from e
+
+    async def __initialize(self):
+        self.__apply_info(await self.__get_info())
+        self.__save_info()
+
+    def __apply_info(self, info: dict[str, Any]):
+        # the names must fit the aliases and groups before anything changes
+        inputs, outputs = topology_of(info)
+        self.channel_index, self.bus_index = name_indexes(inputs, outputs, self.aliases, self.groups)
+        self.__info = info
+        self.inputs, self.outputs = inputs, outputs
+
+    def __save_info(self):
+        if self.cache_info:
+            topology.save_info(self._device, self.__info, self.cache_dir)
+
+    async def reconcile(self) -> int:
+        """Read everything the mirror holds from the mixer, returning how many values had changed behind our back"""
+        if self.mirror is None:
+            return 0
+
+        before = self.mirror.corrections
+        await self.validate()
+        await self.__query_params(mirrored_addresses(self.inputs, self.outputs))
+        return self.mirror.corrections - before
+
+    async def __reconcile_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                # the mixer or proxy is away, the mirror just ages until the next round works
+                pass
+
+    async def get_bus_multiplier(self, bus: Bus) -> float:
+        response = await self.__read(multiplier_address('bus', bus))
+        return float(response.params[0])
+
+    async def set_bus_multiplier(self, bus: Bus, multiplier: float):
+        await self.__write(multiplier_address('bus', bus), float(multiplier))
+
+    async def get_channel_multiplier(self, channel: Channel) -> float:
+        response = await self.__read(multiplier_address('ch', channel))
+        return float(response.params[0])
+
+    async def set_channel_multiplier(self, channel: Channel, multiplier: float):
+        await self.__write(multiplier_address('ch', channel), float(multiplier))
+
+    async def get_matrix(self, max_age: float | None = None) -> List[List[float]]:
+        return [[Level(x) for x in row] for row in await self.__get_mix_matrix('level', max_age)]
+
+    async def get_raw_matrix(self, max_age: float | None = None) -> List[List[float]]:
+        return [[Level(x) for x in row] for row in await self.__get_mix_matrix('raw', max_age)]
+
+    async def mute_matrix(self, max_age: float | None = None) -> List[List[bool]]:
+        return [[bool(x) for x in row] for row in await self.__get_mix_matrix('muted', max_age)]
+
+    async def get_mix_matrix(self, max_age: float | None = None) -> MixMatrix:
+        """Gains and mutes of every send, read together"""
+        matrices = await self.__get_mix_matrices(['level', 'muted'], max_age)
+        return MixMatrix(matrices['level'], matrices['muted'], self.inputs, self.outputs)
+
+    async def get_bus_vu_meters(self) -> Mapping[Bus, List[VUMeter]]:
+        return await self.__get_chbus_vu_meters('bus')
+
+    async def get_channel_vu_meters(self) -> Mapping[Channel, List[VUMeter]]:
+        return await self.__get_chbus_vu_meters('ch')
+
+    async def get_vu_meters(self) -> dict[str, dict[str, VUMeter]]:
+        """Channel and bus meters together, in as few bundles as BUNDLE_SIZE allows"""
+        await self.validate()
+        channels = [levels_address('ch', num) for num in range(len(self.inputs))]
+        buses = [levels_address('bus', num) for num in range(len(self.outputs))]
+        replies = await self.__query(channels + buses)
+        return {
+            'input': vu_meters(self.inputs, channels, replies),
+            'output': vu_meters(self.outputs, buses, replies),
+        }
+
+    async def get_bus_multipliers(self, max_age: float | None = None) -> Mapping[Bus, float]:
+        return await self.__get_chbus_multipliers('bus', max_age)
+
+    async def get_channel_multipliers(self, max_age: float | None = None) -> Mapping[Channel, float]:
+        return await self.__get_chbus_multipliers('ch', max_age)
+
+    async def get_gain(self, channel: Channel, bus: Bus) -> Level:
+        response = await self.__read(mix_address(channel, bus, 'level'))
+        return Level(response.params[0])
+
+    async def get_raw_gain(self, channel: Channel, bus: Bus) -> Level:
+        response = await self.__read(mix_address(channel, bus, 'raw'))
+        return Level(response.params[0])
+
+    async def set_gain(self, channel: Channel, bus: Bus, level: Level) -> None:
+        await self.__write(mix_address(channel, bus, 'level'), Level(level))
+
+    async def get_muted(self, channel: Channel, bus: Bus) -> bool:
+        response = await self.__read(mix_address(channel, bus, 'muted'))
+        return bool(response.params[0])
+
+    async def set_muted(self, channel: Channel, bus: Bus, muted: bool) -> None:
+        await self.__write(mix_address(channel, bus, 'muted'), bool(muted))
+
+    async def get_channel_levels(self, channel: Channel) -> VUMeter:
+        return vu_meter(await self.__read(levels_address('ch', channel)))
+
+    async def get_bus_levels(self, bus: Bus) -> VUMeter:
+        return vu_meter(await self.__read(levels_address('bus', bus)))
+
+    async def get_state(self, max_age: float | None = None):
+        return {
+            'mutes': await self.get_mutes(max_age),
+            'multipliers': {
+                'input': await self.get_channel_multipliers(max_age),
+                'output': await self.get_bus_multipliers(max_age),
+            },
+        }
+
+    async def get_mutes(self, max_age: float | None = None) -> dict[str, dict[str, bool]]:
+        mutes = await self.mute_matrix(max_age)
+        return {ch: {bus: mutes[i][j] for j, bus in enumerate(self.outputs)} for i, ch in enumerate(self.inputs)}
+
+    async def reset(self):
+        await self.__send("/factoryreset")
+        if self.mirror is not None:
+            self.mirror.clear()
@@ -0,0 +1,140 @@
+import math
+import time
+from fnmatch import fnmatchcase
+from typing import List, Tuple
+from dataclasses import dataclass
+
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from .helpers import flatten
+
+# (pattern, seconds), first match wins. Anything not listed is never cached.
+# Mixes and multipliers only change through writes, which invalidate them.
+DEFAULT_TTLS: List[Tuple[str, float]] = [
+    ('/info', math.inf),
+    ('/ch/*/config/*', math.inf),
+    ('/bus/*/config/*', math.inf),
+    ('/ch/*/levels', 0.02),
+    ('/bus/*/levels', 0.02),
+    ('/ch/*/mix/*', math.inf),
+    ('/ch/*/multiplier', math.inf),
+    ('/bus/*/multiplier', math.inf),
+]
+
+# writing an address matching the first pattern also changes what the second one reads, {} being the
+# written channel or bus: a multiplier scales every send of it
+DERIVED: List[Tuple[str, str]] = [
+    ('/ch/*/multiplier', '/ch/{}/mix/*'),
+    ('/bus/*/multiplier', '/ch/*/mix/{}/*'),
+]
+
+def derived(address: str) -> List[str]:
+    return [pattern.format(address.split('/')[2]) for written, pattern in DERIVED if fnmatchcase(address, written)]
+
+def parse_ttl(value: str) -> Tuple[str, float]:
+    pattern, _, seconds = value.rpartition('=')
+    if not pattern:
+        raise ValueError(f"Expected PATTERN=SECONDS, got {value}")
+    return pattern, float(seconds)
+
+@dataclass
+class CacheEntry:
+    addresses: List[str]
+    response: OscMessage | OscBundle
+    expires: float
+
+class ResponseCache:
+    """Read-through cache of mixer responses, keyed by the request datagram"""
+
+    def __init__(self, ttls: List[Tuple[str, float]] = DEFAULT_TTLS, max_entries=1024):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.entries: dict[bytes, CacheEntry] = {}
+        self.address_ttls: dict[str, float] = {}
+
+        # bumped on every write, responses to reads sent before it are not stored
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def ttl(self, address: str) -> float:
+        if address not in self.address_ttls:
+            self.address_ttls[address] = next((ttl for pattern, ttl in self.ttls if fnmatchcase(address, pattern)), 0)
+        return self.address_ttls[address]
+
+    def get(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle | None:
+        entry = self.entries.get(request.dgram)
+        if entry is not None and entry.expires > time.monotonic():
+            self.hits += 1
+            return entry.response
+
+        self.misses += 1
+        return None
+
+    def get_stale(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle | None:
+        """Whatever is cached for request, however old. Writes still remove entries they touch."""
+        entry = self.entries.get(request.dgram)
+        return entry.response if entry is not None else None
+
+    def put(self, request: OscMessage | OscBundle, response: OscMessage | OscBundle, generation: int) -> None:
+        if generation != self.generation:
+            return
+
+        addresses = [x.address for x in flatten(request)]
+        ttl = min((self.ttl(address) for address in addresses), default=0)
+        if ttl <= 0:
+            return
+
+        self.__store(request.dgram, CacheEntry(addresses=addresses, response=response, expires=time.monotonic() + ttl))
+
+    def invalidate(self, request: OscMessage | OscBundle) -> None:
+        """Drop everything a write may change: the written addresses, their siblings and what derives from them"""
+        self.generation += 1
+
+        written = [x.address for x in flatten(request)]
+        if '/factoryreset' in written:
+            self.clear()
+            return
+
+        parents = tuple(address.rsplit('/', 1)[0] + '/' for address in written)
+        patterns = [pattern for address in written for pattern in derived(address)]
+        stale = [key for key, entry in self.entries.items()
+                 if any(address.startswith(parents) or any(fnmatchcase(address, pattern) for pattern in patterns)
+                        for address in entry.addresses)]
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def write_through(self, response: OscMessage | OscBundle, generation: int) -> None:
+        """Store the mixer's answer to a write as the answer to reading that address"""
+        if generation != self.generation:
+            return
+
+        for message in flatten(response):
+            if not len(message.params) or self.ttl(message.address) <= 0:
+                continue
+
+            read = OscMessageBuilder(message.address).build()
+            self.__store(read.dgram, CacheEntry(addresses=[message.address], response=message,
+                                                expires=time.monotonic() + self.ttl(message.address)))
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations, 'entries': len(self.entries)}
+
+    def __store(self, key: bytes, entry: CacheEntry) -> None:
+        if len(self.entries) >= self.max_entries:
+            now = time.monotonic()
+            self.entries = {k: v for k, v in self.entries.items() if v.expires > now}
+            while len(self.entries) >= self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+        self.entries[key] = entry
@@ -0,0 +1,89 @@
+import math
+import time
+from typing import Any, List
+from dataclasses import dataclass
+
+# requests per second and burst size per client, 0 disables the limit
+CLIENT_RATE = 100
+CLIENT_BURST = 200
+# seconds without a request before a client is forgotten
+IDLE_TIMEOUT = 60
+# seconds over which a client's use of the serial link is remembered for fair sharing
+USAGE_DECAY = 5
+
+
+@dataclass
+class ClientInfo:
+    addr: Any
+    first_seen: float
+    last_seen: float
+    tokens: float
+    requests: int = 0
+    limited: int = 0
+    # total seconds of mixer round trips spent on this client
+    serial_time: float = 0
+    # the same, decayed over USAGE_DECAY, as of usage_at
+    usage: float = 0
+    usage_at: float = 0
+    # requests, decayed over USAGE_DECAY, as of last_seen
+    recent: float = 0
+
+
+class ClientRegistry:
+    """Everyone who talks to the proxy, with a token bucket each and how much of the link they use"""
+
+    def __init__(self, rate=CLIENT_RATE, burst=CLIENT_BURST, idle_timeout=IDLE_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+        self.clients: dict[Any, ClientInfo] = {}
+        self.evicted = 0
+
+    def admit(self, addr) -> bool:
+        """Record a request from addr, returning False if it is over its rate limit"""
+        now = time.monotonic()
+        client = self.clients.get(addr)
+        if client is None:
+            client = self.clients[addr] = ClientInfo(addr=addr, first_seen=now, last_seen=now, tokens=self.burst, usage_at=now)
+
+        client.tokens = min(self.burst, client.tokens + (now - client.last_seen) * self.rate)
+        client.recent = client.recent * math.exp((client.last_seen - now) / USAGE_DECAY) + 1
+        client.last_seen = now
+        client.requests += 1
+
+        if self.rate and client.tokens < 1:
+            client.limited += 1
+            return False
+
+        client.tokens -= 1
+        return True
+
+    def charge(self, addr, seconds: float):
+        client = self.clients.get(addr)
+        if client is None:
+            return
+
+        client.serial_time += seconds
+        client.usage = self.usage(addr) + seconds
+        client.usage_at = time.monotonic()
+
+    def usage(self, addr) -> float:
+        client = self.clients.get(addr)
+        if client is None:
+            return 0.0
+        return client.usage * math.exp((client.usage_at - time.monotonic()) / USAGE_DECAY)
+
+    def request_rate(self, addr) -> float:
+        """Requests per second lately"""
+        client = self.clients.get(addr)
+        if client is None:
+            return 0.0
+        return client.recent * math.exp((client.last_seen - time.monotonic()) / USAGE_DECAY) / USAGE_DECAY
+
+    def evict_idle(self) -> List[ClientInfo]:
+        now = time.monotonic()
+        idle = [client for client in self.clients.values() if now - client.last_seen > self.idle_timeout]
+        for client in idle:
+            del self.clients[client.addr]
+        self.evicted += len(idle)
+        return idle
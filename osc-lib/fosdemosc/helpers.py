@@ -1,5 +1,9 @@
+import math
+from typing import Any, Iterator
+
 from pythonosc.osc_message import OscMessage
 from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message_builder import OscMessageBuilder
 
 
 def parse_osc_bytes(contents: bytes) -> OscMessage | OscBundle:
@@ -9,3 +13,49 @@ def parse_osc_bytes(contents: bytes) -> OscMessage | OscBundle:
             return OscBundle(contents)
         else:
             return OscMessage(contents)
+
+
+def flatten(obj: OscMessage | OscBundle) -> Iterator[OscMessage]:
+    if isinstance(obj, OscBundle):
+        for x in obj:
+            yield from flatten(x)
+    else:
+        yield obj
+
+
+# what the proxy answers a request it won't send on, with the addresses of the request as arguments
+DROPPED = '/proxy/dropped'
+# messages without arguments that change the mixer instead of reading it
+COMMANDS = ('/factoryreset',)
+
+
+def is_read(obj: OscMessage | OscBundle) -> bool:
+    return all(not len(x.params) and x.address not in COMMANDS for x in flatten(obj))
+
+
+def answers(request: OscMessage | OscBundle, response: OscMessage | OscBundle) -> bool:
+    # replies carry the queried address, or live right below it (e.g. /ch/0/levels/peak)
+    address = next(flatten(request), None)
+    reply = next(flatten(response), None)
+    if address is None or reply is None:
+        return False
+    if reply.address == DROPPED:
+        return len(reply.params) > 0 and reply.params[0] == address.address
+    return reply.address == address.address or reply.address.startswith(address.address + "/")
+
+
+def dropped_reply(request: OscMessage | OscBundle) -> OscMessage:
+    """What the proxy answers a request it won't send on: DROPPED with every address of it"""
+    message = OscMessageBuilder(DROPPED)
+    for x in flatten(request):
+        message.add_arg(x.address)
+    return message.build()
+
+
+def is_dropped(response: OscMessage | OscBundle) -> bool:
+    return isinstance(response, OscMessage) and response.address == DROPPED
+
+
+def same_value(a: Any, b: Any) -> bool:
+    # the mixer stores float32, so compare loosely
+    return math.isclose(float(a), float(b), rel_tol=1e-6, abs_tol=1e-6)
@@ -0,0 +1,86 @@
+from typing import Any, Iterable, List, Mapping
+
+import numpy as np
+
+# the mixer stores float32, gains closer than this are the same, like helpers.same_value()
+TOLERANCE = 1e-6
+
+
+class MixMatrix:
+    """Gains and mutes of every channel to bus send, indexed [channel, bus] like /ch/N/mix/M.
+
+    gains is a float32 and muted a bool array, inputs and outputs name their axes.
+    """
+
+    def __init__(self, gains: Any, muted: Any = None, inputs: Iterable[str] | None = None,
+                 outputs: Iterable[str] | None = None):
+        self.gains = np.asarray(gains, dtype=np.float32)
+        if self.gains.ndim != 2:
+            raise ValueError(f"A mix matrix has two axes, not {self.gains.ndim}")
+
+        self.muted = np.zeros(self.gains.shape, dtype=bool) if muted is None else np.asarray(muted, dtype=bool)
+        if self.muted.shape != self.gains.shape:
+            raise ValueError(f"Mutes are {self.muted.shape}, but gains {self.gains.shape}")
+
+        self.inputs = list(inputs) if inputs is not None else [str(i) for i in range(self.gains.shape[0])]
+        self.outputs = list(outputs) if outputs is not None else [str(i) for i in range(self.gains.shape[1])]
+        if (len(self.inputs), len(self.outputs)) != self.gains.shape:
+            raise ValueError(f"{len(self.inputs)} inputs and {len(self.outputs)} outputs don't name {self.gains.shape}")
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.gains.shape
+
+    def __repr__(self) -> str:
+        return f"MixMatrix({self.gains.tolist()}, {self.muted.tolist()}, {self.inputs}, {self.outputs})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, MixMatrix) and self.shape == other.shape and not self.diff(other).any()
+
+    def diff(self, other: 'MixMatrix', mutes=True) -> np.ndarray:
+        """Which sends have another gain, or are muted differently, in other"""
+        if other.shape != self.shape:
+            raise ValueError(f"Can't compare a {self.shape} mix matrix with a {other.shape} one")
+
+        changed = ~np.isclose(self.gains, other.gains, rtol=TOLERANCE, atol=TOLERANCE)
+        if mutes:
+            changed |= self.muted != other.muted
+        return changed
+
+    def changes(self, other: 'MixMatrix', mutes=True) -> List[tuple[int, int]]:
+        """The (channel, bus) of every send diff() finds"""
+        return [(int(ch), int(bus)) for ch, bus in zip(*np.nonzero(self.diff(other, mutes)))]
+
+    def effective(self, channel_multipliers: Any = None, bus_multipliers: Any = None) -> np.ndarray:
+        """The gain every send actually has: zero when muted, scaled by the channel's and bus's multipliers"""
+        gains = np.where(self.muted, np.float32(0), self.gains)
+        if channel_multipliers is not None:
+            gains = gains * np.asarray(list_values(channel_multipliers, self.inputs), dtype=np.float32)[:, None]
+        if bus_multipliers is not None:
+            gains = gains * np.asarray(list_values(bus_multipliers, self.outputs), dtype=np.float32)[None, :]
+        return gains
+
+    def buffers(self) -> tuple[memoryview, memoryview]:
+        """The gains as float32 and the mutes as one byte per send, without copying them"""
+        return memoryview(np.ascontiguousarray(self.gains)), memoryview(np.ascontiguousarray(self.muted).view(np.uint8))
+
+    @classmethod
+    def from_buffers(cls, gains: Any, muted: Any, inputs: List[str], outputs: List[str]) -> 'MixMatrix':
+        """A matrix viewing what buffers() gave, without copying it"""
+        shape = (len(inputs), len(outputs))
+        return cls(np.frombuffer(gains, dtype=np.float32).reshape(shape),
+                   np.frombuffer(muted, dtype=np.uint8).reshape(shape).view(bool), inputs, outputs)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'inputs': self.inputs, 'outputs': self.outputs, 'gains': self.gains.tolist(), 'muted': self.muted.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> 'MixMatrix':
+        return cls(data['gains'], data.get('muted'), data.get('inputs'), data.get('outputs'))
+
+
+def list_values(values: Any, names: List[str]) -> List[float]:
+    # multipliers come as {name: value} from get_*_multipliers(), or already in order
+    if isinstance(values, Mapping):
+        return [values[name] for name in names]
+    return list(values)
@@ -0,0 +1,70 @@
+import time
+from typing import Any, Iterable, Mapping
+
+from .helpers import same_value
+
+# writing the key also changes the sibling in the value, e.g. /ch/0/mix/1/level changes /ch/0/mix/1/raw
+DERIVED = {
+    'level': 'raw',
+    'muted': 'raw',
+}
+
+
+class StateMirror:
+    """Last known value of mixer addresses, with when they were last read or written"""
+
+    def __init__(self):
+        self.values: dict[str, Any] = {}
+        self.updated: dict[str, float] = {}
+        # values a read found different from what we had, i.e. changed behind our back
+        self.corrections = 0
+
+    def get(self, addresses: Iterable[str], max_age: float) -> dict[str, Any] | None:
+        """Values for all addresses, or None if any of them is unknown or older than max_age seconds"""
+        oldest = time.monotonic() - max_age
+        values = {}
+        for address in addresses:
+            updated = self.updated.get(address)
+            if updated is None or updated < oldest:
+                return None
+            try:
+                values[address] = self.values[address]
+            except KeyError:
+                # forgotten by a write from another thread in the meantime
+                return None
+        return values
+
+    def update(self, values: Mapping[str, Any], since: float | None = None) -> int:
+        """Store values read from the mixer, returning how many differed from the mirror.
+
+        Addresses written or read again after `since`, when the read started, already have something newer.
+        """
+        now = time.monotonic()
+        changed = 0
+        for address, value in values.items():
+            if since is not None and self.updated.get(address, since) > since:
+                continue
+            if address in self.values and not same_value(self.values[address], value):
+                changed += 1
+            self.values[address] = value
+            self.updated[address] = now
+
+        self.corrections += changed
+        return changed
+
+    def write(self, address: str, value: Any):
+        """Store a value written to the mixer, forgetting what that write changes as well"""
+        parent, _, name = address.rpartition('/')
+        if name in DERIVED:
+            self.forget(f"{parent}/{DERIVED[name]}")
+
+        self.values[address] = value
+        self.updated[address] = time.monotonic()
+
+    def forget(self, address: str):
+        self.values.pop(address, None)
+        self.updated.pop(address, None)
+
+    def clear(self):
+        self.values.clear()
+        self.updated.clear()
@@ -0,0 +1,86 @@
+from typing import Iterable, List, Mapping
+
+
+class InvalidInput(ValueError):
+    """A channel, bus or value from the user that can't be used, the user's mistake rather than the program's"""
+
+
+class InvalidName(InvalidInput):
+    """A name, number, alias or group that doesn't name the channels or buses asked for"""
+
+
+def normalize(name: str) -> str:
+    # "Room PA", "room pa" and "roompa" are all the same name
+    return ''.join(name.lower().split())
+
+
+class NameIndex:
+    """Channels or buses by number, name, unique prefix of a name, alias or group, built once per connection.
+
+    aliases map another name to a name or number, groups map a name to a list of names, numbers or aliases.
+    Names and aliases win over groups, which win over prefixes. A prefix of several names is an error, and so is
+    an alias or group that is already a name, alias or group.
+    """
+
+    def __init__(self, kind: str, names: List[str], aliases: Mapping[str, str | int] | None = None,
+                 groups: Mapping[str, Iterable[str | int]] | None = None):
+        self.kind = kind
+        self.names = names
+
+        self.exact: dict[str, int] = {}
+        for i, name in enumerate(names):
+            self.exact.setdefault(normalize(name), i)
+
+        # every prefix of every name, with all names it starts
+        self.prefixes: dict[str, List[int]] = {}
+        for key, i in self.exact.items():
+            for end in range(1, len(key)):
+                self.prefixes.setdefault(key[:end], []).append(i)
+
+        self.groups: dict[str, List[int]] = {}
+        for alias, target in (aliases or {}).items():
+            self.exact[self.__new_key('Alias', alias)] = self.resolve(target)
+        for group, members in (groups or {}).items():
+            self.groups[self.__new_key('Group', group)] = [self.resolve(member) for member in members]
+
+    def __new_key(self, what: str, key: str) -> str:
+        # an alias or group must not hide a name, or another alias or group, they'd be silently unreachable
+        normalized = normalize(str(key))
+        if not normalized or normalized.isdecimal():
+            raise ValueError(f"{what} {key!r} can't be empty or a number")
+        if normalized in self.groups:
+            raise ValueError(f"{what} {key} already names a group of {self.plural}")
+        if normalized in self.exact:
+            raise ValueError(f"{what} {key} already names the {self.kind} {self.names[self.exact[normalized]]}")
+        return normalized
+
+    @property
+    def plural(self) -> str:
+        return f"{self.kind}es" if self.kind.endswith('s') else f"{self.kind}s"
+
+    def expand(self, key: str | int) -> List[int]:
+        """Every channel or bus key names, several if it is a group"""
+        if isinstance(key, int) or key.strip().isdecimal():
+            if int(key) < len(self.names):
+                return [int(key)]
+            raise InvalidName(f"Only {len(self.names)} {self.plural} exist, but {key} requested")
+
+        normalized = normalize(key)
+        if normalized in self.exact:
+            return [self.exact[normalized]]
+        if normalized in self.groups:
+            return list(self.groups[normalized])
+
+        matches = self.prefixes.get(normalized)
+        if not matches:
+            raise InvalidName(f"{self.kind.capitalize()} {key} does not exist")
+        if len(matches) > 1:
+            raise InvalidName(f"{self.kind.capitalize()} {key} is ambiguous: {', '.join(self.names[i] for i in matches)}")
+        return matches
+
+    def resolve(self, key: str | int) -> int:
+        """The one channel or bus key names"""
+        found = self.expand(key)
+        if len(found) != 1:
+            raise InvalidName(f"{key} is a group of {len(found)} {self.plural}, name one of them")
+        return found[0]
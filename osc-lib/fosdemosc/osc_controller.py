@@ -1,23 +1,33 @@
-from typing import List, Mapping
-from pythonosc.osc_message_builder import OscMessageBuilder
+from typing import Any, List, Mapping
+from pythonosc.osc_message import OscMessage, ParseError as MessageParseError
+from pythonosc.osc_bundle import OscBundle, ParseError as BundleParseError
 
-from dataclasses import dataclass
 from collections import defaultdict
+from contextlib import contextmanager
+import threading
+import time
 import re
 
+import serial
+
+from .helpers import flatten, answers
+from .protocol import (Channel, Bus, Level, BUNDLE_SIZE, MAX_DATAGRAM, VUMeter, BundleSupport, padinf, vu_meter, vu_meters, build,
+                       bundle, mix_address, multiplier_address, levels_address, mix_addresses, matrices,
+                       mirrored_addresses, chunks, pack, match_replies, first_params, changed, check_dropped, parse_info,
+                       topology_of, ConnectionFailed)
+from .matrix import MixMatrix
+from .mirror import StateMirror
+from .names import NameIndex, InvalidInput
+from . import topology
+from .topology import TopologyChanged
 from .slip_client import SLIPClient
 from .udp_client import ParsingUDPClient
 
-Channel = int
-Bus = int
-Level = float
-
 SERIAL_READ_TIMEOUT: float | None = 1
 SERIAL_WRITE_TIMEOUT: float | None = 1
 
-def padinf(x: float) -> float:
-    # Note: checking `math.isinf(x) and x < 0` should be faster
-    return -60 if x == float('-inf') else x
+# what the clients raise when the mixer doesn't answer, see ParsingUDPClient
+TIMEOUTS = (serial.SerialTimeoutException, TimeoutError)
 
 
 def groups(regex, val):
@@ -30,47 +40,238 @@ def groups_all(regex, vals):
         if matches:
             yield matches.groups(), k, v
 
-@dataclass
-class VUMeter:
-    peak: float
-    rms: float
-    smooth: float
-
 class OSCController:
     __info: Mapping[str, str]
 
     inputs: List[str]
     outputs: List[str]
+    # resolve names against the cached topology until it was checked, call validate() before to be sure,
+    # requests with numbers worked out from them raise TopologyChanged when their check finds it changed
+    channel_index: NameIndex
+    bus_index: NameIndex
+
+    def __connect(self):
+        """Open the client on the first request, and check a cached topology against the mixer's.
+
+        Failing to open the client or to get an answer to the check raises ConnectionFailed.
+        """
+        if self.client is None:
+            try:
+                self.client = self.__open()
+            except OSError as e:
+                raise ConnectionFailed(f"Cannot open {self._device}: {e}") from e
+
+        if self.__validated:
+            return
+
+        # set while asking, the request for /info comes through here too
+        self.__validated = True
+        try:
+            info = self.__get_info()
+            if info != self.__info:
+                # renamed, rewired or reflashed since it was cached, callers see the new names from now on
+                self.__apply_info(info)
+                self.__save_info()
+                self.__generation += 1
+        except OSError as e:
+            self.__validated = False
+            raise ConnectionFailed(f"No answer from {self._device}: {e}") from e
+        except BaseException:
+            self.__validated = False
+            raise
+
+    def validate(self) -> bool:
+        """Check the cached channels and buses against the mixer now instead of with the first request,
+        returning whether they had changed, also when another thread's check was under way"""
+        generation = self.__generation
+        with self.__lock:
+            self.__connect()
+        return self.__generation != generation
+
+    def __check_topology(self):
+        # numbers the caller worked out from names before the cache was checked may mean other sends now
+        if self.validate():
+            raise TopologyChanged("The mixer's channels or buses changed since they were cached, nothing was sent")
+
+    def __reply_to(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle:
+        while True:
+            reply = self.client.receive_obj()
+            if answers(request, reply):
+                return reply
+            # left over from a request that timed out, or a bundle answered in part
+
+    def __roundtrip(self, request: OscMessage | OscBundle) -> OscMessage | OscBundle:
+        with self.__lock:
+            self.__connect()
+            self.client.send(request)
+            reply = self.__reply_to(request)
+
+        check_dropped(request, reply)
+        return reply
 
     def __send(self, address: str, *args):
-        message = OscMessageBuilder(address)
-        for arg in args:
-            message.add_arg(arg)
-
-        self.client.send(message.build())
-
-        return self.client.receive_obj()
+        return self.__roundtrip(build(address, *args))
+
+    def __send_bundle(self, messages: List[OscMessage]):
+        return self.__roundtrip(bundle(messages))
+
+    def __read(self, address: str):
+        # of a channel or bus the caller names by number, see __check_topology()
+        self.__check_topology()
+        return self.__send(address)
+
+    def __write(self, address: str, value: Any) -> None:
+        self.__check_topology()
+        pending = getattr(self.__local, 'pending', None)
+        if pending is not None:
+            pending[address] = value
+            return
+
+        with self.__lock:
+            self.__send(address, value)
+            if self.mirror is not None:
+                self.mirror.write(address, value)
+
+    def __commit(self, writes: dict[str, Any], skip_unchanged: bool, max_age: float | None) -> None:
+        with self.__lock:
+            if skip_unchanged and writes:
+                current = self.__query_params(list(writes), max_age)
+                writes = changed(writes, current)
+
+            # the mirror takes the whole transaction at once, even when it didn't fit in one bundle
+            sent = {}
+            try:
+                for part in pack(writes):
+                    self.__commit_chunk(part)
+                    sent.update(part)
+            finally:
+                if self.mirror is not None:
+                    for address, value in sent.items():
+                        self.mirror.write(address, value)
+
+    def __commit_chunk(self, writes: dict[str, Any]) -> None:
+        if self.bundles.usable():
+            try:
+                self.__send_bundle([build(address, value) for address, value in writes.items()])
+                self.bundles.succeeded()
+                return
+            except TIMEOUTS:
+                # the mixer may be away, or just the reply lost, the writes below find out
+                pass
+            except (MessageParseError, BundleParseError):
+                # writing the same values again one by one is harmless, whatever part of the bundle was taken
+                self.bundles.failed()
+
+        for address, value in writes.items():
+            self.__send(address, value)
+
+    @contextmanager
+    def transaction(self, skip_unchanged=True, max_age: float | None = None):
+        """Collect all writes made inside the block and send them as one bundle once it exits, or as few as
+        MAX_DATAGRAM allows.
+
+        Writes whose value matches what the mixer already has are skipped, unless skip_unchanged is False. Finding
+        those out costs a bundled read of every written address first, unless the mirror has them from the last
+        max_age seconds. Nothing is sent if the block raises. Nested transactions are merged into the outer one,
+        transactions of other threads (e.g. a RampScheduler's) are kept apart.
+        """
+        if getattr(self.__local, 'pending', None) is not None:
+            yield self
+            return
+
+        self.__check_topology()
+        self.__local.pending = {}
+        try:
+            yield self
+            writes = self.__local.pending
+        finally:
+            self.__local.pending = None
+
+        self.__commit(writes, skip_unchanged, max_age)
+
+    def __query_bundle(self, addresses: List[str]) -> dict[str, List[OscMessage]] | None:
+        try:
+            replies = match_replies(addresses, flatten(self.__send_bundle([build(address) for address in addresses])))
+        except TIMEOUTS:
+            # says nothing about the firmware, the reads one by one find out whether the mixer is there
+            return None
+        except (MessageParseError, BundleParseError):
+            replies = None
+
+        if replies is None or not all(replies.values()):
+            self.bundles.failed()
+            return None
+        self.bundles.succeeded()
+        return replies
+
+    def __query(self, addresses: List[str]) -> dict[str, List[OscMessage]]:
+        """Read all addresses, BUNDLE_SIZE at a time, returning the reply messages for each of them.
+
+        Falls back to one round trip per address for a bundle the firmware doesn't answer properly, see BundleSupport.
+        """
+        replies = {}
+        for chunk in chunks(addresses):
+            with self.__lock:
+                if self.bundles.usable():
+                    bundled = self.__query_bundle(chunk)
+                    if bundled is not None:
+                        replies.update(bundled)
+                        continue
+
+                # replies to the bundle that turn up late are skipped by address, see __reply_to()
+                replies.update({address: list(flatten(self.__send(address))) for address in chunk})
+        return replies
+
+    def __query_params(self, addresses: List[str], max_age: float | None = None) -> dict[str, Any]:
+        """Read all addresses, from the mirror if they were read or written less than max_age seconds ago"""
+        if self.mirror is not None and max_age is not None:
+            mirrored = self.mirror.get(addresses, max_age)
+            if mirrored is not None:
+                return mirrored
+
+        # held until the mirror is updated, so a write can't slip in between and be overwritten with an older value
+        with self.__lock:
+            params = first_params(self.__query(addresses))
+            if self.mirror is not None:
+                self.mirror.update(params)
+        return params
+
+    def __get_mix_matrix(self, name: str, max_age: float | None = None) -> List[List[Any]]:
+        return self.__get_mix_matrices([name], max_age)[name]
+
+    def __get_mix_matrices(self, names: List[str], max_age: float | None = None) -> dict[str, List[List[Any]]]:
+        # every read of the whole mixer goes by the channels and buses it has now
+        self.validate()
+        addresses = mix_addresses(names, self.inputs, self.outputs)
+        params = self.__query_params([address for rows in addresses.values() for row in rows for address in row], max_age)
+        return matrices(addresses, params)
+
+    def __names(self, specifier: str) -> List[str]:
+        return self.inputs if specifier == 'ch' else self.outputs
+
+    def __get_chbus_multipliers(self, specifier: str, max_age: float | None = None) -> dict[str, float]:
+        self.validate()
+        names = self.__names(specifier)
+        addresses = [multiplier_address(specifier, num) for num in range(len(names))]
+        params = self.__query_params(addresses, max_age)
+        return {name: float(params[address]) for name, address in zip(names, addresses)}
+
+    def __get_chbus_vu_meters(self, specifier: str) -> dict[str, VUMeter]:
+        self.validate()
+        names = self.__names(specifier)
+        addresses = [levels_address(specifier, num) for num in range(len(names))]
+        return vu_meters(names, addresses, self.__query(addresses))
 
     def __get_info(self) -> Mapping[str,str]:
-        response = self.__send("/info")
-        return {x.address: x.params[0] for x in response}
-
+        return parse_info(self.__send("/info"))
 
-    def __get_chbus_name(self, specifier: str, num: int) -> str:
-        return self.__info[f"/{specifier}/{num}/config/name"]
 
     def __get_chbus_multiplier(self, specifier: str, num: int) -> float:
-        response = self.__send(f"/{specifier}/{num}/multiplier")
+        response = self.__read(multiplier_address(specifier, num))
         return float(response.params[0])
 
     def __set_chbus_multiplier(self, specifier: str, num: int, multiplier: float):
-        self.__send(f"/{specifier}/{num}/multiplier", float(multiplier))
-
-    def __get_inputs(self) -> List[str]:
-        return [self.__get_chbus_name('ch', x) for x in range(int(self.__info["/info/channels"]))]
-
-    def __get_outputs(self) -> List[str]:
-        return [self.__get_chbus_name('bus', x) for x in range(int(self.__info["/info/buses"]))]
+        self.__write(multiplier_address(specifier, num), float(multiplier))
 
     def get_bus_multiplier(self, bus: Bus) -> float:
         return self.__get_chbus_multiplier('bus', bus)
@@ -89,112 +290,196 @@ class OSCController:
     def device(self) -> str | None:
         return self._device
 
-    def __init__(self, device: str, baud=1152000, mode='serial', read_timeout=SERIAL_READ_TIMEOUT, write_timeout=SERIAL_WRITE_TIMEOUT):
+    def __init__(self, device: str, baud=1152000, mode='serial', read_timeout=SERIAL_READ_TIMEOUT, write_timeout=SERIAL_WRITE_TIMEOUT, use_bundles=True,
+                 mirror=False, reconcile_interval: float | None = None, aliases: Mapping[str, Mapping] | None = None,
+                 groups: Mapping[str, Mapping] | None = None, cache_info=True, cache_dir: str | None = None):
+        """Connects on the first request. With cache_info, the channels and buses the device had last time are known
+        right away, and checked against /info with that first request, see topology.py.
+        """
+        # {'channels': {...}, 'buses': {...}}, see NameIndex
+        self.aliases = aliases or {}
+        self.groups = groups or {}
+        # stops bundling for a while when the firmware keeps failing to answer bundles
+        self.bundles = BundleSupport(use_bundles)
+        # writes collected by an open transaction(), in .pending per thread
+        self.__local = threading.local()
+        # one round trip at a time, the reconciliation thread shares the client
+        self.__lock = threading.RLock()
+        # last known mixes and multipliers, for callers that pass max_age
+        self.mirror = StateMirror() if mirror or reconcile_interval else None
+
         if mode == 'serial':
             self._device = device
-            self.client = SLIPClient(device, baud, timeout=read_timeout, write_timeout=write_timeout)
+            self.__open = lambda: SLIPClient(device, baud, timeout=read_timeout, write_timeout=write_timeout)
         elif mode == 'udp':
             self._device = f"{device}:{baud}"
-            self.client = ParsingUDPClient(device, baud)
+            self.__open = lambda: ParsingUDPClient(device, baud)
         else:
             raise ValueError('mode')
-
-        self.__initialize()
+        self.client: SLIPClient | ParsingUDPClient | None = None
+
+        self.cache_info = cache_info
+        self.cache_dir = cache_dir
+        # how often the mixer turned out to have other channels or buses than were cached
+        self.__generation = 0
+        cached = topology.load_info(self._device, cache_dir) if cache_info else None
+        if cached is not None:
+            try:
+                self.__apply_info(cached)
+                self.__validated = False
+            except Exception:
+                # a truncated or hand-edited file, or aliases and groups naming channels or buses it doesn't have,
+                # ask the mixer instead
+                cached = None
+        if cached is None:
+            self.__validated = True
+            self.__initialize()
+
+        if reconcile_interval:
+            threading.Thread(target=self.__reconcile_loop, args=(reconcile_interval,), daemon=True).start()
 
     def __initialize(self):
-        self.__info = self.__get_info()
-
-        self.inputs = self.__get_inputs()
-        self.outputs = self.__get_outputs()
-
-    def get_matrix(self) -> List[List[float]]:
-        return [[self.get_gain(ch, bus) for bus in range(len(self.outputs))] for ch in range(len(self.inputs))]
-
-    def get_raw_matrix(self) -> List[List[float]]:
-        return [[self.get_raw_gain(ch, bus) for bus in range(len(self.outputs))] for ch in range(len(self.inputs))]
-
-    def mute_matrix(self) -> List[List[bool]]:
-        return [[bool(self.get_muted(ch, bus)) for bus in range(len(self.outputs))] for ch in range(len(self.inputs))]
+        try:
+            info = self.__get_info()
+        except ConnectionFailed:
+            raise
+        except OSError as e:
+            raise ConnectionFailed(f"No answer from {self._device}: {e}") from e
+        self.__apply_info(info)
+        self.__save_info()
+
+    def __apply_info(self, info: Mapping[str, Any]):
+        # the names must fit the aliases and groups before anything changes
+        inputs, outputs = topology_of(info)
+        self.channel_index, self.bus_index = name_indexes(inputs, outputs, self.aliases, self.groups)
+        self.__info = info
+        self.inputs, self.outputs = inputs, outputs
+
+    def __save_info(self):
+        if self.cache_info:
+            topology.save_info(self._device, self.__info, self.cache_dir)
+
+    def reconcile(self) -> int:
+        """Read everything the mirror holds from the mixer, returning how many values had changed behind our back"""
+        if self.mirror is None:
+            return 0
+
+        before = self.mirror.corrections
+        self.validate()
+        self.__query_params(mirrored_addresses(self.inputs, self.outputs))
+        return self.mirror.corrections - before
+
+    def __reconcile_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reconcile()
+            except Exception:
+                # the mixer or proxy is away, the mirror just ages until the next round works
+                pass
+
+    def get_matrix(self, max_age: float | None = None) -> List[List[float]]:
+        return [[Level(x) for x in row] for row in self.__get_mix_matrix('level', max_age)]
+
+    def get_raw_matrix(self, max_age: float | None = None) -> List[List[float]]:
+        return [[Level(x) for x in row] for row in self.__get_mix_matrix('raw', max_age)]
+
+    def mute_matrix(self, max_age: float | None = None) -> List[List[bool]]:
+        return [[bool(x) for x in row] for row in self.__get_mix_matrix('muted', max_age)]
+
+    def get_mix_matrix(self, max_age: float | None = None) -> MixMatrix:
+        """Gains and mutes of every send, read together"""
+        matrices = self.__get_mix_matrices(['level', 'muted'], max_age)
+        return MixMatrix(matrices['level'], matrices['muted'], self.inputs, self.outputs)
 
     def get_bus_vu_meters(self) -> Mapping[Bus, List[VUMeter]]:
-        return {bus: self.get_bus_levels(i) for i, bus in enumerate(self.outputs)}
+        return self.__get_chbus_vu_meters('bus')
 
     def get_channel_vu_meters(self) -> Mapping[Channel, List[VUMeter]]:
-        return {ch: self.get_channel_levels(i) for i, ch in enumerate(self.inputs)}
+        return self.__get_chbus_vu_meters('ch')
+
+    def get_vu_meters(self) -> dict[str, dict[str, VUMeter]]:
+        """Channel and bus meters together, in as few bundles as BUNDLE_SIZE allows (one for up to 12 meters)"""
+        self.validate()
+        channels = [levels_address('ch', num) for num in range(len(self.inputs))]
+        buses = [levels_address('bus', num) for num in range(len(self.outputs))]
+        replies = self.__query(channels + buses)
+        return {
+            'input': vu_meters(self.inputs, channels, replies),
+            'output': vu_meters(self.outputs, buses, replies),
+        }
 
-    def get_bus_multipliers(self) -> Mapping[Bus, float]:
-        return {bus: self.get_bus_multiplier(i) for i, bus in enumerate(self.outputs)}
+    def get_bus_multipliers(self, max_age: float | None = None) -> Mapping[Bus, float]:
+        return self.__get_chbus_multipliers('bus', max_age)
 
-    def get_channel_multipliers(self) -> Mapping[Channel, float]:
-        return {ch: self.get_channel_multiplier(i) for i, ch in enumerate(self.inputs)}
+    def get_channel_multipliers(self, max_age: float | None = None) -> Mapping[Channel, float]:
+        return self.__get_chbus_multipliers('ch', max_age)
 
     def get_gain(self, channel: Channel, bus: Bus) -> Level:
-        response = self.__send(f"/ch/{channel}/mix/{bus}/level")
+        response = self.__read(mix_address(channel, bus, 'level'))
         return Level(response.params[0])
 
     def get_raw_gain(self, channel: Channel, bus: Bus) -> Level:
-        response = self.__send(f"/ch/{channel}/mix/{bus}/raw")
+        response = self.__read(mix_address(channel, bus, 'raw'))
         return Level(response.params[0])
 
     def set_gain(self, channel: Channel, bus: Bus, level: Level) -> None:
-        self.__send(f"/ch/{channel}/mix/{bus}/level", Level(level))
+        self.__write(mix_address(channel, bus, 'level'), Level(level))
 
     def get_muted(self, channel: Channel, bus: Bus) -> bool:
-        response = self.__send(f"/ch/{channel}/mix/{bus}/muted")
+        response = self.__read(mix_address(channel, bus, 'muted'))
         return bool(response.params[0])
 
     def set_muted(self, channel: Channel, bus: Bus, muted: bool) -> None:
-        self.__send(f"/ch/{channel}/mix/{bus}/muted", bool(muted))
+        self.__write(mix_address(channel, bus, 'muted'), bool(muted))
 
     def get_channel_levels(self, channel: Channel) -> VUMeter:
-        response = self.__send(f"/ch/{channel}/levels")
-        return VUMeter(**{x.address.rsplit("/", 1)[-1]: padinf(x.params[0]) for x in response})
+        return vu_meter(self.__read(levels_address('ch', channel)))
 
     def get_bus_levels(self, bus: Bus) -> VUMeter:
-        response = self.__send(f"/bus/{bus}/levels")
-        return VUMeter(**{x.address.rsplit("/", 1)[-1]: padinf(x.params[0]) for x in response})
+        return vu_meter(self.__read(levels_address('bus', bus)))
 
-    def get_state(self):
+    def get_state(self, max_age: float | None = None):
+        """Mutes and multipliers, answered from the mirror if it has all of them from the last max_age seconds"""
         return {
-            'mutes': self.get_mutes(),
+            'mutes': self.get_mutes(max_age),
             'multipliers': {
-                'input': self.get_channel_multipliers(),
-                'output': self.get_bus_multipliers(),
+                'input': self.get_channel_multipliers(max_age),
+                'output': self.get_bus_multipliers(max_age),
             },
         }
 
-    def get_mutes(self) -> dict[str, dict[str, bool]]:
-        return {ch: {bus: self.get_muted(i, j) for j, bus in enumerate(self.outputs)} for i, ch in enumerate(self.inputs)}
+    def get_mutes(self, max_age: float | None = None) -> dict[str, dict[str, bool]]:
+        mutes = self.mute_matrix(max_age)
+        return {ch: {bus: mutes[i][j] for j, bus in enumerate(self.outputs)} for i, ch in enumerate(self.inputs)}
 
     def reset(self):
-        self.__send("/factoryreset")
-
+        with self.__lock:
+            self.__send("/factoryreset")
+            if self.mirror is not None:
+                self.mirror.clear()
 
-def parse_bus(osc: OSCController, bus: str | int) -> Bus:
-    if isinstance(bus, int) or bus.isdecimal():
-        if Bus(bus) < len(osc.outputs):
-            return Bus(bus)
-        raise ValueError(f"Only {len(osc.inputs)} buses exist, but {bus} requested")
 
-    else:  # not bus.isdecimal():
-        for i, x in enumerate(osc.outputs):
-            if x.lower().strip() == bus.lower().strip() or x.lower().replace(" ", "").strip() == bus.lower().strip():
-                return Bus(i)
+def name_indexes(inputs: List[str], outputs: List[str], aliases: Mapping[str, Mapping],
+                 groups: Mapping[str, Mapping]) -> tuple[NameIndex, NameIndex]:
+    return (NameIndex('channel', inputs, aliases.get('channels'), groups.get('channels')),
+            NameIndex('bus', outputs, aliases.get('buses'), groups.get('buses')))
 
-        raise ValueError(f"Bus {bus} does not exist")
+def parse_bus(osc: OSCController, bus: str | int) -> Bus:
+    return Bus(osc.bus_index.resolve(bus))
 
-def parse_channel(osc: OSCController, channel: str | int) -> Channel | None:
-    if isinstance(channel, int) or channel.isdecimal():
-        if Channel(channel) < len(osc.inputs):
-            return Channel(channel)
-        raise ValueError(f"Only {len(osc.inputs)} channels exist, but {channel} requested")
+def parse_channel(osc: OSCController, channel: str | int) -> Channel:
+    return Channel(osc.channel_index.resolve(channel))
 
-    else:  # not channel.isdecimal()
-        for i, x in enumerate(osc.inputs):
-            if x.lower().strip() == channel.lower().strip() or x.lower().replace(" ", "").strip() == channel.lower().strip():
-                return Channel(i)
+def parse_buses(osc: OSCController, buses: str | int) -> List[Bus]:
+    """Every bus a number, name, alias or group names"""
+    return [Bus(x) for x in osc.bus_index.expand(buses)]
 
-        raise ValueError(f"Channel {channel} does not exist")
+def parse_channels(osc: OSCController, channels: str | int) -> List[Channel]:
+    return [Channel(x) for x in osc.channel_index.expand(channels)]
 
 def parse_level(osc: OSCController, level: str | float) -> Level:
-    return Level(level)
+    try:
+        return Level(level)
+    except (TypeError, ValueError) as e:
+        raise InvalidInput(f"Invalid level {level!r}") from e
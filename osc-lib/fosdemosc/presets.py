@@ -1,6 +1,8 @@
-presets: dict[str, list[list[float]]] = {}
+from .matrix import MixMatrix
 
-presets['default'] = [
+presets: dict[str, MixMatrix] = {}
+
+presets['default'] = MixMatrix([
     # room PA
     [0.0, 0.0, 0.0, 0.0, 1.0, 0.0],
 
@@ -14,9 +16,9 @@ presets['default'] = [
     # USB out
     [1.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 1.0, 0.0, 0.0, 0.0, 0.0],
-]
+])
 
-presets['usb-afl'] = [
+presets['usb-afl'] = MixMatrix([
     # room PA
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0], 
     # livestream
@@ -27,23 +29,23 @@ presets['usb-afl'] = [
     # USB 
     [0.0, 0.0, 1.0, 0.0, 0.0, 0.0], 
     [0.0, 0.0, 0.0, 1.0, 0.0, 0.0], 
-]
+])
 
-presets['all-100'] = [
+presets['all-100'] = MixMatrix([
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
     [1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
-]
+])
 
 
-presets['all-0'] = [
+presets['all-0'] = MixMatrix([
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
     [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
-]
+])
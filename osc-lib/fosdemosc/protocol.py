@@ -0,0 +1,188 @@
+from typing import Any, Iterable, Iterator, List, Mapping
+from dataclasses import dataclass
+import time
+
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_bundle import OscBundle
+
+from .helpers import flatten, same_value, is_dropped
+
+# What OSCController and AsyncOSCController send and how they read the replies, so only their I/O is written twice
+
+Channel = int
+Bus = int
+Level = float
+
+# The threaded proxy reads datagrams into buffers this size (see proxy.run_udp_listener), a longer bundle arrives
+# cut off and can't be parsed. About 30 writes fit, a transaction with more is sent in as few bundles as it takes.
+MAX_DATAGRAM = 1024
+# How many queries go into one bundle. Replies are much longer than queries (three messages per /levels), this
+# keeps those well below MAX_DATAGRAM too
+BUNDLE_SIZE = 12
+# bundles in a row the firmware may answer with something unparsable or incomplete before the
+# controllers stop sending them, and seconds until they try again
+BUNDLE_FAILURES = 3
+BUNDLE_RETRY = 300
+
+
+class ConnectionFailed(OSError):
+    """Opening the client, or the first exchange with the mixer, failed"""
+
+
+class Dropped(Exception):
+    """The proxy answered a read without sending it on: the client was rate limited, or metering was too late"""
+
+
+class BundleSupport:
+    """Whether to bundle queries and writes, going by how the firmware answered bundles so far.
+
+    Only answers that don't parse or lack replies count against bundles, a timeout says nothing about the
+    firmware. After `failures` of them in a row no bundles are sent for `retry` seconds, then one is tried again.
+    """
+
+    def __init__(self, enabled=True, failures=BUNDLE_FAILURES, retry=BUNDLE_RETRY):
+        self.enabled = enabled
+        self.failures = failures
+        self.retry = retry
+        self.failed_in_row = 0
+        self.paused_until = 0.0
+
+    def usable(self) -> bool:
+        return self.enabled and time.monotonic() >= self.paused_until
+
+    def succeeded(self):
+        self.failed_in_row = 0
+
+    def failed(self):
+        self.failed_in_row += 1
+        if self.failed_in_row >= self.failures:
+            self.paused_until = time.monotonic() + self.retry
+
+
+def check_dropped(request: OscMessage | OscBundle, reply: OscMessage | OscBundle):
+    # see helpers.dropped_reply()
+    if is_dropped(reply):
+        raise Dropped(f"The proxy dropped {next(flatten(request)).address}")
+
+
+def padinf(x: float) -> float:
+    # Note: checking `math.isinf(x) and x < 0` should be faster
+    return -60 if x == float('-inf') else x
+
+
+@dataclass
+class VUMeter:
+    peak: float
+    rms: float
+    smooth: float
+
+
+def vu_meter(messages: OscMessage | OscBundle | Iterable[OscMessage]) -> VUMeter:
+    # a /levels reply as it came, or the messages match_replies() found for it
+    if isinstance(messages, (OscMessage, OscBundle)):
+        messages = flatten(messages)
+    return VUMeter(**{x.address.rsplit("/", 1)[-1]: padinf(x.params[0]) for x in messages})
+
+
+def build(address: str, *args) -> OscMessage:
+    message = OscMessageBuilder(address)
+    for arg in args:
+        message.add_arg(arg)
+
+    return message.build()
+
+
+def bundle(messages: Iterable[OscMessage]) -> OscBundle:
+    builder = OscBundleBuilder(IMMEDIATELY)
+    for message in messages:
+        builder.add_content(message)
+
+    return builder.build()
+
+
+def mix_address(channel: Channel, bus: Bus, name: str) -> str:
+    return f"/ch/{channel}/mix/{bus}/{name}"
+
+
+def multiplier_address(specifier: str, num: int) -> str:
+    return f"/{specifier}/{num}/multiplier"
+
+
+def levels_address(specifier: str, num: int) -> str:
+    return f"/{specifier}/{num}/levels"
+
+
+def mix_addresses(names: Iterable[str], inputs: List[str], outputs: List[str]) -> dict[str, List[List[str]]]:
+    """Addresses of every send, a matrix of them for each of names ('level', 'raw' or 'muted')"""
+    return {name: [[mix_address(ch, bus, name) for bus in range(len(outputs))] for ch in range(len(inputs))]
+            for name in names}
+
+
+def matrices(addresses: Mapping[str, List[List[str]]], params: Mapping[str, Any]) -> dict[str, List[List[Any]]]:
+    # mix_addresses() filled in with what was read
+    return {name: [[params[address] for address in row] for row in rows] for name, rows in addresses.items()}
+
+
+def mirrored_addresses(inputs: List[str], outputs: List[str]) -> List[str]:
+    """Everything a StateMirror holds, see reconcile()"""
+    return ([address for rows in mix_addresses(('level', 'raw', 'muted'), inputs, outputs).values()
+             for row in rows for address in row] +
+            [multiplier_address('ch', ch) for ch in range(len(inputs))] +
+            [multiplier_address('bus', bus) for bus in range(len(outputs))])
+
+
+def chunks(addresses: List[str], size=BUNDLE_SIZE) -> Iterator[List[str]]:
+    for i in range(0, len(addresses), size):
+        yield addresses[i:i + size]
+
+
+def pack(writes: Mapping[str, Any], limit=MAX_DATAGRAM) -> Iterator[dict[str, Any]]:
+    """writes split into as few bundles as stay within limit bytes, in order"""
+    # '#bundle', the time tag, then a size and the message for each
+    size, part = 16, {}
+    for address, value in writes.items():
+        length = 4 + len(build(address, value).dgram)
+        if part and size + length > limit:
+            yield part
+            size, part = 16, {}
+        size += length
+        part[address] = value
+    if part:
+        yield part
+
+
+def match_replies(addresses: Iterable[str], messages: Iterable[OscMessage]) -> dict[str, List[OscMessage]]:
+    # replies either have the queried address, or are one level below it (e.g. /ch/0/levels/peak)
+    replies = {address: [] for address in addresses}
+    for message in messages:
+        address = message.address
+        if address not in replies:
+            address = address.rsplit("/", 1)[0]
+        if address in replies:
+            replies[address].append(message)
+    return replies
+
+
+def first_params(replies: Mapping[str, List[OscMessage]]) -> dict[str, Any]:
+    return {address: messages[0].params[0] for address, messages in replies.items()}
+
+
+def vu_meters(names: List[str], addresses: List[str], replies: Mapping[str, List[OscMessage]]) -> dict[str, VUMeter]:
+    return {name: vu_meter(replies[address]) for name, address in zip(names, addresses)}
+
+
+def changed(writes: Mapping[str, Any], current: Mapping[str, Any]) -> dict[str, Any]:
+    """The writes of a transaction that would change what the mixer has"""
+    return {address: value for address, value in writes.items() if not same_value(current[address], value)}
+
+
+def parse_info(response: OscMessage | OscBundle) -> dict[str, Any]:
+    return {x.address: x.params[0] for x in flatten(response)}
+
+
+def topology_of(info: Mapping[str, Any]) -> tuple[List[str], List[str]]:
+    """Names of the channels and buses in what /info answered"""
+    return ([info[f"/ch/{x}/config/name"] for x in range(int(info["/info/channels"]))],
+            [info[f"/bus/{x}/config/name"] for x in range(int(info["/info/buses"]))])
@@ -2,22 +2,40 @@
 
 import os
 import os.path
+import math
 import time
-from typing import Dict, Any, Union
-from dataclasses import dataclass
+from typing import Dict, Any, Union, List
+from dataclasses import dataclass, field
+from collections import deque
 
 import logging
 import socket
 import multiprocessing
+import queue
 from queue import SimpleQueue
 import select
 
 from pythonosc.osc_bundle import OscBundle
 from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
 
 import serial
-from .helpers import parse_osc_bytes
+from .helpers import parse_osc_bytes, flatten, is_read, answers, dropped_reply
+from .protocol import MAX_DATAGRAM
 from .slip_client import SLIPClient
+from .cache import ResponseCache, DEFAULT_TTLS, parse_ttl
+from .subscriptions import Subscriptions, Topic, DEFAULT_INTERVAL, DEFAULT_LEASE, MIN_INTERVAL
+from .scheduler import RequestQueues, METERING_DEADLINE
+from .clients import ClientRegistry, CLIENT_RATE, CLIENT_BURST, IDLE_TIMEOUT
+from .stats import ProxyStats, prometheus_name, prometheus_metric, by_label, serve_metrics
+
+# how often cache and queue statistics end up in the log
+REPORT_INTERVAL = 60
+# seconds between sweeps of idle UDP clients in the listener
+CLEANUP_INTERVAL = 3
+# default port for --metrics-port
+METRICS_PORT = 9124
 
 class UdpClient:
     def __init__(self, sock, addr):
@@ -29,24 +47,416 @@ class UdpClient:
         self.sock.sendto(content.dgram, self.addr)
 
 
+class UdpClients:
+    """UdpClient objects by address, kept for as long as the client keeps talking"""
+
+    def __init__(self, sock, idle_timeout=IDLE_TIMEOUT):
+        self.sock = sock
+        self.idle_timeout = idle_timeout
+        self.clients: dict[Any, UdpClient] = {}
+        self.cleaned = time.monotonic()
+
+    def get(self, addr) -> UdpClient:
+        client = self.clients.get(addr)
+        if client is None:
+            client = self.clients[addr] = UdpClient(self.sock, addr)
+        client.last = time.time()
+        return client
+
+    def cleanup(self, force=False) -> List[UdpClient]:
+        if not force and time.monotonic() - self.cleaned < CLEANUP_INTERVAL:
+            return []
+        self.cleaned = time.monotonic()
+
+        now = time.time()
+        idle = [client for client in self.clients.values() if now - client.last > self.idle_timeout]
+        for client in idle:
+            del self.clients[client.addr]
+        return idle
+
+
+class LocalHost:
+    """Stands in for a client when the proxy itself wants the answer"""
+
+    def __init__(self, addr: str, callback, dropped=None):
+        self.addr = addr
+        self.callback = callback
+        # called instead if the request is never sent
+        self.dropped = dropped
+
+    def send(self, content: OscMessage | OscBundle):
+        self.callback(content)
+
+
 @dataclass
 class DataItem:
     host: UdpClient
     data: OscMessage | OscBundle
+    received: float = field(default_factory=time.monotonic)
+    # don't send to the mixer after this (monotonic) time
+    deadline: float | None = None
 
 def dictify(obj: OscMessage | OscBundle | None):
     if obj is None:
         return None
     elif isinstance(obj, OscBundle):
-        return {x.address: x.params[0] if len(x.params) else None for x in obj}
+        return {x.address: x.params[0] if len(x.params) else None for x in flatten(obj)}
     else:
         return {obj.address: obj.params[0] if len(obj.params) else None}
 
 
-def run_serial(requests, responses, device):
+@dataclass
+class InFlight:
+    data: OscMessage | OscBundle
+    items: List[DataItem]
+    sent: float
+    generation: int
+
+def fetch(requests, submit, block: bool, timeout: float | None = None):
+    try:
+        if block:
+            submit(requests.get(timeout=timeout))
+        while True:
+            submit(requests.get_nowait())
+    except queue.Empty:
+        pass
+
+def stats_reply(prefix: str, stats: dict[str, Any]) -> OscBundle:
+    bundle = OscBundleBuilder(IMMEDIATELY)
+    for name, value in stats.items():
+        message = OscMessageBuilder(f"{prefix}/{name}")
+        message.add_arg(value)
+        bundle.add_content(message.build())
+    return bundle.build()
+
+def is_query(obj: OscMessage | OscBundle, address: str) -> bool:
+    return isinstance(obj, OscMessage) and obj.address == address
+
+def positive(value: Any) -> float | None:
+    # a finite number above zero from a client, or None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and value > 0 else None
+
+def build_message(address: str, *args) -> OscMessage:
+    message = OscMessageBuilder(address)
+    for arg in args:
+        message.add_arg(arg)
+    return message.build()
+
+
+class Dispatcher:
+    """Decides what goes to the mixer and who gets the answers, independent of how the proxy does its I/O.
+
+    Engines feed it requests through submit(), send whatever next_batch() returns, and hand every
+    response from the mixer to response(). Answers go out through the reply callback.
+    """
+
+    def __init__(self, reply, window=4, cache_ttls=DEFAULT_TTLS, metering_deadline=METERING_DEADLINE,
+                 client_rate=CLIENT_RATE, client_burst=CLIENT_BURST):
+        self.log = logging.getLogger('SLIP')
+        # dictify() on every message is expensive, only do it when it ends up in the log
+        self.debug = self.log.isEnabledFor(logging.DEBUG)
+        self.reply = reply
+        self.window = window
+        self.stats = ProxyStats()
+        self.cache = ResponseCache(cache_ttls)
+        self.reported = time.monotonic()
+        self.subscriptions = Subscriptions()
+        self.clients = ClientRegistry(client_rate, client_burst)
+
+        # requests not sent yet, and requests waiting for the mixer
+        self.pending = RequestQueues(metering_deadline, self.clients.usage)
+        self.in_flight: deque[InFlight] = deque()
+        # when the mixer last answered, to tell link time from time spent queued behind others
+        self.last_response = 0.0
+
+    def idle(self) -> bool:
+        return not (self.pending or self.in_flight)
+
+    def submit(self, msg: DataItem):
+        self.stats.requests += 1
+        if not isinstance(msg.host, LocalHost) and not self.clients.admit(msg.host.addr):
+            self.stats.rate_limited += 1
+            if self.debug:
+                self.log.debug(f"Rate limited {msg.host.addr}: {dictify(msg.data)}")
+            # answered right away, so the client backs off instead of waiting for its timeout
+            self.reply(DataItem(host=msg.host, data=dropped_reply(msg.data)))
+            return
+
+        self.pending.push(msg)
+        self.stats.queue_depth.observe(len(self.pending))
+
+    def poll(self) -> float | None:
+        """Queue the subscription polls that are due, returning the seconds until the next one"""
+        for topic in self.subscriptions.due():
+            self.log.debug(f"Polling {topic.address} for {len(topic.subscribers)} subscribers")
+            host = LocalHost(f"subscription {topic.address}",
+                             lambda x, topic=topic: self.__publish(topic, x),
+                             lambda topic=topic: self.subscriptions.dropped(topic))
+            self.pending.push(DataItem(host=host, data=topic.request, deadline=time.monotonic() + topic.interval))
+        return self.subscriptions.next_due()
+
+    def next_batch(self) -> List[OscMessage | OscBundle]:
+        """Take pending requests until the window is full, returning the ones to send to the mixer"""
+        batch = []
+        while len(self.in_flight) < self.window:
+            # keep a slot free for writes, so they never wait behind a window full of metering
+            msg = self.pending.pop(self.__expired, metering=self.window == 1 or len(self.in_flight) < self.window - 1)
+            if msg is None:
+                break
+
+            if is_query(msg.data, '/proxy/stats'):
+                self.__deliver(DataItem(host=msg.host, data=stats_reply('/proxy/stats', self.stats.report())))
+                continue
+
+            if is_query(msg.data, '/proxy/cache'):
+                self.__deliver(DataItem(host=msg.host, data=stats_reply('/proxy/cache', self.cache.stats())))
+                continue
+
+            if is_query(msg.data, '/proxy/queues'):
+                self.__deliver(DataItem(host=msg.host, data=stats_reply('/proxy/queues', self.pending.report())))
+                continue
+
+            if is_query(msg.data, '/proxy/clients'):
+                self.__deliver(DataItem(host=msg.host, data=stats_reply('/proxy/clients', self.__client_report())))
+                continue
+
+            if is_query(msg.data, '/subscribe') or is_query(msg.data, '/unsubscribe'):
+                self.__subscription(msg)
+                continue
+
+            if is_read(msg.data):
+                cached = self.cache.get(msg.data)
+                if cached is not None:
+                    if self.debug:
+                        self.log.debug(f"Answered from cache for {msg.host.addr}: {dictify(msg.data)}")
+                    self.__deliver(DataItem(host=msg.host, data=cached))
+                    continue
+            else:
+                self.cache.invalidate(msg.data)
+
+            if self.__coalesce(msg):
+                if self.debug:
+                    self.log.debug(f"Coalesced request from {msg.host.addr}: {dictify(msg.data)}")
+                continue
+
+            if self.debug:
+                self.log.debug(f"Sending queued message: {dictify(msg.data)}")
+            self.in_flight.append(InFlight(data=msg.data, items=[msg], sent=time.monotonic(), generation=self.cache.generation))
+            batch.append(msg.data)
+        return batch
+
+    def response(self, response: OscMessage | OscBundle):
+        entry = self.__pop_answered(response)
+        if entry is None:
+            self.stats.unsolicited += 1
+            self.log.warning(f"Dropping response nobody asked for: {dictify(response)}")
+            return
+
+        # the link was busy with this since it was sent, or since the previous answer if that came later
+        now = time.monotonic()
+        busy = now - max(entry.sent, self.last_response)
+        self.last_response = now
+        self.stats.responses += 1
+        self.stats.busy += busy
+        self.stats.rtt_ms.observe((now - entry.sent) * 1000)
+        for item in entry.items:
+            self.clients.charge(item.host.addr, busy / len(entry.items))
+
+        if is_query(entry.data, '/info'):
+            self.__learn_topology(response)
+
+        if is_read(entry.data):
+            self.cache.put(entry.data, response, entry.generation)
+        else:
+            self.cache.write_through(response, entry.generation)
+
+        # reads queued while this one was in flight get the same answer
+        self.__take_identical(entry)
+
+        for item in entry.items:
+            if self.debug:
+                self.log.debug(f"Received response for {item.host.addr} after {(now - entry.sent) * 1000:.1f} ms: {dictify(response)}")
+            self.__deliver(DataItem(host=item.host, data=response))
+
+    def timeout(self):
+        """The mixer went quiet, nothing in flight is going to be answered"""
+        for entry in self.in_flight:
+            self.stats.timeouts += 1
+            for item in entry.items:
+                self.log.error(f"BUGBUG: Command from {item.host.addr} without a response: {dictify(entry.data)}")
+        self.log.error(f"Either mixer firmware is too old, or it is dead")
+        self.in_flight.clear()
+
+    def requeue(self):
+        """The serial connection is being restarted, send everything in flight again"""
+        self.log.warning("Restarting serial connection, requeueing messages")
+        items = [item for entry in self.in_flight for item in entry.items]
+        self.pending.push_front(items)
+        self.in_flight.clear()
+        self.stats.reconnects += 1
+        self.stats.requeued += len(items)
+
+        # the mixer may have been power cycled
+        self.cache.clear()
+
+    def report(self):
+        if time.monotonic() - self.reported > REPORT_INTERVAL:
+            self.reported = time.monotonic()
+            self.log.info(f"Link: {self.stats.report()}")
+            self.log.info(f"Response cache: {self.cache.stats()}")
+            self.log.info(f"Request queues: {self.pending.report()}")
+
+            for client in self.clients.evict_idle():
+                self.log.info(f"Forgetting idle client {client.addr} after {client.requests} requests")
+            for client in self.clients.clients.values():
+                if client.limited:
+                    self.log.warning(f"Client {client.addr} was rate limited {client.limited} times out of {client.requests} requests")
+
+    def metrics(self) -> str:
+        """Everything in /proxy/stats, /proxy/queues, /proxy/cache and /proxy/clients, in Prometheus text format"""
+        lines = []
+        for name, value in self.stats.counters().items():
+            lines += prometheus_metric(f"{name}_total", 'counter', value)
+        lines += self.stats.rtt_ms.prometheus(prometheus_name('rtt_ms'))
+        lines += self.stats.queue_depth.prometheus(prometheus_name('queue_depth'))
+
+        for name, value in self.cache.stats().items():
+            if name == 'entries':
+                lines += prometheus_metric('cache_entries', 'gauge', value)
+            else:
+                lines += prometheus_metric(f"cache_{name}_total", 'counter', value)
+
+        # the queue_depth histogram is sampled on every request, this is the depth right now
+        metrics = {'depth': ('queue_pending', 'gauge'), 'sent': ('queue_sent_total', 'counter'),
+                   'dropped': ('queue_dropped_total', 'counter')}
+        for name, samples in by_label(self.pending.report()).items():
+            if name in metrics:
+                lines += prometheus_metric(*metrics[name], samples, label='class')
+
+        metrics = {'requests': ('client_requests_total', 'counter'), 'limited': ('client_limited_total', 'counter'),
+                   'serial_ms': ('client_serial_ms_total', 'counter'), 'rate': ('client_rate', 'gauge')}
+        for name, samples in by_label(self.__client_report()).items():
+            if name in metrics:
+                lines += prometheus_metric(*metrics[name], samples, label='client')
+        return '\n'.join(lines) + '\n'
+
+    def __client_report(self) -> dict[str, Any]:
+        stats = {}
+        # copied first, the metrics endpoint calls this from another thread
+        for client in list(self.clients.clients.values()):
+            name = ':'.join(str(x) for x in client.addr) if isinstance(client.addr, tuple) else str(client.addr)
+            stats[f"{name}/requests"] = client.requests
+            stats[f"{name}/limited"] = client.limited
+            stats[f"{name}/rate"] = self.clients.request_rate(client.addr)
+            stats[f"{name}/serial_ms"] = client.serial_time * 1000
+            stats[f"{name}/idle_s"] = time.monotonic() - client.last_seen
+        return stats
+
+    def __expired(self, msg: DataItem):
+        if isinstance(msg.host, LocalHost):
+            if msg.host.dropped:
+                msg.host.dropped()
+            return
+
+        # an old answer is still better than making the client wait for its timeout, and so is no answer
+        stale = self.cache.get_stale(msg.data)
+        if stale is not None:
+            self.__deliver(DataItem(host=msg.host, data=stale))
+        else:
+            self.log.debug(f"Dropped expired request from {msg.host.addr}: {dictify(msg.data)}")
+            self.__deliver(DataItem(host=msg.host, data=dropped_reply(msg.data)))
+
+    def __deliver(self, item: DataItem):
+        if isinstance(item.host, LocalHost):
+            item.host.send(item.data)
+        else:
+            self.reply(item)
+
+    def __subscription(self, msg: DataItem):
+        """Handle `/subscribe <address> [interval ms] [lease s]` and `/unsubscribe <address>`"""
+        params = msg.data.params
+        if not params or not isinstance(params[0], str):
+            self.log.warning(f"Malformed subscription from {msg.host.addr}: {dictify(msg.data)}")
+            self.__deliver(DataItem(host=msg.host, data=build_message(msg.data.address)))
+            return
+
+        address = params[0]
+        if msg.data.address == '/unsubscribe':
+            self.subscriptions.unsubscribe(msg.host, address)
+            self.log.info(f"{msg.host.addr} unsubscribed from {address}")
+            self.__deliver(DataItem(host=msg.host, data=build_message('/unsubscribe', address)))
+            return
+
+        interval = positive(params[1]) if len(params) > 1 else DEFAULT_INTERVAL * 1000
+        lease = positive(params[2]) if len(params) > 2 else DEFAULT_LEASE
+        if interval is None or lease is None:
+            # a client's typo must not reach next_batch() as an exception, that would reset the serial link
+            self.log.warning(f"Malformed subscription from {msg.host.addr}: {dictify(msg.data)}")
+            self.__deliver(DataItem(host=msg.host, data=build_message(msg.data.address)))
+            return
+        interval = max(interval / 1000, MIN_INTERVAL)
+
+        self.subscriptions.subscribe(msg.host, address, interval, lease)
+        self.log.debug(f"{msg.host.addr} subscribed to {address} every {interval * 1000:.0f} ms for {lease:.0f} s")
+        self.__deliver(DataItem(host=msg.host, data=build_message('/subscribe', address, int(interval * 1000), int(lease))))
+
+        if self.subscriptions.needs_topology():
+            self.pending.push_front([DataItem(host=LocalHost('topology', self.__learn_topology), data=build_message('/info'))])
+
+    def __learn_topology(self, response: OscMessage | OscBundle):
+        info = {x.address: x.params[0] for x in flatten(response) if len(x.params)}
+        if '/info/channels' in info and '/info/buses' in info:
+            self.subscriptions.set_topology(int(info['/info/channels']), int(info['/info/buses']))
+
+    def __publish(self, topic: Topic, response: OscMessage | OscBundle):
+        for host in self.subscriptions.publish(topic):
+            self.reply(DataItem(host=host, data=response))
+
+    def __coalesce(self, msg: DataItem) -> bool:
+        """Attach msg to an identical read that is already in flight, unless a write was sent after it"""
+        if not is_read(msg.data):
+            return False
+
+        for entry in reversed(self.in_flight):
+            if not is_read(entry.data):
+                return False
+            if entry.data.dgram == msg.data.dgram:
+                entry.items.append(msg)
+                return True
+        return False
+
+    def __take_identical(self, entry: InFlight):
+        """Move pending reads identical to entry onto it"""
+        entry.items.extend(self.pending.take_identical(entry.data))
+
+    def __pop_answered(self, response) -> InFlight | None:
+        for i, entry in enumerate(self.in_flight):
+            if answers(entry.data, response):
+                break
+        else:
+            return None
+
+        # the mixer answers in order, so anything sent before this never got a response
+        for _ in range(i):
+            dropped = self.in_flight.popleft()
+            self.stats.timeouts += 1
+            for item in dropped.items:
+                self.log.error(f"BUGBUG: Command from {item.host.addr} without a response: {dictify(dropped.data)}")
+
+        return self.in_flight.popleft()
+
+
+def run_serial(requests, responses, device, options=None, metrics=None):
     log = logging.getLogger('SLIP')
 
     slip_client = None
+    dispatcher = Dispatcher(responses.put, **(options or {}))
+    if metrics:
+        serve_metrics(dispatcher.metrics, *metrics)
 
     while True:
         while not os.path.exists(device):
@@ -64,59 +474,70 @@ def run_serial(requests, responses, device):
                 continue
 
         try:
-            msg = requests.get()
-            log.debug(f"Sending queued message: {dictify(msg.data)}")
-            slip_client.send(msg.data)
+            next_poll = dispatcher.poll()
+            fetch(requests, dispatcher.submit, block=dispatcher.idle(), timeout=next_poll)
+
+            batch = dispatcher.next_batch()
+            if batch:
+                slip_client.send_many(batch)
+
+            if not dispatcher.in_flight:
+                continue
 
             response = slip_client.receive_obj()
-            log.debug(f"Received response for {msg.host.addr}: {dictify(response)}")
 
-            responses.put(DataItem(host=msg.host, data=response))
+            fetch(requests, dispatcher.submit, block=False)
+            dispatcher.response(response)
         except serial.SerialTimeoutException:  # commands don't return a result
-            log.error(f"BUGBUG: Command from {msg.host.addr} without a response: {dictify(msg.data)}")
-            log.error(f"Either mixer firmware is too old, or it is dead")
+            dispatcher.timeout()
         except Exception as e:
             slip_client = None
-            log.warn("Restarting serial connection, requeueing message")
-            requests.put(msg)
+            dispatcher.requeue()
 
-        # No messages in queue, we can use it to push something to all clients if we want
-        pass
+        dispatcher.report()
 
 def run_udp_sender(requests, responses):
     log = logging.getLogger('UDPS')
+    debug = log.isEnabledFor(logging.DEBUG)
 
     while True:
         msg = responses.get()
-        log.debug(f"Sending queued message {dictify(msg.data)} to {msg.host.addr}")
+        if debug:
+            log.debug(f"Sending queued message {dictify(msg.data)} to {msg.host.addr}")
         msg.host.send(msg.data)
 
 def run_udp_listener(requests, responses, bind_to, port=10024):
     log = logging.getLogger('UDPL')
     log.info(f"Running proxy on UDP {bind_to}:{port}")
+    debug = log.isEnabledFor(logging.DEBUG)
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((bind_to, port))
     sock.setblocking(False)
 
+    clients = UdpClients(sock)
 
     while True:
-        waiting, _, _ = select.select([sock], [], [])
+        waiting, _, _ = select.select([sock], [], [], CLEANUP_INTERVAL)
 
         if not sock in waiting:
+            # No commands received for 3 seconds, run cleanup instead
+            clients.cleanup(force=True)
             continue
 
         try:
-            data, addr = sock.recvfrom(1024)
+            data, addr = sock.recvfrom(MAX_DATAGRAM)
             log.debug(f"Received message from {addr}")
-        except TimeoutError:
-            # No commands received for 3 seconds, run cleanup instead
+        except BlockingIOError:
             continue
 
         osc_data = parse_osc_bytes(data)
 
-        requests.put(DataItem(host=UdpClient(sock, addr), data=osc_data))
-        log.debug(f"queued request from {addr}: {dictify(osc_data)}")
+        requests.put(DataItem(host=clients.get(addr), data=osc_data))
+        for client in clients.cleanup():
+            log.debug(f"Forgot idle client {client.addr}")
+        if debug:
+            log.debug(f"queued request from {addr}: {dictify(osc_data)}")
 
 def main():
     import argparse
@@ -125,6 +546,21 @@ def main():
     parser.add_argument("--uart", "-u", type=str, default='/dev/tty_fosdem_audio_ctl', help="Serial port to bind to (defaults to /dev/tty_fosdem_audio_ctl)")
     parser.add_argument("--port", "-p", type=int, default=10024, help="Port to bind to (defaults to 10024)")
     parser.add_argument("--bind", "-b", default="127.0.0.1", help="Address to bind to (defaults to 127.0.0.1)")
+    parser.add_argument("--window", "-w", type=int, default=4, help="Requests in flight to the mixer at once (defaults to 4)")
+    parser.add_argument("--cache-ttl", "-c", type=parse_ttl, action="append", default=[], metavar="PATTERN=SECONDS",
+                        help="Cache responses for addresses matching PATTERN (e.g. '/ch/*/levels=0.05', 'inf' never expires, 0 disables), may be repeated")
+    parser.add_argument("--no-cache", action="store_true", help="Send every read to the mixer")
+    parser.add_argument("--metering-deadline", type=int, default=int(METERING_DEADLINE * 1000),
+                        help=f"Drop level reads that waited longer than this many ms (defaults to {int(METERING_DEADLINE * 1000)})")
+    parser.add_argument("--client-rate", type=float, default=CLIENT_RATE,
+                        help=f"Requests per second each client may send, 0 for no limit (defaults to {CLIENT_RATE})")
+    parser.add_argument("--client-burst", type=int, default=CLIENT_BURST,
+                        help=f"Requests a client may send at once before --client-rate applies (defaults to {CLIENT_BURST})")
+    parser.add_argument("--engine", "-e", choices=["multiprocessing", "asyncio"], default="multiprocessing",
+                        help="Run UART and UDP in separate processes, or all in one asyncio event loop (defaults to multiprocessing)")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, default=None,
+                        help=f"Serve statistics in Prometheus text format over HTTP on this port (defaults to {METRICS_PORT} if given without a port)")
+    parser.add_argument("--metrics-bind", default="127.0.0.1", help="Address to serve statistics on (defaults to 127.0.0.1)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose logging")
     args = parser.parse_args()
 
@@ -132,10 +568,25 @@ def main():
     ch.setFormatter(logging.Formatter('%(name)s :: %(levelname)s :: %(message)s'))
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, handlers=[ch])
 
+    options = {
+        'window': args.window,
+        'cache_ttls': [] if args.no_cache else args.cache_ttl + DEFAULT_TTLS,
+        'metering_deadline': args.metering_deadline / 1000,
+        'client_rate': args.client_rate,
+        'client_burst': args.client_burst,
+    }
+    metrics = (args.metrics_bind, args.metrics_port) if args.metrics_port else None
+
+    if args.engine == "asyncio":
+        from .proxy_asyncio import run_asyncio
+        logging.getLogger('CTRL').info(f'Proxy PID {os.getpid()}')
+        run_asyncio(args.uart, args.bind, args.port, options, metrics)
+        return
+
     requests = multiprocessing.Queue()
     responses = multiprocessing.Queue()
 
-    uart_process = multiprocessing.Process(target=run_serial, args=(requests, responses, args.uart,))
+    uart_process = multiprocessing.Process(target=run_serial, args=(requests, responses, args.uart, options, metrics,))
     uart_process.start()
     udp_listen_process = multiprocessing.Process(target=run_udp_listener, args=(requests, responses, args.bind, args.port,))
     udp_listen_process.start()
@@ -0,0 +1,155 @@
+import os
+import asyncio
+import logging
+
+import serial
+
+from .helpers import parse_osc_bytes
+from .slip_client import SLIPClient
+from .proxy import Dispatcher, DataItem, UdpClients, dictify
+from .stats import serve_metrics
+
+# same as the read timeout of the multiprocessing engine
+SERIAL_TIMEOUT = 1
+
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine: 'AsyncioEngine'):
+        self.engine = engine
+        self.log = logging.getLogger('UDPL')
+        self.debug = self.log.isEnabledFor(logging.DEBUG)
+
+    def connection_made(self, transport):
+        # transports have the same sendto() as sockets, so UdpClient works as is
+        self.clients = UdpClients(transport)
+
+    def datagram_received(self, data, addr):
+        osc_data = parse_osc_bytes(data)
+        if self.debug:
+            self.log.debug(f"queued request from {addr}: {dictify(osc_data)}")
+
+        self.engine.submit(DataItem(host=self.clients.get(addr), data=osc_data))
+        for client in self.clients.cleanup():
+            self.log.debug(f"Forgot idle client {client.addr}")
+
+
+class AsyncioEngine:
+    """Runs the proxy in one event loop: UDP through a DatagramProtocol, the serial port through add_reader()"""
+
+    def __init__(self, device, options=None):
+        self.log = logging.getLogger('SLIP')
+        self.loop = asyncio.get_running_loop()
+        self.device = device
+
+        self.dispatcher = Dispatcher(self.reply, **(options or {}))
+        self.slip_client: SLIPClient | None = None
+        self.timer: asyncio.TimerHandle | None = None
+        self.poll_timer: asyncio.TimerHandle | None = None
+
+    def reply(self, item: DataItem):
+        item.host.send(item.data)
+
+    def submit(self, item: DataItem):
+        self.dispatcher.submit(item)
+        self.kick()
+
+    def kick(self):
+        """Send whatever fits in the window, and make sure a timeout is pending for it"""
+        if not self.slip_client:
+            return
+
+        if self.poll_timer:
+            self.poll_timer.cancel()
+            self.poll_timer = None
+
+        next_poll = self.dispatcher.poll()
+        if next_poll is not None:
+            self.poll_timer = self.loop.call_later(next_poll, self.kick)
+
+        try:
+            batch = self.dispatcher.next_batch()
+            if batch:
+                self.slip_client.send_many(batch)
+        except serial.SerialTimeoutException:
+            self.dispatcher.timeout()
+        except Exception as e:
+            self.disconnect()
+            return
+
+        if self.dispatcher.in_flight and not self.timer:
+            self.timer = self.loop.call_later(SERIAL_TIMEOUT, self.expired)
+
+        self.dispatcher.report()
+
+    def expired(self):
+        self.timer = None
+        self.dispatcher.timeout()
+        self.kick()
+
+    def readable(self):
+        try:
+            for frame in self.slip_client.receive_available():
+                self.dispatcher.response(parse_osc_bytes(frame))
+        except Exception as e:
+            self.disconnect()
+            return
+
+        # the mixer is alive, restart the timeout for what's still in flight
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.kick()
+
+    def disconnect(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+        if self.slip_client:
+            self.loop.remove_reader(self.slip_client.ser.fileno())
+            try:
+                self.slip_client.ser.close()
+            except Exception:
+                pass
+            self.slip_client = None
+
+        self.dispatcher.requeue()
+        self.loop.create_task(self.connect())
+
+    async def connect(self):
+        while True:
+            while not os.path.exists(self.device):
+                await asyncio.sleep(1)
+
+            try:
+                slip_client = SLIPClient(self.device, baud=1152000, timeout=0, write_timeout=1)
+                self.log.info(f"Opened {self.device}")
+                break
+            except Exception as e:
+                self.log.error(e)
+                self.log.info("Restarting serial connection")
+                await asyncio.sleep(0.5)
+
+        await asyncio.sleep(0.5)
+
+        self.slip_client = slip_client
+        self.loop.add_reader(slip_client.ser.fileno(), self.readable)
+        self.kick()
+
+
+async def serve(device, bind_to, port=10024, options=None, metrics=None):
+    log = logging.getLogger('UDPL')
+
+    engine = AsyncioEngine(device, options)
+    if metrics:
+        # rendering happens in the server's thread, reading the dispatcher's counters as they are
+        serve_metrics(engine.dispatcher.metrics, *metrics)
+    await engine.loop.create_datagram_endpoint(lambda: UdpProtocol(engine), local_addr=(bind_to, port))
+    log.info(f"Running proxy on UDP {bind_to}:{port}")
+
+    await engine.connect()
+    await asyncio.Future()
+
+
+def run_asyncio(device, bind_to, port=10024, options=None, metrics=None):
+    asyncio.run(serve(device, bind_to, port, options, metrics))
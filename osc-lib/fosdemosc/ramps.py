@@ -0,0 +1,266 @@
+import math
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Mapping
+
+from .osc_controller import OSCController, Channel, Bus, Level
+from .async_controller import AsyncOSCController
+from .names import InvalidInput
+
+Cell = tuple[Channel, Bus]
+
+# gain updates per second a ramp sends at most, every running ramp moves on the same tick
+RATE = 25
+# changes smaller than this aren't sent, a slow ramp then sends less often than RATE
+STEP = 1e-3
+
+# how far from the start and towards the end a ramp is at x, from 0 to 1 of its duration
+CURVES: dict[str, Callable[[float], tuple[float, float]]] = {
+    'linear': lambda x: (1 - x, x),
+    # eases in and out, no audible corner at either end
+    'smooth': lambda x: (1 - (1 - math.cos(math.pi * x)) / 2, (1 - math.cos(math.pi * x)) / 2),
+    # keeps the power of two crossfading sends constant
+    'equal-power': lambda x: (math.cos(math.pi * x / 2), math.sin(math.pi * x / 2)),
+}
+
+
+def parse_duration(value: str | float) -> float:
+    """Seconds in '2s', '500ms', '1m' or '1.5', zero or more"""
+    try:
+        seconds = float(value) if not isinstance(value, str) else seconds_in(value.strip().lower())
+    except ValueError as e:
+        raise InvalidInput(f"Invalid duration {value!r}, expected e.g. 2s or 500ms") from e
+
+    # float() takes 'inf' and 'nan' too, neither ever ends
+    if not math.isfinite(seconds) or seconds < 0:
+        raise InvalidInput(f"Invalid duration {value!r}, it must be zero or more seconds")
+    return seconds
+
+
+def seconds_in(text: str) -> float:
+    for suffix, scale in (('ms', 0.001), ('s', 1), ('m', 60)):
+        if text.endswith(suffix):
+            return float(text[:-len(suffix)]) * scale
+    return float(text)
+
+
+@dataclass
+class Ramp:
+    start: Level
+    end: Level
+    began: float
+    duration: float
+    curve: str
+
+    def value(self, now: float) -> Level:
+        if self.duration <= 0 or now >= self.began + self.duration:
+            return self.end
+        start, end = CURVES[self.curve](max(0.0, (now - self.began) / self.duration))
+        return self.start * start + self.end * end
+
+    def done(self, now: float) -> bool:
+        return now >= self.began + self.duration
+
+
+class Ramps:
+    """Running ramps, at most one per send, and the gains they are at on each tick.
+
+    Ticks are every 1/rate seconds on the monotonic clock from when this was created, so they neither drift nor
+    pile up when a tick is late: whatever ticks were missed are skipped. Not thread-safe, the schedulers lock it.
+    """
+
+    def __init__(self, rate=RATE, step=STEP):
+        self.period = 1 / rate
+        self.step = step
+        self.origin = time.monotonic()
+        self.ramps: dict[Cell, Ramp] = {}
+        # gain last sent for each ramping send
+        self.sent: dict[Cell, Level] = {}
+
+    def __len__(self) -> int:
+        return len(self.ramps)
+
+    def start(self, targets: Mapping[Cell, Level], current: Callable[[Cell], Level], duration: float, curve: str):
+        """Ramp every send in targets to its gain, taking over from a ramp already running on it.
+
+        Sends that aren't ramping start from current(cell), the others from where their ramp had got to.
+        """
+        if curve not in CURVES:
+            raise InvalidInput(f"No curve {curve}, only {', '.join(CURVES)}")
+
+        now = time.monotonic()
+        for cell, target in targets.items():
+            start = self.sent[cell] if cell in self.ramps else float(current(cell))
+            self.cancel([cell])
+            if math.isclose(start, target, abs_tol=self.step / 2):
+                continue
+
+            self.ramps[cell] = Ramp(start, float(target), now, duration, curve)
+            self.sent[cell] = start
+
+    def cancel(self, cells: Iterable[Cell] | None = None):
+        """Stop ramping cells, or every send, where they are now"""
+        for cell in list(self.ramps) if cells is None else cells:
+            self.ramps.pop(cell, None)
+            self.sent.pop(cell, None)
+
+    def next_tick(self, now: float) -> float:
+        return self.origin + (math.floor((now - self.origin) / self.period) + 1) * self.period
+
+    def due(self, now: float) -> dict[Cell, Level]:
+        """The gains to send on the tick at now, dropping the ramps that reach their end with it"""
+        values = {}
+        for cell, ramp in list(self.ramps.items()):
+            value = ramp.value(now)
+            done = ramp.done(now)
+            if abs(value - self.sent[cell]) >= self.step or (done and value != self.sent[cell]):
+                values[cell] = value
+                self.sent[cell] = value
+            if done:
+                self.cancel([cell])
+        return values
+
+
+def targets_of(gains: Mapping[Cell, Level] | List[List[Level]]) -> dict[Cell, Level]:
+    # a whole matrix is ramped send by send
+    if isinstance(gains, Mapping):
+        return dict(gains)
+    return {(ch, bus): level for ch, row in enumerate(gains) for bus, level in enumerate(row)}
+
+
+class RampScheduler:
+    """Fades gains of an OSCController from a thread of its own, while there are ramps to run.
+
+    All gains due on a tick are written in one transaction, so they go out together in one bundle, or as few
+    as MAX_DATAGRAM allows. listener, if given, is called with the gains written on every tick.
+    """
+
+    def __init__(self, osc: OSCController, rate=RATE, listener: Callable[[dict[Cell, Level]], None] | None = None):
+        self.osc = osc
+        self.listener = listener
+        self.ramps = Ramps(rate)
+        self.error: Exception | None = None
+
+        self.__lock = threading.Lock()
+        self.__idle = threading.Event()
+        self.__idle.set()
+        self.__thread: threading.Thread | None = None
+
+    def fade(self, gains: Mapping[Cell, Level] | List[List[Level]], duration: float, curve='linear',
+             current: List[List[Level]] | None = None):
+        """Ramp sends to gains, a {(channel, bus): gain} or a whole matrix, over duration seconds.
+
+        current is the matrix the mixer has now, it is read if not given.
+        """
+        if current is None:
+            current = self.osc.get_matrix()
+
+        with self.__lock:
+            self.ramps.start(targets_of(gains), lambda cell: current[cell[0]][cell[1]], duration, curve)
+            if self.ramps and self.__thread is None:
+                self.error = None
+                self.__idle.clear()
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+
+    def cancel(self, cells: Iterable[Cell] | None = None):
+        with self.__lock:
+            self.ramps.cancel(cells)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until every ramp has reached its end, raising what made the last one fail"""
+        finished = self.__idle.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return finished
+
+    def __run(self):
+        while True:
+            with self.__lock:
+                if not self.ramps:
+                    self.__thread = None
+                    self.__idle.set()
+                    return
+                delay = self.ramps.next_tick(time.monotonic()) - time.monotonic()
+
+            if delay > 0:
+                time.sleep(delay)
+
+            with self.__lock:
+                values = self.ramps.due(time.monotonic())
+            if not values:
+                continue
+
+            try:
+                with self.osc.transaction(skip_unchanged=False):
+                    for (channel, bus), value in values.items():
+                        self.osc.set_gain(channel, bus, value)
+            except Exception as e:
+                # the mixer is away, where the sends ended up is anyone's guess
+                with self.__lock:
+                    self.error = e
+                    self.ramps.cancel()
+                continue
+
+            if self.listener is not None:
+                self.listener(values)
+
+
+class AsyncRampScheduler:
+    """RampScheduler for an AsyncOSCController, running its ticks in a task of the event loop"""
+
+    def __init__(self, osc: AsyncOSCController, rate=RATE, listener: Callable[[dict[Cell, Level]], None] | None = None):
+        self.osc = osc
+        self.listener = listener
+        self.ramps = Ramps(rate)
+        self.error: Exception | None = None
+
+        self.__idle = asyncio.Event()
+        self.__idle.set()
+        self.__task: asyncio.Task | None = None
+
+    async def fade(self, gains: Mapping[Cell, Level] | List[List[Level]], duration: float, curve='linear',
+                   current: List[List[Level]] | None = None, max_age: float | None = None):
+        """Ramp sends to gains over duration seconds like RampScheduler.fade(), reading current up to max_age old"""
+        if current is None:
+            current = await self.osc.get_matrix(max_age)
+
+        self.ramps.start(targets_of(gains), lambda cell: current[cell[0]][cell[1]], duration, curve)
+        if self.ramps and self.__task is None:
+            self.error = None
+            self.__idle.clear()
+            self.__task = asyncio.create_task(self.__run())
+
+    def cancel(self, cells: Iterable[Cell] | None = None):
+        self.ramps.cancel(cells)
+
+    async def wait(self):
+        await self.__idle.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def __run(self):
+        try:
+            while self.ramps:
+                await asyncio.sleep(self.ramps.next_tick(time.monotonic()) - time.monotonic())
+
+                values = self.ramps.due(time.monotonic())
+                if not values:
+                    continue
+
+                try:
+                    async with self.osc.transaction(skip_unchanged=False):
+                        for (channel, bus), value in values.items():
+                            await self.osc.set_gain(channel, bus, value)
+                except Exception as e:
+                    self.error = e
+                    self.ramps.cancel()
+                    continue
+
+                if self.listener is not None:
+                    self.listener(values)
+        finally:
+            self.__task = None
+            self.__idle.set()
@@ -0,0 +1,123 @@
+import time
+from typing import Any, Callable, Iterable, List
+from collections import deque
+from dataclasses import dataclass
+
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message import OscMessage
+
+from .helpers import flatten, is_read
+
+# priority classes, lowest number goes first
+CONTROL = 0
+STATE = 1
+METERING = 2
+CLASS_NAMES = ['control', 'state', 'metering']
+
+# metering reads older than this (seconds) are not worth sending anymore
+METERING_DEADLINE = 0.05
+
+def classify(obj: OscMessage | OscBundle) -> int:
+    if not is_read(obj):
+        return CONTROL
+    if all(x.address.endswith('/levels') for x in flatten(obj)):
+        return METERING
+    return STATE
+
+@dataclass
+class ClassStats:
+    sent: int = 0
+    dropped: int = 0
+    wait_total: float = 0
+    wait_max: float = 0
+
+class RequestQueues:
+    """Requests waiting for the mixer: control writes first, then state reads, then metering reads.
+
+    Within a class, the client that used the least serial time lately goes first, according to `usage`.
+    Items need `host`, `data`, `received` and `deadline` attributes. Metering reads without a deadline get
+    one METERING_DEADLINE after they were received, and are handed to `expired` instead of being sent once past it.
+    """
+
+    def __init__(self, metering_deadline=METERING_DEADLINE, usage: Callable[[Any], float] = lambda addr: 0.0):
+        self.metering_deadline = metering_deadline
+        self.usage = usage
+        # per class, a queue for each client that has something waiting
+        self.queues: List[dict[Any, deque]] = [{} for _ in CLASS_NAMES]
+        self.depths = [0 for _ in CLASS_NAMES]
+        self.stats = [ClassStats() for _ in CLASS_NAMES]
+
+    def __len__(self) -> int:
+        return sum(self.depths)
+
+    def push(self, item: Any):
+        cls = classify(item.data)
+        if cls == METERING and item.deadline is None:
+            item.deadline = item.received + self.metering_deadline
+        self.queues[cls].setdefault(item.host.addr, deque()).append(item)
+        self.depths[cls] += 1
+
+    def push_front(self, items: Iterable[Any]):
+        """Put items back in front of their queues, keeping their order"""
+        for item in reversed(list(items)):
+            cls = classify(item.data)
+            self.queues[cls].setdefault(item.host.addr, deque()).appendleft(item)
+            self.depths[cls] += 1
+
+    def pop(self, expired: Callable[[Any], None], metering=True) -> Any | None:
+        now = time.monotonic()
+        for cls, clients in enumerate(self.queues):
+            if cls == METERING and not metering:
+                break
+
+            while clients:
+                addr = min(clients, key=self.usage) if len(clients) > 1 else next(iter(clients))
+                pending = clients[addr]
+                item = pending.popleft()
+                if not pending:
+                    del clients[addr]
+                self.depths[cls] -= 1
+
+                if item.deadline is not None and item.deadline < now:
+                    self.stats[cls].dropped += 1
+                    expired(item)
+                    continue
+
+                stats = self.stats[cls]
+                stats.sent += 1
+                stats.wait_total += now - item.received
+                stats.wait_max = max(stats.wait_max, now - item.received)
+                return item
+        return None
+
+    def take_identical(self, request: OscMessage | OscBundle) -> List[Any]:
+        """Remove and return the queued reads identical to request, unless a write is waiting to go first"""
+        if not is_read(request) or self.depths[CONTROL]:
+            return []
+
+        cls = classify(request)
+        clients = self.queues[cls]
+        taken = []
+        for addr, pending in list(clients.items()):
+            same = [item for item in pending if item.data.dgram == request.dgram]
+            if not same:
+                continue
+
+            taken += same
+            if len(same) == len(pending):
+                del clients[addr]
+            else:
+                clients[addr] = deque(item for item in pending if item.data.dgram != request.dgram)
+
+        self.depths[cls] -= len(taken)
+        return taken
+
+    def report(self) -> dict[str, Any]:
+        stats = {}
+        for name, depth, cls in zip(CLASS_NAMES, self.depths, self.stats):
+            stats[f"{name}/depth"] = depth
+            stats[f"{name}/sent"] = cls.sent
+            stats[f"{name}/dropped"] = cls.dropped
+            stats[f"{name}/wait_avg_ms"] = cls.wait_total / cls.sent * 1000 if cls.sent else 0.0
+            stats[f"{name}/wait_max_ms"] = cls.wait_max * 1000
+        return stats
@@ -1,4 +1,5 @@
-from typing import Union
+from collections import deque
+from typing import Iterable, List, Union
 
 import serial
 from pythonosc.osc_bundle import OscBundle
@@ -6,49 +7,96 @@ from pythonosc.osc_message import OscMessage
 
 from .helpers import parse_osc_bytes
 
+END = b'\xc0'
+ESC = b'\xdb'
+ESC_END = b'\xdc'
+ESC_ESC = b'\xdd'
+
+
+def slip_encode(dgram: bytes) -> bytes:
+    return b''.join((END, dgram.replace(ESC, ESC + ESC_ESC).replace(END, ESC + ESC_END), END))
+
+
+def slip_unescape(frame: bytes | bytearray) -> bytes:
+    # every ESC in the stream starts a pair, so unescaping END first cannot create new pairs
+    return bytes(frame).replace(ESC + ESC_END, END).replace(ESC + ESC_ESC, ESC)
+
+
+class SLIPDecoder:
+    """Incremental SLIP decoder, keeps partial frames between calls to feed()"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def reset(self) -> None:
+        self.buffer.clear()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self.buffer += data
+
+        frames = []
+        start = 0
+        while (end := self.buffer.find(END, start)) != -1:
+            if end > start:
+                frames.append(slip_unescape(self.buffer[start:end]))
+            start = end + 1
+
+        if start:
+            del self.buffer[:start]
+        return frames
+
 
 class SLIPClient:
-    END = b'\xc0'
-    ESC = b'\xdb'
-    ESC_END = b'\xdc'
-    ESC_ESC = b'\xdd'
+    END = END
+    ESC = ESC
+    ESC_END = ESC_END
+    ESC_ESC = ESC_ESC
 
     def __init__(self, device, baud=9600, **kwargs):
         self.ser = serial.Serial(device, baudrate=baud, **kwargs)
         self.ser.reset_input_buffer()
         self.ser.reset_output_buffer()
 
-    def send(self, content: Union[OscMessage, OscBundle]) -> None:
-        encoded = self.END
-        encoded += content.dgram.replace(self.ESC, self.ESC + self.ESC_ESC).replace(self.END, self.ESC + self.ESC_END)
-        encoded += self.END
+        self.decoder = SLIPDecoder()
+        self.frames: deque[bytes] = deque()
+
+    def reset_input_buffer(self) -> None:
+        self.ser.reset_input_buffer()
+        self.decoder.reset()
+        self.frames.clear()
+
+    def __write(self, encoded: bytes) -> None:
         sentlen = self.ser.write(encoded)
         if sentlen != len(encoded):
             raise serial.SerialTimeoutException('Cannot write to serial port')
 
+    def send(self, content: Union[OscMessage, OscBundle]) -> None:
+        self.__write(slip_encode(content.dgram))
+
+    def send_many(self, contents: Iterable[Union[OscMessage, OscBundle]]) -> None:
+        self.__write(b''.join(slip_encode(content.dgram) for content in contents))
+
     def receive(self) -> bytes:
-        buffer = b''
-        while True:
-            c = self.ser.read(1)
-            if c is None or not len(c):
+        while not self.frames:
+            # block for the first byte, then take everything that already arrived
+            data = self.ser.read(self.ser.in_waiting or 1)
+            if data is None or not len(data):
                 raise serial.SerialTimeoutException('Cannot read from serial port')
 
-            if c == self.END:
-                if len(buffer):
-                    break
-                continue
-
-            if c == self.ESC:
-                c = self.ser.read(1)
-                if c is None or not len(c):
-                    raise serial.SerialTimeoutException('Packet ended too early')
-                if c == self.ESC_END:
-                    buffer += self.END
-                elif c == self.ESC_ESC:
-                    buffer += self.ESC
-            else:
-                buffer += c
-        return buffer
+            self.frames.extend(self.decoder.feed(data))
+        return self.frames.popleft()
+
+    def receive_available(self) -> List[bytes]:
+        """Return every complete frame, reading only what the port already has.
+
+        Meant for ports opened with timeout=0, a port that went away raises instead of returning nothing.
+        """
+        data = self.ser.read(self.ser.in_waiting or 1)
+        self.frames.extend(self.decoder.feed(data))
+
+        frames = list(self.frames)
+        self.frames.clear()
+        return frames
 
     def receive_obj(self) -> OscBundle | OscMessage:
         val = parse_osc_bytes(self.receive())
@@ -0,0 +1,274 @@
+import os
+import json
+from dataclasses import dataclass
+from typing import Any, List, Mapping
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:
+    # Python 3.10, only JSON snapshots then
+    tomllib = None
+
+from .helpers import same_value
+from .matrix import MixMatrix
+from .async_controller import AsyncOSCController
+from .osc_controller import OSCController
+from .presets import presets
+from .ramps import RampScheduler, AsyncRampScheduler
+
+EXTENSIONS = ('.toml', '.json')
+
+
+@dataclass
+class Snapshot:
+    """What recall() sets the mixer to: gains, and mutes and multipliers if it has them.
+
+    In a file, all of these but gains are optional:
+
+        inputs = ["Mic 1", ...]
+        outputs = ["Room PA", ...]
+        gains = [[1.0, 0.0, ...], ...]        # [channel][bus]
+        muted = [[false, true, ...], ...]
+        [multipliers]
+        input = [1.0, ...]
+        output = [1.0, ...]
+    """
+    matrix: MixMatrix
+    mutes: bool = False
+    channel_multipliers: List[float] | None = None
+    bus_multipliers: List[float] | None = None
+
+    @classmethod
+    def capture(cls, osc: OSCController) -> 'Snapshot':
+        """Everything the mixer has now"""
+        return cls(osc.get_mix_matrix(), True, list(osc.get_channel_multipliers().values()),
+                   list(osc.get_bus_multipliers().values()))
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'Snapshot':
+        if not isinstance(data, Mapping) or 'gains' not in data:
+            raise ValueError("A snapshot needs gains")
+        shape = matrix_shape('gains', data['gains'])
+        if 'muted' in data and matrix_shape('muted', data['muted']) != shape:
+            raise ValueError(f"muted is {matrix_shape('muted', data['muted'])}, but gains {shape}")
+
+        multipliers = data.get('multipliers', {})
+        if not isinstance(multipliers, Mapping):
+            raise ValueError("multipliers must have input and output lists")
+        for key, length in (('input', shape[0]), ('output', shape[1])):
+            values = multipliers.get(key)
+            if values is not None and (not isinstance(values, list) or len(values) != length or
+                                       not all(isinstance(x, (int, float)) for x in values)):
+                raise ValueError(f"multipliers.{key} must be a list of {length} numbers")
+
+        return cls(MixMatrix.from_dict(data), 'muted' in data, multipliers.get('input'), multipliers.get('output'))
+
+    def to_dict(self) -> dict[str, Any]:
+        data = self.matrix.to_dict()
+        if not self.mutes:
+            del data['muted']
+
+        multipliers = {}
+        if self.channel_multipliers is not None:
+            multipliers['input'] = self.channel_multipliers
+        if self.bus_multipliers is not None:
+            multipliers['output'] = self.bus_multipliers
+        if multipliers:
+            data['multipliers'] = multipliers
+        return data
+
+    def aligned(self, inputs: List[str], outputs: List[str]) -> 'Snapshot':
+        """This snapshot with its channels and buses in the order of inputs and outputs, found by name.
+
+        Snapshots without names, like the built-in presets, are taken to be in that order already.
+        """
+        rows = order('channels', self.matrix.inputs, inputs)
+        columns = order('buses', self.matrix.outputs, outputs)
+        if rows is None and columns is None:
+            return self
+
+        rows = list(range(len(inputs))) if rows is None else rows
+        columns = list(range(len(outputs))) if columns is None else columns
+        matrix = MixMatrix(self.matrix.gains[np.ix_(rows, columns)], self.matrix.muted[np.ix_(rows, columns)],
+                           inputs, outputs)
+        return Snapshot(matrix, self.mutes,
+                        None if self.channel_multipliers is None else [self.channel_multipliers[i] for i in rows],
+                        None if self.bus_multipliers is None else [self.bus_multipliers[i] for i in columns])
+
+
+def order(kind: str, names: List[str], wanted: List[str]) -> List[int] | None:
+    # where each of wanted is in names, None when they are in that order already
+    if names == wanted:
+        return None
+    if names == [str(i) for i in range(len(names))]:
+        # MixMatrix numbers what wasn't named
+        if len(names) != len(wanted):
+            raise ValueError(f"Snapshot has {len(names)} {kind}, the mixer {len(wanted)}")
+        return None
+    if sorted(names) != sorted(wanted):
+        missing = [x for x in wanted if x not in names]
+        unknown = [x for x in names if x not in wanted]
+        raise ValueError(f"Snapshot {kind} don't match the mixer's" +
+                         (f", it has no {', '.join(missing)}" if missing else '') +
+                         (f", the mixer has no {', '.join(unknown)}" if unknown else ''))
+    return [names.index(x) for x in wanted]
+
+
+def matrix_shape(name: str, rows: Any) -> tuple[int, int]:
+    # a [channel][bus] list of lists, every row as long as the first
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, list) for row in rows):
+        raise ValueError(f"{name} must be a list of rows, one per channel")
+    if any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError(f"Rows of {name} differ in length")
+    return len(rows), len(rows[0])
+
+
+class PresetStore:
+    """Snapshots in the .toml and .json files of a directory, by file name, and the built-in gain presets.
+
+    Files are only read when asked for, and read again once they changed on disk.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self.cache: dict[str, tuple[float, Snapshot]] = {}
+
+    def __path(self, name: str) -> str | None:
+        if self.directory is None:
+            return None
+        for extension in EXTENSIONS:
+            path = os.path.join(self.directory, name + extension)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def names(self) -> List[str]:
+        names = set(presets)
+        if self.directory is not None and os.path.isdir(self.directory):
+            names.update(os.path.splitext(x)[0] for x in os.listdir(self.directory) if x.endswith(EXTENSIONS))
+        return sorted(names)
+
+    def __contains__(self, name: str) -> bool:
+        return self.__path(name) is not None or name in presets
+
+    def get(self, name: str) -> Snapshot:
+        path = self.__path(name)
+        if path is None:
+            if name in presets:
+                return Snapshot(presets[name])
+            raise KeyError(f"No preset {name}")
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            raise ValueError(f"{path}: {e}") from e
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        if not path.endswith('.json') and tomllib is None:
+            raise ValueError(f"Reading {path} needs Python 3.11")
+
+        # unreadable files, broken JSON and TOML, and snapshots that don't make sense, all name the file
+        try:
+            with open(path, 'rb') as f:
+                data = json.load(f) if path.endswith('.json') else tomllib.load(f)
+            snapshot = Snapshot.from_dict(data)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}") from e
+        self.cache[path] = (mtime, snapshot)
+        return snapshot
+
+    def save(self, name: str, snapshot: Snapshot) -> str:
+        """Write snapshot to name.json, returning the path"""
+        if self.directory is None:
+            raise ValueError("No directory to save presets in is configured")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot.to_dict(), f, indent=2)
+        os.replace(path + '.tmp', path)
+
+        self.cache.pop(path, None)
+        return path
+
+
+def changes(snapshot: Snapshot, current: MixMatrix, channel_multipliers: List[float] | None,
+            bus_multipliers: List[float] | None) -> List[tuple]:
+    """The (setter, *args) calls that take the mixer from current and the multipliers it has to snapshot.
+
+    Channels and buses are matched by name, a snapshot naming others than current raises ValueError.
+    """
+    snapshot = snapshot.aligned(current.inputs, current.outputs)
+    target = snapshot.matrix
+
+    writes = [('set_gain', channel, bus, float(target.gains[channel, bus]))
+              for channel, bus in current.changes(target, mutes=False)]
+
+    if snapshot.mutes:
+        writes += [('set_muted', int(channel), int(bus), bool(target.muted[channel, bus]))
+                   for channel, bus in zip(*np.nonzero(current.muted != target.muted))]
+
+    for setter, now, wanted in (('set_channel_multiplier', channel_multipliers, snapshot.channel_multipliers),
+                                ('set_bus_multiplier', bus_multipliers, snapshot.bus_multipliers)):
+        if wanted is None:
+            continue
+        if len(wanted) != len(now):
+            raise ValueError(f"Snapshot has {len(wanted)} multipliers, the mixer {len(now)}")
+        writes += [(setter, i, float(value)) for i, value in enumerate(wanted) if not same_value(now[i], value)]
+
+    return writes
+
+
+def recall(osc: OSCController, snapshot: Snapshot, ramps: RampScheduler | None = None, duration=0.0,
+           curve='linear') -> int:
+    """Set the mixer to snapshot, writing only what differs from what it has now, in one transaction.
+
+    With ramps and a duration, gains are faded there instead, mutes and multipliers still change right away.
+    Channels and buses are matched by name. Returns how many values were or are being changed.
+    """
+    if ramps is not None:
+        # whatever was fading is superseded by the snapshot
+        ramps.cancel()
+
+    current = osc.get_mix_matrix()
+    snapshot = snapshot.aligned(current.inputs, current.outputs)
+    writes = changes(snapshot, current,
+                     None if snapshot.channel_multipliers is None else list(osc.get_channel_multipliers().values()),
+                     None if snapshot.bus_multipliers is None else list(osc.get_bus_multipliers().values()))
+
+    fading = ramps is not None and duration > 0
+    # the transaction would read everything again to skip unchanged values, we know them already
+    with osc.transaction(skip_unchanged=False):
+        for setter, *args in writes:
+            if not (fading and setter == 'set_gain'):
+                getattr(osc, setter)(*args)
+
+    if fading:
+        ramps.fade(snapshot.matrix.gains.tolist(), duration, curve, current.gains.tolist())
+    return len(writes)
+
+
+async def recall_async(osc: AsyncOSCController, snapshot: Snapshot, ramps: AsyncRampScheduler | None = None,
+                       duration=0.0, curve='linear') -> int:
+    """recall() for an AsyncOSCController"""
+    if ramps is not None:
+        ramps.cancel()
+
+    current = await osc.get_mix_matrix()
+    snapshot = snapshot.aligned(current.inputs, current.outputs)
+    writes = changes(snapshot, current,
+                     None if snapshot.channel_multipliers is None else list((await osc.get_channel_multipliers()).values()),
+                     None if snapshot.bus_multipliers is None else list((await osc.get_bus_multipliers()).values()))
+
+    fading = ramps is not None and duration > 0
+    async with osc.transaction(skip_unchanged=False):
+        for setter, *args in writes:
+            if not (fading and setter == 'set_gain'):
+                await getattr(osc, setter)(*args)
+
+    if fading:
+        await ramps.fade(snapshot.matrix.gains.tolist(), duration, curve, current.gains.tolist())
+    return len(writes)
@@ -0,0 +1,157 @@
+import time
+import bisect
+import threading
+import logging
+from typing import Any, Callable, Iterable, List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds of the histogram buckets
+RTT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# every metric in the Prometheus output starts with this
+METRICS_PREFIX = 'oscproxy'
+
+
+class Histogram:
+    """Counts observations per bucket, like a Prometheus histogram"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        # the last count is for everything above the highest bucket
+        self.counts = [0 for _ in range(len(self.buckets) + 1)]
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the q-th observation falls in"""
+        if not self.count:
+            return 0.0
+
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def report(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+    def prometheus(self, name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class ProxyStats:
+    """Counters and histograms about the serial link, kept by the Dispatcher"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.requeued = 0
+        self.rate_limited = 0
+        self.unsolicited = 0
+        # seconds the mixer spent answering, to tell how saturated the link is
+        self.busy = 0.0
+
+        self.rtt_ms = Histogram(RTT_BUCKETS_MS)
+        self.queue_depth = Histogram(DEPTH_BUCKETS)
+
+    def counters(self) -> dict[str, float]:
+        return {
+            'requests': self.requests,
+            'responses': self.responses,
+            'timeouts': self.timeouts,
+            'reconnects': self.reconnects,
+            'requeued': self.requeued,
+            'rate_limited': self.rate_limited,
+            'unsolicited': self.unsolicited,
+            'busy_seconds': self.busy,
+        }
+
+    def report(self) -> dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        stats: dict[str, Any] = dict(self.counters())
+        stats['uptime_s'] = uptime
+        stats['utilization'] = self.busy / uptime if uptime else 0.0
+        for name, histogram in (('rtt_ms', self.rtt_ms), ('queue_depth', self.queue_depth)):
+            for key, value in histogram.report().items():
+                stats[f"{name}/{key}"] = value
+        return stats
+
+
+def prometheus_name(name: str) -> str:
+    return f"{METRICS_PREFIX}_{name}".replace('/', '_').replace('-', '_')
+
+
+def prometheus_metric(name: str, kind: str, samples: float | dict[str, float], label: str | None = None) -> List[str]:
+    """Render one metric, either a single value or one sample per label value"""
+    name = prometheus_name(name)
+    lines = [f"# TYPE {name} {kind}"]
+    if label is None:
+        lines.append(f"{name} {samples}")
+    else:
+        lines += [f'{name}{{{label}="{key}"}} {value}' for key, value in samples.items()]
+    return lines
+
+
+def by_label(report: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """Turn {'control/depth': 1, 'state/depth': 2} into {'depth': {'control': 1, 'state': 2}}"""
+    metrics: dict[str, dict[str, Any]] = {}
+    for key, value in report.items():
+        label, metric = key.rsplit('/', 1)
+        metrics.setdefault(metric, {})[label] = value
+    return metrics
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    render: Callable[[], str]
+
+    def do_GET(self):
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger('HTTP').debug(format % args)
+
+
+def serve_metrics(render: Callable[[], str], bind_to: str, port: int) -> ThreadingHTTPServer:
+    """Serve render() as Prometheus text on http://bind_to:port/metrics from a background thread"""
+    handler = type('Handler', (MetricsHandler,), {'render': staticmethod(render)})
+    server = ThreadingHTTPServer((bind_to, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.getLogger('HTTP').info(f"Serving metrics on http://{bind_to}:{port}/metrics")
+    return server
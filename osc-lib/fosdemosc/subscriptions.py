@@ -0,0 +1,150 @@
+import time
+from typing import Any, List
+from dataclasses import dataclass
+
+from pythonosc.osc_bundle import OscBundle
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+from pythonosc.osc_bundle_builder import OscBundleBuilder, IMMEDIATELY
+
+# seconds, unless the subscriber asks for something else
+DEFAULT_INTERVAL = 0.05
+DEFAULT_LEASE = 10
+MIN_INTERVAL = 0.01
+# a poll that hasn't come back by then was lost, poll again
+POLL_TIMEOUT = 2
+
+# topic that expands to the levels of every channel and bus
+ALL_LEVELS = '/levels'
+
+
+@dataclass
+class Subscriber:
+    host: Any
+    interval: float
+    expires: float
+    last: float = 0
+
+
+class Topic:
+    def __init__(self, address: str):
+        self.address = address
+        self.request: OscMessage | OscBundle | None = None
+        self.subscribers: dict[Any, Subscriber] = {}
+        self.next_due = 0.0
+        # when the poll that is in flight for this topic was sent
+        self.polling_since: float | None = None
+
+    def polling(self, now: float) -> bool:
+        return self.polling_since is not None and now - self.polling_since < POLL_TIMEOUT
+
+    @property
+    def interval(self) -> float:
+        return min(x.interval for x in self.subscribers.values())
+
+
+class Subscriptions:
+    """Topics the proxy polls on behalf of its clients, and who gets pushed the results"""
+
+    def __init__(self):
+        self.topics: dict[str, Topic] = {}
+        self.channels: int | None = None
+        self.buses: int | None = None
+
+    def set_topology(self, channels: int, buses: int):
+        self.channels = channels
+        self.buses = buses
+
+        for topic in self.topics.values():
+            if topic.request is None:
+                topic.request = self.__request_for(topic.address)
+
+    def needs_topology(self) -> bool:
+        return self.channels is None and any(topic.request is None for topic in self.topics.values())
+
+    def subscribe(self, host, address: str, interval=DEFAULT_INTERVAL, lease=DEFAULT_LEASE):
+        """Add or renew a subscription, keyed by the client's address"""
+        topic = self.topics.get(address)
+        if topic is None:
+            topic = self.topics[address] = Topic(address)
+            topic.request = self.__request_for(address)
+
+        now = time.monotonic()
+        subscriber = topic.subscribers.get(host.addr)
+        if subscriber is None:
+            subscriber = topic.subscribers[host.addr] = Subscriber(host=host, interval=interval, expires=now + lease)
+        else:
+            subscriber.host = host
+            subscriber.interval = interval
+            subscriber.expires = now + lease
+
+        topic.next_due = min(topic.next_due, now + topic.interval) if topic.next_due else now
+
+    def unsubscribe(self, host, address: str):
+        topic = self.topics.get(address)
+        if topic is not None:
+            topic.subscribers.pop(host.addr, None)
+            if not topic.subscribers:
+                del self.topics[address]
+
+    def due(self) -> List[Topic]:
+        """Expire leases, and return the topics that have to be polled now"""
+        now = time.monotonic()
+
+        for address, topic in list(self.topics.items()):
+            for key, subscriber in list(topic.subscribers.items()):
+                if subscriber.expires < now:
+                    del topic.subscribers[key]
+            if not topic.subscribers:
+                del self.topics[address]
+
+        due = []
+        for topic in self.topics.values():
+            if topic.request is None or topic.polling(now) or topic.next_due > now:
+                continue
+
+            # skip ticks we were too late for instead of catching up on them
+            topic.next_due = max(topic.next_due + topic.interval, now)
+            topic.polling_since = now
+            due.append(topic)
+        return due
+
+    def next_due(self) -> float | None:
+        """Seconds until the next poll, or None if nothing is subscribed"""
+        now = time.monotonic()
+        pending = [topic.next_due if not topic.polling(now) else topic.polling_since + POLL_TIMEOUT
+                   for topic in self.topics.values() if topic.request is not None]
+        if not pending:
+            return None
+        return max(0.0, min(pending) - now)
+
+    def dropped(self, topic: Topic):
+        """The poll for topic was not sent, allow the next one"""
+        topic.polling_since = None
+
+    def publish(self, topic: Topic) -> List[Any]:
+        """The poll for topic came back, return the hosts that want this update"""
+        topic.polling_since = None
+
+        now = time.monotonic()
+        hosts = []
+        for subscriber in topic.subscribers.values():
+            # allow some slack, the poll runs at the fastest subscriber's interval
+            if now - subscriber.last >= subscriber.interval * 0.9:
+                subscriber.last = now
+                hosts.append(subscriber.host)
+        return hosts
+
+    def __request_for(self, address: str) -> OscMessage | OscBundle | None:
+        if address != ALL_LEVELS:
+            return OscMessageBuilder(address).build()
+
+        if self.channels is None:
+            return None
+
+        bundle = OscBundleBuilder(IMMEDIATELY)
+        for ch in range(self.channels):
+            bundle.add_content(OscMessageBuilder(f"/ch/{ch}/levels").build())
+        for bus in range(self.buses):
+            bundle.add_content(OscMessageBuilder(f"/bus/{bus}/levels").build())
+        return bundle.build()
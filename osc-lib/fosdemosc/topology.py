@@ -0,0 +1,59 @@
+import os
+import contextlib
+import re
+import json
+import tempfile
+from typing import Any, Mapping
+
+
+class TopologyChanged(ValueError):
+    """A write or read found the cached channels and buses out of date, and wasn't sent.
+
+    Numbers worked out from names before then may mean other channels or buses now, resolve the names again.
+    """
+
+
+def cache_dir() -> str:
+    # systemd's CacheDirectory= for the services, the user's cache otherwise
+    if 'CACHE_DIRECTORY' in os.environ:
+        return os.environ['CACHE_DIRECTORY']
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'fosdemosc')
+
+
+def cache_path(device: str, directory: str | None = None) -> str:
+    # one file per serial device or host:port
+    name = re.sub(r'[^A-Za-z0-9.-]+', '_', device).strip('_')
+    return os.path.join(directory or cache_dir(), f"{name}.json")
+
+
+def load_info(device: str, directory: str | None = None) -> dict[str, Any] | None:
+    """What /info answered the last time device was connected to, or None if that isn't known"""
+    try:
+        with open(cache_path(device, directory)) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(info, dict) or '/info/channels' not in info or '/info/buses' not in info:
+        return None
+    return info
+
+
+def save_info(device: str, info: Mapping[str, Any], directory: str | None = None):
+    """Keep what /info answered for the next connection, silently giving up where there is nowhere to keep it"""
+    path = cache_path(device, directory)
+    temporary = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a file of its own, the pollers, the web workers and the CLI may all be writing one
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix=os.path.basename(path), suffix='.tmp',
+                                         delete=False) as f:
+            temporary = f.name
+            json.dump(dict(info), f, indent=2)
+        # readable like any other cache file, NamedTemporaryFile makes it private
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError:
+        if temporary is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(temporary)
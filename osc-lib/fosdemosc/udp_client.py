@@ -7,4 +7,11 @@ from .helpers import parse_osc_bytes
 
 class ParsingUDPClient(UDPClient):
     def receive_obj(self, timeout=0.5) -> OscBundle | OscMessage:
-        return parse_osc_bytes(self.receive(timeout))
+        dgram = self.receive(timeout)
+        if not dgram:
+            raise TimeoutError('No reply from the mixer')
+        return parse_osc_bytes(dgram)
+
+    def reset_input_buffer(self) -> None:
+        while self.receive(0):
+            pass
@@ -0,0 +1,106 @@
+import math
+import unittest
+from unittest import mock
+
+from fosdemosc.cache import ResponseCache, parse_ttl
+from fosdemosc.protocol import build, bundle
+
+
+def reply(address, value):
+    return build(address, value)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+
+    def put(self, address, value):
+        self.cache.put(build(address), reply(address, value), self.cache.generation)
+
+    def test_ttls(self):
+        self.assertEqual(self.cache.ttl('/ch/0/mix/1/level'), math.inf)
+        self.assertEqual(self.cache.ttl('/ch/0/levels'), 0.02)
+        self.assertEqual(self.cache.ttl('/something/else'), 0)
+        self.assertEqual(parse_ttl('/ch/*/levels=0.5'), ('/ch/*/levels', 0.5))
+        with self.assertRaises(ValueError):
+            parse_ttl('0.5')
+
+    def test_hit_and_expiry(self):
+        with mock.patch('time.monotonic', return_value=100.0):
+            self.put('/ch/0/levels', -10.0)
+            self.assertEqual(self.cache.get(build('/ch/0/levels')).params, [-10.0])
+        with mock.patch('time.monotonic', return_value=100.05):
+            self.assertIsNone(self.cache.get(build('/ch/0/levels')))
+            self.assertEqual(self.cache.get_stale(build('/ch/0/levels')).params, [-10.0])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_uncached_address(self):
+        self.put('/something/else', 1)
+        self.assertIsNone(self.cache.get(build('/something/else')))
+
+    def test_reply_to_read_before_write_is_not_stored(self):
+        generation = self.cache.generation
+        self.cache.invalidate(build('/ch/0/mix/0/level', 0.5))
+        self.cache.put(build('/ch/0/mix/0/level'), reply('/ch/0/mix/0/level', 0.1), generation)
+        self.assertIsNone(self.cache.get(build('/ch/0/mix/0/level')))
+
+    def test_write_drops_siblings_only(self):
+        self.put('/ch/0/mix/0/level', 0.1)
+        self.put('/ch/0/mix/0/raw', 0.1)
+        self.put('/ch/0/mix/1/level', 0.2)
+        self.cache.invalidate(build('/ch/0/mix/0/level', 0.5))
+        self.assertIsNone(self.cache.get(build('/ch/0/mix/0/level')))
+        self.assertIsNone(self.cache.get(build('/ch/0/mix/0/raw')))
+        self.assertIsNotNone(self.cache.get(build('/ch/0/mix/1/level')))
+
+    def test_bundle_entry_dropped_with_any_address(self):
+        request = bundle([build('/ch/0/mix/0/level'), build('/ch/1/mix/0/level')])
+        self.cache.put(request, bundle([reply('/ch/0/mix/0/level', 0.1), reply('/ch/1/mix/0/level', 0.2)]),
+                       self.cache.generation)
+        self.assertIsNotNone(self.cache.get(request))
+        self.cache.invalidate(build('/ch/1/mix/0/muted', 1))
+        self.assertIsNone(self.cache.get(request))
+
+    def test_channel_multiplier_drops_its_mixes(self):
+        self.put('/ch/1/mix/0/raw', 0.1)
+        self.put('/ch/1/mix/3/level', 0.1)
+        self.put('/ch/2/mix/0/raw', 0.1)
+        self.cache.invalidate(build('/ch/1/multiplier', 0.5))
+        self.assertIsNone(self.cache.get(build('/ch/1/mix/0/raw')))
+        self.assertIsNone(self.cache.get(build('/ch/1/mix/3/level')))
+        self.assertIsNotNone(self.cache.get(build('/ch/2/mix/0/raw')))
+
+    def test_bus_multiplier_drops_mixes_to_it(self):
+        self.put('/ch/0/mix/2/raw', 0.1)
+        self.put('/ch/5/mix/2/raw', 0.1)
+        self.put('/ch/0/mix/1/raw', 0.1)
+        self.put('/bus/2/multiplier', 1.0)
+        self.cache.invalidate(build('/bus/2/multiplier', 0.5))
+        self.assertIsNone(self.cache.get(build('/ch/0/mix/2/raw')))
+        self.assertIsNone(self.cache.get(build('/ch/5/mix/2/raw')))
+        self.assertIsNone(self.cache.get(build('/bus/2/multiplier')))
+        self.assertIsNotNone(self.cache.get(build('/ch/0/mix/1/raw')))
+
+    def test_factoryreset_clears(self):
+        self.put('/ch/0/mix/0/level', 0.1)
+        self.put('/info', 6)
+        self.cache.invalidate(build('/factoryreset'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_write_through(self):
+        generation = self.cache.generation
+        self.cache.write_through(reply('/ch/0/mix/0/level', 0.5), generation)
+        self.assertEqual(self.cache.get(build('/ch/0/mix/0/level')).params, [0.5])
+
+    def test_max_entries(self):
+        cache = ResponseCache(max_entries=2)
+        for ch in range(3):
+            cache.put(build(f'/ch/{ch}/multiplier'), reply(f'/ch/{ch}/multiplier', 1.0), cache.generation)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertIsNone(cache.get(build('/ch/0/multiplier')))
+        self.assertIsNotNone(cache.get(build('/ch/2/multiplier')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fosdemosc.clients import ClientRegistry
+from fosdemosc.helpers import is_dropped
+from fosdemosc.proxy import Dispatcher, DataItem
+from fosdemosc.protocol import build
+
+
+class ClientRegistryTest(unittest.TestCase):
+    def admit(self, registry, now, addr=1):
+        with mock.patch('time.monotonic', return_value=now):
+            return registry.admit(addr)
+
+    def test_burst_then_rate(self):
+        registry = ClientRegistry(rate=10, burst=3)
+        self.assertEqual([self.admit(registry, 100.0) for _ in range(4)], [True, True, True, False])
+        self.assertTrue(self.admit(registry, 100.15))
+        self.assertFalse(self.admit(registry, 100.15))
+        self.assertEqual(registry.clients[1].limited, 2)
+
+    def test_clients_limited_apart(self):
+        registry = ClientRegistry(rate=10, burst=1)
+        self.assertTrue(self.admit(registry, 100.0, 1))
+        self.assertTrue(self.admit(registry, 100.0, 2))
+
+    def test_no_limit(self):
+        registry = ClientRegistry(rate=0, burst=0)
+        self.assertTrue(all(self.admit(registry, 100.0) for _ in range(10)))
+
+    def test_usage_decays(self):
+        registry = ClientRegistry()
+        self.admit(registry, 100.0)
+        with mock.patch('time.monotonic', return_value=100.0):
+            registry.charge(1, 1.0)
+            self.assertEqual(registry.usage(1), 1.0)
+        with mock.patch('time.monotonic', return_value=105.0):
+            self.assertAlmostEqual(registry.usage(1), 0.368, places=3)
+        self.assertEqual(registry.usage(2), 0.0)
+
+    def test_evict_idle(self):
+        registry = ClientRegistry(idle_timeout=60)
+        self.admit(registry, 100.0)
+        with mock.patch('time.monotonic', return_value=161.0):
+            self.assertEqual(len(registry.evict_idle()), 1)
+        self.assertEqual(registry.clients, {})
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_limited_request_answered(self):
+        replies = []
+        dispatcher = Dispatcher(replies.append, client_rate=1, client_burst=1)
+        client = SimpleNamespace(addr=('127.0.0.1', 1))
+        for _ in range(2):
+            dispatcher.submit(DataItem(host=client, data=build('/ch/0/multiplier')))
+
+        self.assertEqual(len(replies), 1)
+        self.assertTrue(is_dropped(replies[0].data))
+        self.assertEqual(dispatcher.stats.rate_limited, 1)
+        self.assertEqual(len(dispatcher.next_batch()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from types import SimpleNamespace
+
+from fosdemosc.proxy import Dispatcher, DataItem
+from fosdemosc.helpers import is_dropped
+from fosdemosc.protocol import build
+
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.replies = []
+        self.dispatcher = Dispatcher(self.replies.append, window=4)
+
+    def submit(self, request, client=1):
+        self.dispatcher.submit(DataItem(host=SimpleNamespace(addr=('127.0.0.1', client)), data=request))
+
+    def exchange(self, request, response, client=1):
+        """Send request through the dispatcher and answer it if it reaches the mixer, returning what it sent"""
+        self.submit(request, client)
+        batch = self.dispatcher.next_batch()
+        if batch:
+            self.dispatcher.response(response)
+        return batch
+
+    def test_window(self):
+        for ch in range(6):
+            self.submit(build(f'/ch/{ch}/multiplier'))
+        self.assertEqual(len(self.dispatcher.next_batch()), 4)
+        self.assertEqual(self.dispatcher.next_batch(), [])
+
+        self.dispatcher.response(build('/ch/0/multiplier', 1.0))
+        self.assertEqual([x.address for x in self.dispatcher.next_batch()], ['/ch/4/multiplier'])
+        self.assertEqual(self.replies[-1].data.params, [1.0])
+
+    def test_slot_kept_for_writes(self):
+        for ch in range(4):
+            self.submit(build(f'/ch/{ch}/levels'))
+        self.assertEqual(len(self.dispatcher.next_batch()), 3)
+        self.submit(build('/ch/0/multiplier', 0.5))
+        self.assertEqual([x.address for x in self.dispatcher.next_batch()], ['/ch/0/multiplier'])
+
+    def test_identical_reads_coalesced(self):
+        for client in (1, 2, 3):
+            self.submit(build('/ch/0/levels'), client)
+        self.assertEqual(len(self.dispatcher.next_batch()), 1)
+
+        self.dispatcher.response(build('/ch/0/levels/peak', -10.0))
+        self.assertEqual(sorted(x.host.addr[1] for x in self.replies), [1, 2, 3])
+        self.assertTrue(self.dispatcher.idle())
+
+    def test_read_after_write_not_coalesced(self):
+        self.submit(build('/ch/0/mix/0/level'), 1)
+        self.assertEqual(len(self.dispatcher.next_batch()), 1)
+        self.submit(build('/ch/0/mix/0/level', 0.5), 2)
+        self.submit(build('/ch/0/mix/0/level'), 3)
+        self.assertEqual(len(self.dispatcher.next_batch()), 2)
+
+    def test_late_response_completes_earlier_requests(self):
+        for ch in range(2):
+            self.submit(build(f'/ch/{ch}/multiplier'))
+        self.dispatcher.next_batch()
+        self.dispatcher.response(build('/ch/1/multiplier', 1.0))
+        self.assertTrue(self.dispatcher.idle())
+        self.assertEqual(self.dispatcher.stats.timeouts, 1)
+
+    def test_unsolicited_response(self):
+        self.dispatcher.response(build('/ch/0/multiplier', 1.0))
+        self.assertEqual(self.dispatcher.stats.unsolicited, 1)
+        self.assertEqual(self.replies, [])
+
+    def test_requeue(self):
+        self.submit(build('/ch/0/multiplier'))
+        self.assertEqual(len(self.dispatcher.next_batch()), 1)
+        self.dispatcher.requeue()
+        self.assertEqual(len(self.dispatcher.next_batch()), 1)
+
+    def test_factoryreset_clears_cache(self):
+        self.assertEqual(len(self.exchange(build('/ch/0/mix/0/level'), build('/ch/0/mix/0/level', 0.5))), 1)
+        self.assertEqual(self.exchange(build('/ch/0/mix/0/level'), None), [])
+
+        self.assertEqual(len(self.exchange(build('/factoryreset'), build('/factoryreset'))), 1)
+        self.assertEqual(len(self.exchange(build('/ch/0/mix/0/level'), build('/ch/0/mix/0/level', 1.0))), 1)
+        self.assertEqual(self.replies[-1].data.params, [1.0])
+
+    def test_factoryreset_not_coalesced(self):
+        self.submit(build('/factoryreset'), 1)
+        self.submit(build('/factoryreset'), 2)
+        self.assertEqual(len(self.dispatcher.next_batch()), 2)
+
+    def test_multiplier_write_drops_cached_mix(self):
+        self.exchange(build('/ch/0/mix/1/raw'), build('/ch/0/mix/1/raw', 0.5))
+        self.exchange(build('/bus/1/multiplier', 0.5), build('/bus/1/multiplier', 0.5))
+        self.assertEqual(len(self.exchange(build('/ch/0/mix/1/raw'), build('/ch/0/mix/1/raw', 0.25))), 1)
+        self.assertEqual(self.replies[-1].data.params, [0.25])
+
+    def test_expired_read_gets_dropped_reply(self):
+        self.dispatcher.submit(DataItem(host=SimpleNamespace(addr=('127.0.0.1', 1)), data=build('/ch/0/levels'),
+                                        received=0.0))
+        self.assertEqual(self.dispatcher.next_batch(), [])
+        self.assertTrue(is_dropped(self.replies[-1].data))
+        self.assertEqual(self.replies[-1].data.params, ['/ch/0/levels'])
+
+    def test_expired_read_gets_stale_value(self):
+        self.exchange(build('/ch/0/levels'), build('/ch/0/levels/peak', -10.0))
+        self.dispatcher.submit(DataItem(host=SimpleNamespace(addr=('127.0.0.1', 1)), data=build('/ch/0/levels'),
+                                        received=0.0))
+        self.assertEqual(self.dispatcher.next_batch(), [])
+        self.assertEqual(self.replies[-1].data.params, [-10.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
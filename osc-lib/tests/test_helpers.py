@@ -0,0 +1,36 @@
+import unittest
+
+from fosdemosc.helpers import answers, dropped_reply, is_dropped, is_read, DROPPED
+from fosdemosc.protocol import Dropped, build, bundle, check_dropped
+
+
+class DroppedTest(unittest.TestCase):
+    def test_dropped_reply(self):
+        reply = dropped_reply(bundle([build('/ch/0/levels'), build('/bus/0/levels')]))
+        self.assertEqual(reply.address, DROPPED)
+        self.assertEqual(reply.params, ['/ch/0/levels', '/bus/0/levels'])
+        self.assertTrue(is_dropped(reply))
+
+    def test_dropped_reply_answers_request(self):
+        request = build('/ch/0/levels')
+        self.assertTrue(answers(request, dropped_reply(request)))
+        self.assertFalse(answers(build('/ch/1/levels'), dropped_reply(request)))
+
+    def test_check_dropped(self):
+        request = build('/ch/0/levels')
+        with self.assertRaises(Dropped):
+            check_dropped(request, dropped_reply(request))
+        check_dropped(request, build('/ch/0/levels/peak', -10.0))
+
+    def test_reset_echo_is_not_dropped(self):
+        self.assertFalse(is_read(build('/factoryreset')))
+        check_dropped(build('/factoryreset'), build('/factoryreset'))
+
+    def test_answers(self):
+        self.assertTrue(answers(build('/ch/0/levels'), build('/ch/0/levels/peak', -10.0)))
+        self.assertTrue(answers(build('/ch/0/multiplier'), build('/ch/0/multiplier', 1.0)))
+        self.assertFalse(answers(build('/ch/0/multiplier'), build('/ch/0/multiplierx', 1.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
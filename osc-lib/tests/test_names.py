@@ -0,0 +1,90 @@
+import unittest
+
+from fosdemosc.names import NameIndex, InvalidName, InvalidInput, normalize
+
+BUSES = ['Room PA', 'Livestream', 'Headphones L', 'Headphones R', 'USB 1', 'USB 2']
+
+
+class NameIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex('bus', BUSES, aliases={'pa': 'Room PA', 'stream': 1},
+                               groups={'headphones': ['Headphones L', 'Headphones R'], 'usb': ['usb 1', 5]})
+
+    def test_normalize(self):
+        self.assertEqual(normalize(' Room  PA '), 'roompa')
+
+    def test_numbers(self):
+        self.assertEqual(self.index.resolve(2), 2)
+        self.assertEqual(self.index.resolve(' 3 '), 3)
+        with self.assertRaises(InvalidName):
+            self.index.resolve(6)
+
+    def test_names(self):
+        self.assertEqual(self.index.resolve('room pa'), 0)
+        self.assertEqual(self.index.resolve('RoomPA'), 0)
+        self.assertEqual(self.index.resolve('Live'), 1)
+
+    def test_aliases(self):
+        self.assertEqual(self.index.resolve('PA'), 0)
+        self.assertEqual(self.index.resolve('stream'), 1)
+
+    def test_groups(self):
+        self.assertEqual(self.index.expand('headphones'), [2, 3])
+        self.assertEqual(self.index.expand('USB'), [4, 5])
+        self.assertEqual(self.index.expand('usb 2'), [5])
+        with self.assertRaises(InvalidName):
+            self.index.resolve('headphones')
+
+    def test_ambiguous_prefix(self):
+        # 'head' starts both headphones, only the group's whole name stands for the group
+        with self.assertRaises(InvalidName) as e:
+            self.index.expand('head')
+        self.assertIn('ambiguous', str(e.exception))
+
+    def test_unknown(self):
+        with self.assertRaises(InvalidName):
+            self.index.expand('monitor')
+        self.assertTrue(issubclass(InvalidName, InvalidInput))
+        self.assertTrue(issubclass(InvalidName, ValueError))
+
+    def test_duplicate_names_keep_first(self):
+        index = NameIndex('channel', ['Mic', 'Mic'])
+        self.assertEqual(index.resolve('mic'), 0)
+        self.assertEqual(index.resolve(1), 1)
+
+
+class CollisionTest(unittest.TestCase):
+    def test_alias_of_a_name(self):
+        with self.assertRaises(ValueError) as e:
+            NameIndex('bus', BUSES, aliases={'Livestream': 0})
+        self.assertIn('already names the bus Livestream', str(e.exception))
+
+    def test_alias_twice(self):
+        with self.assertRaises(ValueError):
+            NameIndex('bus', BUSES, aliases={'pa': 0, 'P A': 1})
+
+    def test_group_of_a_name(self):
+        with self.assertRaises(ValueError):
+            NameIndex('bus', BUSES, groups={'usb 1': ['usb 2']})
+
+    def test_group_of_an_alias(self):
+        with self.assertRaises(ValueError):
+            NameIndex('bus', BUSES, aliases={'pa': 0}, groups={'pa': [0, 1]})
+
+    def test_group_twice(self):
+        with self.assertRaises(ValueError) as e:
+            NameIndex('bus', BUSES, groups={'all': [0], 'ALL': [1]})
+        self.assertIn('already names a group of buses', str(e.exception))
+
+    def test_numbers_and_empty(self):
+        for aliases in ({'3': 0}, {'': 0}, {' ': 0}):
+            with self.subTest(aliases=aliases), self.assertRaises(ValueError):
+                NameIndex('bus', BUSES, aliases=aliases)
+
+    def test_alias_to_unknown(self):
+        with self.assertRaises(InvalidName):
+            NameIndex('bus', BUSES, aliases={'monitor': 'nope'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import contextlib
+import math
+import threading
+import unittest
+from unittest import mock
+
+from fosdemosc.names import InvalidInput
+from fosdemosc.ramps import CURVES, RampScheduler, Ramps, parse_duration
+
+
+class ParseDurationTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(parse_duration('2s'), 2.0)
+        self.assertEqual(parse_duration(' 500MS '), 0.5)
+        self.assertEqual(parse_duration('1m'), 60.0)
+        self.assertEqual(parse_duration('1.5'), 1.5)
+        self.assertEqual(parse_duration('0'), 0.0)
+        self.assertEqual(parse_duration(3), 3.0)
+
+    def test_invalid(self):
+        for value in ('soon', '', 's', 'inf', 'nan', '-1s', 'infs', '1e400', -2, math.inf, math.nan):
+            with self.subTest(value=value), self.assertRaises(InvalidInput):
+                parse_duration(value)
+
+
+class RampsTest(unittest.TestCase):
+    def setUp(self):
+        with mock.patch('time.monotonic', return_value=100.0):
+            self.ramps = Ramps(rate=10)
+
+    def start(self, targets, current, duration, curve='linear', now=100.0):
+        with mock.patch('time.monotonic', return_value=now):
+            self.ramps.start(targets, lambda cell: current, duration, curve)
+
+    def test_ticks_skip_what_was_missed(self):
+        self.assertAlmostEqual(self.ramps.next_tick(100.0), 100.1)
+        self.assertAlmostEqual(self.ramps.next_tick(100.05), 100.1)
+        self.assertAlmostEqual(self.ramps.next_tick(100.37), 100.4)
+
+    def test_linear_steps(self):
+        self.start({(0, 1): 1.0}, 0.0, 1.0)
+        self.assertEqual(len(self.ramps), 1)
+        self.assertAlmostEqual(self.ramps.due(100.25)[(0, 1)], 0.25)
+        self.assertAlmostEqual(self.ramps.due(100.5)[(0, 1)], 0.5)
+        self.assertEqual(self.ramps.due(101.5), {(0, 1): 1.0})
+        self.assertEqual(len(self.ramps), 0)
+
+    def test_curves_end_where_they_should(self):
+        for curve, weights in CURVES.items():
+            with self.subTest(curve=curve):
+                self.assertEqual([round(x, 9) for x in weights(0.0)], [1.0, 0.0])
+                self.assertEqual([round(x, 9) for x in weights(1.0)], [0.0, 1.0])
+
+    def test_small_changes_not_sent(self):
+        self.start({(0, 0): 0.01}, 0.0, 10.0)
+        # 0.0005 along, less than a step
+        self.assertEqual(self.ramps.due(100.5), {})
+        self.assertAlmostEqual(self.ramps.due(101.0)[(0, 0)], 0.001)
+
+    def test_nothing_to_ramp(self):
+        self.start({(0, 0): 0.5}, 0.5, 1.0)
+        self.assertEqual(len(self.ramps), 0)
+
+    def test_takes_over_from_running_ramp(self):
+        self.start({(0, 0): 1.0}, 0.0, 1.0)
+        self.ramps.due(100.5)
+        # back down from the 0.5 sent, not from what the mixer had
+        self.start({(0, 0): 0.0}, 0.9, 1.0, now=100.5)
+        self.assertAlmostEqual(self.ramps.due(101.0)[(0, 0)], 0.25)
+
+    def test_cancel(self):
+        self.start({(0, 0): 1.0, (1, 1): 1.0}, 0.0, 1.0)
+        self.ramps.cancel([(0, 0)])
+        self.assertEqual(list(self.ramps.due(100.5)), [(1, 1)])
+        self.ramps.cancel()
+        self.assertEqual(len(self.ramps), 0)
+
+    def test_unknown_curve(self):
+        with self.assertRaises(InvalidInput):
+            self.start({(0, 0): 1.0}, 0.0, 1.0, curve='wobbly')
+
+
+class FakeMixer:
+    # just enough of an OSCController for RampScheduler
+    def __init__(self, fail=False):
+        self.gains = [[0.0, 0.0], [0.0, 0.0]]
+        self.fail = fail
+        self.transactions = 0
+
+    def get_matrix(self):
+        return [row[:] for row in self.gains]
+
+    @contextlib.contextmanager
+    def transaction(self, **kwargs):
+        self.transactions += 1
+        yield
+
+    def set_gain(self, channel, bus, value):
+        if self.fail:
+            raise ConnectionError("mixer away")
+        self.gains[channel][bus] = value
+
+
+class RampSchedulerTest(unittest.TestCase):
+    def test_fades_to_the_end(self):
+        mixer = FakeMixer()
+        ticks = []
+        ramps = RampScheduler(mixer, rate=100, listener=ticks.append)
+        ramps.fade([[1.0, 0.0], [0.0, 0.5]], 0.1)
+        self.assertTrue(ramps.wait(5))
+        self.assertEqual(mixer.gains, [[1.0, 0.0], [0.0, 0.5]])
+        # a transaction per tick, with every send due on it
+        self.assertEqual(mixer.transactions, len(ticks))
+        self.assertGreater(len(ticks), 1)
+        self.assertEqual(ticks[-1], {(0, 0): 1.0, (1, 1): 0.5})
+
+    def test_error_stops_every_ramp(self):
+        ramps = RampScheduler(FakeMixer(fail=True), rate=100)
+        ramps.fade({(0, 0): 1.0, (1, 0): 1.0}, 0.1)
+        with self.assertRaises(ConnectionError):
+            ramps.wait(5)
+        self.assertEqual(len(ramps.ramps), 0)
+
+    def test_cancel(self):
+        mixer = FakeMixer()
+        started = threading.Event()
+        ramps = RampScheduler(mixer, rate=100, listener=lambda values: started.set())
+        ramps.fade({(0, 0): 1.0}, 10.0)
+        self.assertTrue(started.wait(5))
+        ramps.cancel()
+        self.assertTrue(ramps.wait(5))
+        self.assertLess(mixer.gains[0][0], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
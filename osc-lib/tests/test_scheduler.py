@@ -0,0 +1,87 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fosdemosc.scheduler import RequestQueues, classify, CONTROL, STATE, METERING
+from fosdemosc.protocol import build, bundle
+
+
+def item(request, client=1, received=100.0, deadline=None):
+    return SimpleNamespace(host=SimpleNamespace(addr=client), data=request, received=received, deadline=deadline)
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_classes(self):
+        self.assertEqual(classify(build('/ch/0/mix/0/level', 0.5)), CONTROL)
+        self.assertEqual(classify(build('/factoryreset')), CONTROL)
+        self.assertEqual(classify(build('/ch/0/mix/0/level')), STATE)
+        self.assertEqual(classify(build('/ch/0/levels')), METERING)
+        self.assertEqual(classify(bundle([build('/ch/0/levels'), build('/bus/0/levels')])), METERING)
+        self.assertEqual(classify(bundle([build('/ch/0/levels'), build('/ch/0/multiplier')])), STATE)
+
+
+class RequestQueuesTest(unittest.TestCase):
+    def setUp(self):
+        self.expired = []
+        self.queues = RequestQueues(metering_deadline=0.05)
+
+    def pop(self, now=100.0, metering=True):
+        with mock.patch('time.monotonic', return_value=now):
+            return self.queues.pop(self.expired.append, metering)
+
+    def test_priority(self):
+        levels, read, write = item(build('/ch/0/levels')), item(build('/ch/0/multiplier')), item(build('/ch/0/multiplier', 1.0))
+        for x in (levels, read, write):
+            self.queues.push(x)
+        self.assertEqual(len(self.queues), 3)
+        self.assertEqual([self.pop(), self.pop(), self.pop(), self.pop()], [write, read, levels, None])
+
+    def test_metering_held_back(self):
+        self.queues.push(item(build('/ch/0/levels')))
+        self.assertIsNone(self.pop(metering=False))
+        self.assertIsNotNone(self.pop())
+
+    def test_metering_deadline(self):
+        late = item(build('/ch/0/levels'), received=100.0)
+        self.queues.push(late)
+        self.assertEqual(late.deadline, 100.05)
+        self.assertIsNone(self.pop(now=100.1))
+        self.assertEqual(self.expired, [late])
+        self.assertEqual(self.queues.report()['metering/dropped'], 1)
+
+    def test_explicit_deadline(self):
+        read = item(build('/ch/0/multiplier'), deadline=100.5)
+        self.queues.push(read)
+        self.assertIsNone(self.pop(now=101.0))
+        self.assertEqual(self.expired, [read])
+
+    def test_least_used_client_first(self):
+        queues = RequestQueues(usage={1: 0.5, 2: 0.1}.get)
+        first, second = item(build('/ch/0/multiplier'), client=1), item(build('/ch/1/multiplier'), client=2)
+        queues.push(first)
+        queues.push(second)
+        self.assertIs(queues.pop(self.expired.append), second)
+
+    def test_push_front(self):
+        a, b, c = (item(build(f'/ch/{ch}/multiplier')) for ch in range(3))
+        self.queues.push(c)
+        self.queues.push_front([a, b])
+        self.assertEqual([self.pop(), self.pop(), self.pop()], [a, b, c])
+
+    def test_take_identical(self):
+        read = build('/ch/0/multiplier')
+        for client in (1, 2):
+            self.queues.push(item(read, client))
+        self.queues.push(item(build('/ch/1/multiplier')))
+        self.assertEqual(len(self.queues.take_identical(read)), 2)
+        self.assertEqual(len(self.queues), 1)
+
+    def test_no_take_identical_behind_write(self):
+        read = build('/ch/0/multiplier')
+        self.queues.push(item(read))
+        self.queues.push(item(build('/ch/0/multiplier', 1.0)))
+        self.assertEqual(self.queues.take_identical(read), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import contextlib
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fosdemosc.matrix import MixMatrix
+from fosdemosc.snapshots import PresetStore, Snapshot, changes, recall
+
+INPUTS = ['Mic 1', 'Mic 2']
+OUTPUTS = ['Room PA', 'Stream', 'Headphones']
+
+
+class FakeMixer:
+    # just enough of an OSCController for recall()
+    def __init__(self, matrix: MixMatrix):
+        self.matrix = matrix
+        self.writes = []
+
+    def get_mix_matrix(self):
+        return self.matrix
+
+    def get_channel_multipliers(self):
+        return dict.fromkeys(self.matrix.inputs, 1.0)
+
+    def get_bus_multipliers(self):
+        return dict.fromkeys(self.matrix.outputs, 1.0)
+
+    @contextlib.contextmanager
+    def transaction(self, **kwargs):
+        yield
+
+    def __getattr__(self, name):
+        if not name.startswith('set_'):
+            raise AttributeError(name)
+        return lambda *args: self.writes.append((name, *args))
+
+
+class ChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.current = MixMatrix([[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]], inputs=INPUTS, outputs=OUTPUTS)
+
+    def test_only_what_differs(self):
+        target = MixMatrix([[1.0, 0.0, 0.0], [0.0, 0.0, 0.5]], [[False, True, False], [False, False, False]],
+                           INPUTS, OUTPUTS)
+        self.assertEqual(changes(Snapshot(target), self.current, None, None),
+                         [('set_gain', 0, 0, 1.0), ('set_gain', 1, 2, 0.5)])
+        self.assertIn(('set_muted', 0, 1, True), changes(Snapshot(target, True), self.current, None, None))
+        self.assertEqual(changes(Snapshot(self.current), self.current, None, None), [])
+
+    def test_remapped_by_name(self):
+        # the same channels and buses, in another order
+        target = MixMatrix([[0.5, 0.0, 0.0], [0.0, 0.0, 1.0]], inputs=['Mic 2', 'Mic 1'],
+                           outputs=['Headphones', 'Stream', 'Room PA'])
+        snapshot = Snapshot(target, channel_multipliers=[2.0, 1.0], bus_multipliers=[1.0, 1.0, 0.5])
+        self.assertEqual(changes(snapshot, self.current, [1.0, 1.0], [1.0, 1.0, 1.0]),
+                         [('set_gain', 0, 0, 1.0), ('set_gain', 1, 2, 0.5),
+                          ('set_channel_multiplier', 1, 2.0), ('set_bus_multiplier', 0, 0.5)])
+
+    def test_other_names_refused(self):
+        target = MixMatrix([[1.0, 0.0, 0.0], [0.0, 0.0, 0.0]], inputs=['Mic 1', 'Laptop'], outputs=OUTPUTS)
+        with self.assertRaisesRegex(ValueError, 'it has no Mic 2, the mixer has no Laptop'):
+            changes(Snapshot(target), self.current, None, None)
+
+    def test_unnamed_by_position(self):
+        target = MixMatrix([[0.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        self.assertEqual(changes(Snapshot(target), self.current, None, None), [('set_gain', 1, 1, 1.0)])
+        with self.assertRaisesRegex(ValueError, '3 channels, the mixer 2'):
+            changes(Snapshot(MixMatrix([[0.0] * 3] * 3)), self.current, None, None)
+
+    def test_recall_fades_in_the_mixers_order(self):
+        mixer = FakeMixer(self.current)
+        ramps = mock.Mock()
+        target = MixMatrix([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]], inputs=['Mic 2', 'Mic 1'], outputs=OUTPUTS)
+        self.assertEqual(recall(mixer, Snapshot(target, channel_multipliers=[1.0, 0.5]), ramps, 2.0), 2)
+        # gains are faded, multipliers set right away
+        self.assertEqual(mixer.writes, [('set_channel_multiplier', 0, 0.5)])
+        ramps.fade.assert_called_once_with([[1.0, 0.0, 0.0], [0.0, 0.0, 0.0]], 2.0, 'linear',
+                                           self.current.gains.tolist())
+
+
+class PresetStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = PresetStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory.name, name), 'w') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+
+    def test_get(self):
+        self.write('room.json', {'inputs': INPUTS, 'outputs': OUTPUTS, 'gains': [[1, 0, 0], [0, 1, 0]]})
+        self.assertIn('room', self.store)
+        self.assertIn('default', self.store.names())
+        snapshot = self.store.get('room')
+        self.assertEqual(snapshot.matrix.inputs, INPUTS)
+        self.assertFalse(snapshot.mutes)
+        self.assertIs(self.store.get('room'), snapshot)
+        with self.assertRaises(KeyError):
+            self.store.get('nothing')
+
+    def test_broken_files_name_the_file(self):
+        self.write('broken.json', '{')
+        self.write('shapeless.json', {'gains': [[1, 0], [0]]})
+        for name in ('broken', 'shapeless'):
+            with self.assertRaisesRegex(ValueError, f'{name}.json: '):
+                self.store.get(name)
+
+    def test_unreadable_file(self):
+        self.write('locked.json', {'gains': [[1]]})
+        with mock.patch('builtins.open', side_effect=PermissionError(13, 'Permission denied')):
+            with self.assertRaisesRegex(ValueError, 'locked.json: .*Permission denied'):
+                self.store.get('locked')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fosdemosc.proxy import Dispatcher, DataItem
+from fosdemosc.protocol import build
+from fosdemosc.subscriptions import Subscriptions, ALL_LEVELS, POLL_TIMEOUT
+
+
+def host(port=1):
+    return SimpleNamespace(addr=('127.0.0.1', port))
+
+
+class SubscriptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.subscriptions = Subscriptions()
+
+    def due(self, now):
+        with mock.patch('time.monotonic', return_value=now):
+            return self.subscriptions.due()
+
+    def subscribe(self, now, client, address='/ch/0/levels', interval=0.1, lease=10):
+        with mock.patch('time.monotonic', return_value=now):
+            self.subscriptions.subscribe(client, address, interval, lease)
+
+    def test_one_poll_for_all_subscribers(self):
+        self.subscribe(100.0, host(1))
+        self.subscribe(100.0, host(2), interval=0.05)
+        [topic] = self.due(100.0)
+        self.assertEqual(topic.interval, 0.05)
+        self.assertEqual(self.due(100.01), [])
+
+        with mock.patch('time.monotonic', return_value=100.02):
+            self.assertEqual(len(self.subscriptions.publish(topic)), 2)
+        self.assertEqual(self.due(100.03), [])
+        self.assertEqual(len(self.due(100.06)), 1)
+
+    def test_slow_subscriber_skipped(self):
+        slow, fast = host(1), host(2)
+        self.subscribe(100.0, slow, interval=1.0)
+        self.subscribe(100.0, fast, interval=0.05)
+        [topic] = self.due(100.0)
+        with mock.patch('time.monotonic', return_value=100.0):
+            self.subscriptions.publish(topic)
+        [topic] = self.due(100.1)
+        with mock.patch('time.monotonic', return_value=100.1):
+            self.assertEqual(self.subscriptions.publish(topic), [fast])
+
+    def test_lost_poll_retried(self):
+        self.subscribe(100.0, host())
+        self.assertEqual(len(self.due(100.0)), 1)
+        self.assertEqual(self.due(100.5), [])
+        self.assertEqual(len(self.due(100.0 + POLL_TIMEOUT + 0.1)), 1)
+
+    def test_lease_expires(self):
+        self.subscribe(100.0, host(), lease=1)
+        self.assertEqual(self.due(102.0), [])
+        self.assertEqual(self.subscriptions.topics, {})
+
+    def test_unsubscribe(self):
+        self.subscribe(100.0, host())
+        self.subscriptions.unsubscribe(host(), '/ch/0/levels')
+        self.assertEqual(self.subscriptions.topics, {})
+
+    def test_all_levels_waits_for_topology(self):
+        self.subscribe(100.0, host(), ALL_LEVELS)
+        self.assertTrue(self.subscriptions.needs_topology())
+        self.assertEqual(self.due(100.0), [])
+        self.subscriptions.set_topology(2, 3)
+        [topic] = self.due(100.0)
+        self.assertEqual(len(list(topic.request)), 5)
+
+
+class SubscribeRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.replies = []
+        self.dispatcher = Dispatcher(self.replies.append)
+
+    def request(self, *args):
+        self.dispatcher.submit(DataItem(host=host(), data=build('/subscribe', *args)))
+        self.assertEqual(self.dispatcher.next_batch(), [])
+        return self.replies[-1].data
+
+    def test_subscribe(self):
+        reply = self.request('/ch/0/levels', 100, 5)
+        self.assertEqual(reply.params, ['/ch/0/levels', 100, 5])
+        self.assertIn('/ch/0/levels', self.dispatcher.subscriptions.topics)
+
+    def test_interval_clamped(self):
+        self.assertEqual(self.request('/ch/0/levels', 1).params, ['/ch/0/levels', 10, 10])
+
+    def test_malformed(self):
+        for args in ((), (5,), ('/ch/0/levels', 0), ('/ch/0/levels', -5), ('/ch/0/levels', float('nan')),
+                     ('/ch/0/levels', 100, 'x'), ('/ch/0/levels', 100, float('inf'))):
+            with self.subTest(args=args):
+                self.assertEqual(self.request(*args).params, [])
+        self.assertEqual(self.dispatcher.subscriptions.topics, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
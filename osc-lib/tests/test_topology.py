@@ -0,0 +1,60 @@
+import json
+import os
+import socket
+import tempfile
+import unittest
+
+from fosdemosc import OSCController, ConnectionFailed
+from fosdemosc.topology import cache_path, load_info, save_info
+
+INFO = {'/info/channels': 1, '/info/buses': 1, '/ch/0/config/name': 'IN 0', '/bus/0/config/name': 'OUT 0'}
+
+
+def closed_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TopologyCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_roundtrip(self):
+        save_info('127.0.0.1:10024', INFO, self.directory.name)
+        self.assertEqual(load_info('127.0.0.1:10024', self.directory.name), INFO)
+        self.assertEqual(os.listdir(self.directory.name), ['127.0.0.1_10024.json'])
+        self.assertEqual(os.stat(cache_path('127.0.0.1:10024', self.directory.name)).st_mode & 0o777, 0o644)
+
+    def test_missing_or_broken(self):
+        self.assertIsNone(load_info('/dev/ttyUSB0', self.directory.name))
+        for content in ('{"/info/chan', '[1, 2]', '{"/info/channels": 2}'):
+            with open(cache_path('/dev/ttyUSB0', self.directory.name), 'w') as f:
+                f.write(content)
+            self.assertIsNone(load_info('/dev/ttyUSB0', self.directory.name))
+
+    def test_nowhere_to_save(self):
+        path = os.path.join(self.directory.name, 'file')
+        open(path, 'w').close()
+        save_info('127.0.0.1:10024', INFO, path)
+
+    def test_incomplete_cache_is_a_miss(self):
+        # the keys load_info() checks are there, the names aren't
+        port = closed_port()
+        with open(cache_path(f'127.0.0.1:{port}', self.directory.name), 'w') as f:
+            json.dump({'/info/channels': 2, '/info/buses': 'x'}, f)
+        with self.assertRaises(ConnectionFailed):
+            OSCController('127.0.0.1', port, mode='udp', cache_dir=self.directory.name)
+
+    def test_cache_used_without_connecting(self):
+        port = closed_port()
+        save_info(f'127.0.0.1:{port}', INFO, self.directory.name)
+        osc = OSCController('127.0.0.1', port, mode='udp', cache_dir=self.directory.name)
+        self.assertEqual((osc.inputs, osc.outputs), (['IN 0'], ['OUT 0']))
+        self.assertEqual(osc.bus_index.resolve('out'), 0)
+        self.assertIsNone(osc.client)
+
+
+if __name__ == '__main__':
+    unittest.main()